@@ -0,0 +1,429 @@
+# app.py — ASALBOY app factory: config, lazily created resources, create_app() / create_dispatcher()
+#
+# Nothing here imports aiogram. create_app() gives a servable aiohttp app in a few
+# milliseconds; the bot side (aiogram, pydantic models, handlers.py) is loaded by
+# create_dispatcher(), normally in a thread while the WebApp is already answering.
+import os
+import sys
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from aiohttp import web
+
+from catalog import ProductCatalog
+from webcache import CachedBody
+from static_assets import StaticAssets
+from image_variants import ImageVariants
+from images import ImageCache
+from orders_db import OrderRepository
+from order_export import export_handler, token_ok
+from metrics import REGISTRY, timed_route
+from profiler import LoopProfiler
+from workers import worker_count
+
+
+class StartupTimer:
+    """Wall time of each cold-start phase, plus milestones counted from the import of this module."""
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.phases: List[Tuple[str, float]] = []
+        self.marks: List[Tuple[str, float]] = []
+
+    @contextmanager
+    def phase(self, name: str):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - t))
+
+    def mark(self, name: str) -> float:
+        at = time.perf_counter() - self.t0
+        self.marks.append((name, at))
+        return at
+
+    def report(self) -> str:
+        phases = ", ".join(f"{name} {dt * 1000:.0f}ms" for name, dt in self.phases)
+        marks = ", ".join(f"{name} @{at:.2f}s" for name, at in self.marks)
+        return f"Startup: {phases} | {marks}"
+
+
+startup = StartupTimer()
+
+
+class Lazy:
+    """
+    Module-level singleton built on first attribute access, so a cold start only pays
+    for what the first requests touch. Thread-safe (the bot side loads in a thread).
+    """
+
+    __slots__ = ("_name", "_factory", "_obj", "_lock")
+
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        self._name = name
+        self._factory = factory
+        self._obj = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self._obj is not None
+
+    def resolve(self) -> Any:
+        """The object, built now if needed (`get` would shadow the wrapped object's own get())."""
+        if self._obj is None:
+            with self._lock:
+                if self._obj is None:
+                    with startup.phase(self._name):
+                        self._obj = self._factory()
+        return self._obj
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self.resolve(), attr)
+
+    def __len__(self) -> int:
+        return len(self.resolve())
+
+
+# ============ ENV ============
+with startup.phase("config"):
+    load_dotenv(dotenv_path=Path(__file__).with_name(".env"))
+logging.basicConfig(level=logging.INFO)
+
+BOT_TOKEN      = os.getenv("BOT_TOKEN")
+ADMIN_CHAT_ID  = int(os.getenv("ADMIN_CHAT_ID") or 0)
+ADMIN_USER_ID  = int(os.getenv("ADMIN_USER_ID") or 0)
+LANG_DEFAULT   = os.getenv("LANG_DEFAULT", "uz")
+
+APP_HOST       = os.getenv("APP_HOST", "0.0.0.0")
+APP_PORT       = int(os.getenv("PORT", os.getenv("APP_PORT", "8080")))
+APP_PUBLIC_URL = os.getenv("APP_PUBLIC_URL", os.getenv("WEBAPP_URL", "https://example.com/app"))
+WEBHOOK_PATH   = os.getenv("WEBHOOK_PATH", "/webhook")
+
+FSM_DB_PATH    = os.getenv("FSM_DB_PATH", "data/fsm.db")
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", "10000"))
+FSM_TTL_DAYS   = float(os.getenv("FSM_TTL_DAYS", "30"))
+
+# Multi-process mode: WORKERS>1 runs a supervisor that starts N copies of main.py on one
+# port (SO_REUSEPORT). State they share lives on disk: FSM/orders in SQLite, products.json,
+# images; one elected worker registers the webhook and runs the background jobs.
+WORKERS        = worker_count(int(os.getenv("WORKERS", "1")))
+WORKER_ID      = int(os.getenv("WORKER_ID", "0"))
+SHARED_STATE   = WORKERS > 1
+SHARED_SYNC_SEC = float(os.getenv("SHARED_SYNC_SEC", "1"))
+LEADER_LOCK_PATH = os.getenv("LEADER_LOCK_PATH", "data/leader.lock")
+CHAT_LOCK_PATH = os.getenv("CHAT_LOCK_PATH", "data/chat.lock")  # one chat's updates on one worker at a time
+LEADER_RETRY_SEC = float(os.getenv("LEADER_RETRY_SEC", "5"))
+
+# Local Bot API server (or a test double); empty = api.telegram.org
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
+
+# Bearer token for GET /api/orders/export; unset = the HTTP export is disabled
+EXPORT_TOKEN = os.getenv("EXPORT_TOKEN", "")
+
+# GET /metrics (Prometheus text format); set METRICS_TOKEN to require Bearer auth
+METRICS_PATH = os.getenv("METRICS_PATH", "/metrics")
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+if WORKERS > 1:
+    REGISTRY.const_labels["worker"] = str(WORKER_ID)
+
+# On-demand profiler: GET /api/profile?seconds=N (Bearer PROFILE_TOKEN; unset = disabled)
+# and the admin /profile command. Only the worker that receives the request is profiled.
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "50"))
+# handlers.py attaches its Dispatcher (per-handler timings) when the bot side loads
+profiler = LoopProfiler(interval=PROFILE_INTERVAL_MS / 1000, slow_callback=PROFILE_SLOW_MS / 1000)
+
+
+# ============ DB ============
+DB_PATH = os.getenv("ORDERS_DB_PATH", "data/orders.db")
+# Group commit: orders arriving within ORDER_BATCH_MS (or ORDER_BATCH_ROWS of them) share one transaction
+ORDER_BATCH_MS = float(os.getenv("ORDER_BATCH_MS", "5"))
+ORDER_BATCH_ROWS = int(os.getenv("ORDER_BATCH_ROWS", "200"))
+
+
+def init_db() -> OrderRepository:
+    repo = OrderRepository(DB_PATH, batch_latency=ORDER_BATCH_MS / 1000, batch_rows=ORDER_BATCH_ROWS)
+    repo.init_sync()
+    return repo
+
+
+orders_repo = Lazy("orders db", init_db)
+
+
+# ============ PRODUCTS ============
+PRODUCTS_FILE = "products.json"
+CATALOG_RELOAD_SEC = float(os.getenv("CATALOG_RELOAD_SEC", "5"))
+
+
+def _load_catalog() -> ProductCatalog:
+    c = ProductCatalog(PRODUCTS_FILE)
+    c.on_change(rebuild_products_body)
+    return c
+
+
+catalog = Lazy("catalog", _load_catalog)
+
+
+# ====== WEBAPP (AIOHTTP) ======
+# Fingerprinted style/script, rewritten index.html, precompressed; image versions for ?v=
+STATIC_BUILD_DIR = os.getenv("STATIC_BUILD_DIR", "data/static")
+
+
+def _build_static() -> StaticAssets:
+    assets = StaticAssets("webapp", STATIC_BUILD_DIR)
+    assets.build()
+    return assets
+
+
+static_assets = Lazy("static build", _build_static)
+# Square WebP/JPEG thumbnails per product, made off the event loop (needs Pillow)
+IMAGE_VARIANTS_DIR = os.getenv("IMAGE_VARIANTS_DIR", "data/img_variants")
+image_variants = Lazy("image variants", lambda: ImageVariants(static_assets.img_dir, IMAGE_VARIANTS_DIR))
+
+PRODUCTS_CACHE_CONTROL = "public, max-age=60, must-revalidate"
+_products_body: Optional[CachedBody] = None
+
+
+def build_products_body(snap) -> CachedBody:
+    # Serialized once per catalog version; /addproduct and hot reload trigger a rebuild
+    items = []
+    for p in snap.items:
+        pid = str(p.get("id"))
+        img = static_assets.image_url(pid)
+        if not img:
+            items.append(p)
+            continue
+        extra = {"img": img}
+        srcset = image_variants.srcset(pid, static_assets.img_versions[f"{pid}.jpg"])
+        if srcset:
+            extra["srcset"] = srcset
+        items.append({**p, **extra})
+    raw = json.dumps({"items": items}, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    digest = hashlib.sha256(raw).hexdigest()[:16]
+    # Content-only ETag: snap.version counts reloads per process, workers must agree
+    return CachedBody(raw, "application/json", PRODUCTS_CACHE_CONTROL, etag=f'"{digest}"')
+
+
+def rebuild_products_body(snap=None) -> None:
+    """Catalog listener; also called after product images or their thumbnails change."""
+    global _products_body
+    _products_body = build_products_body(snap if snap is not None else catalog.snapshot)
+
+
+async def api_products(request: web.Request):
+    if _products_body is None:
+        rebuild_products_body()
+    return _products_body.response(request)
+
+
+async def app_index(request: web.Request):
+    return await static_assets.handle_index(request)
+
+
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "data/img_cache")
+IMAGE_CACHE_MB = int(os.getenv("IMAGE_CACHE_MB", "32"))
+IMAGE_CACHE_DISK_MB = int(os.getenv("IMAGE_CACHE_DISK_MB", "1024"))
+# Downloads go through the bot, so this one exists only once the bot side is loaded
+image_cache = Lazy(
+    "image cache",
+    lambda: ImageCache(bot_side().bot, root=IMAGE_CACHE_DIR, mem_bytes=IMAGE_CACHE_MB * 1024 * 1024,
+                       disk_bytes=IMAGE_CACHE_DISK_MB * 1024 * 1024),
+)
+
+
+async def get_telegram_image(request: web.Request):
+    file_id = request.match_info.get("file_id")
+    if not file_id:
+        return web.Response(status=404)
+    await load_bot_side()
+    # memory LRU -> disk -> one shared upstream fetch per file_id
+    img = await image_cache.get(file_id)
+    if img is None:
+        return web.Response(status=404)
+    return image_cache.response(request, img)
+
+
+async def image_variant(request: web.Request):
+    return await image_variants.handle(request)
+
+
+async def backfill_image_variants():
+    # Existing webapp/img/*.jpg: generate missing/stale variants, then expose srcset
+    n = await image_variants.ensure_all(dict(static_assets.img_versions))
+    if n:
+        rebuild_products_body()
+
+
+async def sync_shared_state():
+    # Multi-worker: pick up products.json / image / thumbnail changes made by other workers
+    while True:
+        await asyncio.sleep(SHARED_SYNC_SEC)
+        try:
+            catalog.reload()  # swaps in and rebuilds /api/products itself when changed
+            changed = static_assets.refresh_images()
+            if image_variants.sync(static_assets.img_versions) or changed:
+                rebuild_products_body()
+        except Exception:
+            logging.exception("Shared state sync failed")
+
+
+# ====== BOT SIDE (aiogram, loaded on demand) ======
+_bot_loading: Optional[asyncio.Future] = None
+
+
+def bot_side():
+    """handlers.py — importing it imports aiogram and builds Bot, storage and Dispatcher."""
+    if "handlers" not in sys.modules:
+        with startup.phase("aiogram + handlers"):
+            import handlers  # noqa: F401
+    return sys.modules["handlers"]
+
+
+def create_dispatcher():
+    """The aiogram Dispatcher with every handler registered (built once)."""
+    return bot_side().dp
+
+
+async def _load_bot_side(on_ready):
+    await asyncio.to_thread(create_dispatcher)
+    handlers = bot_side()
+    if on_ready is not None:
+        await on_ready(handlers)
+    await handlers.start_update_intake()
+    return handlers
+
+
+def load_bot_side(on_ready: Optional[Callable[[Any], Awaitable[None]]] = None) -> asyncio.Future:
+    """
+    Build the bot side in a thread, once; the event loop keeps serving meanwhile.
+    `on_ready(handlers)` (first call only) runs before any update is let through.
+    """
+    global _bot_loading
+    if _bot_loading is None:
+        _bot_loading = asyncio.ensure_future(_load_bot_side(on_ready))
+    return _bot_loading
+
+
+async def webhook_route(request: web.Request):
+    # Updates arriving during a cold start wait here until the handlers are loaded
+    await asyncio.shield(load_bot_side())
+    return await bot_side().handle_webhook(request)
+
+
+async def _stop_bot_side(app: web.Application):
+    if "handlers" in sys.modules:
+        await sys.modules["handlers"].stop_update_intake()
+
+
+async def _close_resources(app: web.Application):
+    if image_cache.ready:
+        await image_cache.close()
+    if image_variants.ready:
+        image_variants.close()
+    handlers = sys.modules.get("handlers")
+    if handlers is not None:
+        await handlers.admin_outbox.stop()
+    if orders_repo.ready:
+        await orders_repo.ingest.drain()
+        orders_repo.close()
+    if handlers is not None:
+        await handlers.fsm_storage.close()
+
+
+async def profile_route(request: web.Request):
+    # GET /api/profile?seconds=10[&format=json] -> collapsed stacks (or the handler/slow-callback summary)
+    if not token_ok(request, PROFILE_TOKEN):
+        return web.Response(status=401, text="unauthorized")
+    try:
+        seconds = float(request.query.get("seconds", "10"))
+    except ValueError:
+        return web.Response(status=400, text="bad seconds")
+    try:
+        report = await profiler.run(seconds)
+    except RuntimeError:
+        return web.Response(status=409, text="profile already running")
+    if request.query.get("format") == "json":
+        return web.json_response(report.as_dict())
+    name = f"profile-{WORKER_ID}-{time.strftime('%Y%m%d-%H%M%S')}.folded"
+    return web.Response(
+        text=report.collapsed(),
+        content_type="text/plain",
+        headers={"Content-Disposition": f'attachment; filename="{name}"'},
+    )
+
+
+# ====== METRICS (read at scrape time; nothing is created just to be measured) ======
+def _image_cache_lookups():
+    if not image_cache.ready:
+        return None
+    st = image_cache.stats
+    return [((k,), st[k]) for k in ("mem_hit", "disk_hit", "coalesced", "miss")]
+
+
+def _image_cache_hit_ratio():
+    if not image_cache.ready:
+        return None
+    st = image_cache.stats
+    hits = st["mem_hit"] + st["disk_hit"]
+    total = hits + st["coalesced"] + st["miss"]
+    return hits / total if total else None
+
+
+def _order_batches():
+    if not orders_repo.ready:
+        return None
+    st = orders_repo.ingest.stats
+    return [((k,), st[k]) for k in ("batches", "rows", "failed")]
+
+
+REGISTRY.counter_func("asalboy_image_cache_lookups", "GET /images lookups by result", _image_cache_lookups, ("result",))
+REGISTRY.counter_func("asalboy_image_fetch_errors", "Upstream getFile/download failures",
+                      lambda: image_cache.stats["error"] if image_cache.ready else None)
+REGISTRY.gauge("asalboy_image_cache_hit_ratio", "Memory + disk hits / lookups", _image_cache_hit_ratio)
+REGISTRY.counter_func("asalboy_image_cache_disk_evicted", "Blobs removed by the disk cap sweep",
+                      lambda: image_cache.stats["disk_evicted"] if image_cache.ready else None)
+REGISTRY.counter_func("asalboy_order_commits", "Order group commits: batches, rows, failed rows", _order_batches, ("kind",))
+REGISTRY.gauge("asalboy_order_queue_depth", "Orders waiting for a commit",
+               lambda: orders_repo.ingest.depth if orders_repo.ready else None)
+
+
+def create_app() -> web.Application:
+    """
+    The WebApp + webhook aiohttp app. Only the static build runs here; the catalog, the
+    orders DB, thumbnails and the image cache are created when first used, and the
+    webhook route loads the bot side on its first update (or earlier via load_bot_side()).
+    """
+    with startup.phase("create_app"):
+        static_assets.resolve()
+        webapp = web.Application()
+        webapp.router.add_get("/api/products", timed_route("/api/products", api_products))
+        webapp.router.add_get("/api/orders/export", export_handler(orders_repo, EXPORT_TOKEN))
+        webapp.router.add_get("/app", app_index)
+        # Unhashed names stay for WebViews that still hold an old index.html
+        webapp.router.add_get("/style.css", static_assets.legacy_handler("style.css"))
+        webapp.router.add_get("/script.js", static_assets.legacy_handler("script.js"))
+        webapp.router.add_get("/static/{name}", static_assets.handle_static)
+        webapp.router.add_get(r"/webapp/img/{pid:[A-Za-z0-9_]+}-{w:\d+}.{fmt:webp|jpg}", image_variant)
+        webapp.router.add_get("/webapp/img/{name}", static_assets.handle_img)
+        # Dynamic image proxy route
+        webapp.router.add_get("/images/{file_id}", timed_route("/images", get_telegram_image))
+        webapp.router.add_get("/api/profile", profile_route)
+        webapp.router.add_get(
+            METRICS_PATH, REGISTRY.handler((lambda r: token_ok(r, METRICS_TOKEN)) if METRICS_TOKEN else None)
+        )
+        webapp.router.add_static("/webapp/", path="webapp", name="static")
+        webapp.router.add_post(WEBHOOK_PATH, webhook_route)
+        webapp.on_shutdown.append(_stop_bot_side)
+        webapp.on_cleanup.append(_close_resources)
+    return webapp
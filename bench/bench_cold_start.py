@@ -0,0 +1,118 @@
+# bench/bench_cold_start.py — process start -> first 200 (WebApp) and -> first handled webhook update
+#
+#   python bench/bench_cold_start.py [--runs 5] [--budget 1.5]
+#
+# Each run starts `python main.py` from scratch on a free port with every data path in a
+# fresh temp dir (so the static build, DBs and caches are cold too) and TELEGRAM_API_URL
+# pointed at bench/fake_bot_api.py. It polls GET /api/products until the first 200 and POSTs a
+# /start update to /webhook (WEBHOOK_MODE=inline) until one is handled, then SIGTERMs it.
+# Medians over the runs are printed with the bot's own "Startup:" phase line; exits 1 when
+# the median time to the first 200 is above --budget seconds.
+import os
+import sys
+import json
+import time
+import signal
+import asyncio
+import argparse
+import statistics
+import tempfile
+import subprocess
+import multiprocessing as mp
+
+from aiohttp import ClientSession
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_workers import ROOT, TOKEN, free_port  # noqa: E402
+from fake_bot_api import run as run_fake_api  # noqa: E402
+
+START = json.dumps({"update_id": 1, "message": {
+    "message_id": 1, "date": 0, "chat": {"id": 42, "type": "private"},
+    "from": {"id": 42, "is_bot": False, "first_name": "Bench"}, "text": "/start",
+    "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+}}).encode("utf-8")
+
+
+async def probe(base: str, t0: float, timeout: float = 60.0) -> dict:
+    got = {}
+    deadline = t0 + timeout
+    async with ClientSession() as session:
+        while "webhook" not in got and time.perf_counter() < deadline:
+            try:
+                if "products" not in got:
+                    async with session.get(base + "/api/products") as r:
+                        if r.status == 200:
+                            await r.read()
+                            got["products"] = time.perf_counter() - t0
+                else:
+                    # Held open until the bot side has loaded and the handler finished
+                    async with session.post(base + "/webhook", data=START,
+                                            headers={"Content-Type": "application/json"}) as r:
+                        if r.status == 200:
+                            got["webhook"] = time.perf_counter() - t0
+                continue
+            except OSError:
+                pass
+            await asyncio.sleep(0.005)
+    if "webhook" not in got:
+        raise RuntimeError("bot did not start")
+    return got
+
+
+def run_once(api_port: int, tmp: str) -> dict:
+    port = free_port()
+    env = dict(
+        os.environ, BOT_TOKEN=TOKEN, WORKERS="1", PORT=str(port), APP_HOST="127.0.0.1",
+        TELEGRAM_API_URL=f"http://127.0.0.1:{api_port}", WEBHOOK_MODE="inline",
+        ADMIN_CHAT_ID="0", ADMIN_USER_ID="0", LEADER_LOCK_PATH=os.path.join(tmp, "leader.lock"),
+        ORDERS_DB_PATH=os.path.join(tmp, "orders.db"), FSM_DB_PATH=os.path.join(tmp, "fsm.db"),
+        WEBHOOK_DEDUP_PATH=os.path.join(tmp, "seen.db"), STATIC_BUILD_DIR=os.path.join(tmp, "static"),
+        IMAGE_CACHE_DIR=os.path.join(tmp, "img_cache"), EXPORT_DIR=os.path.join(tmp, "exports"),
+        IMAGE_VARIANTS_DIR=os.path.join(tmp, "img_variants"),
+    )
+    env.pop("WORKER_ID", None)
+    log_path = os.path.join(tmp, "bot.log")
+    with open(log_path, "wb") as log:
+        t0 = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, "main.py"], cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            got = asyncio.run(probe(f"http://127.0.0.1:{port}", t0))
+            time.sleep(0.5)  # let the startup report reach the log
+        finally:
+            proc.send_signal(signal.SIGTERM)
+            try:
+                proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+    with open(log_path, encoding="utf-8", errors="replace") as f:
+        got["report"] = next((line.split("Startup: ", 1)[1].strip() for line in f if "Startup: " in line), "")
+    return got
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--budget", type=float, default=1.5, help="max median seconds to the first 200")
+    args = ap.parse_args()
+
+    api_port = free_port()
+    api = mp.Process(target=run_fake_api, args=(api_port,), daemon=True)
+    api.start()
+    rows = []
+    for i in range(args.runs):
+        with tempfile.TemporaryDirectory() as tmp:
+            r = run_once(api_port, tmp)
+        rows.append(r)
+        print(f"  run {i + 1}: first 200 {r['products']:.2f}s, webhook handled {r['webhook']:.2f}s")
+    api.terminate()
+    first = statistics.median(r["products"] for r in rows)
+    ready = statistics.median(r["webhook"] for r in rows)
+    print(f"bot: {rows[-1]['report']}")
+    print(f"median: first 200 {first:.2f}s, first webhook update {ready:.2f}s (budget {args.budget:.2f}s)")
+    if first > args.budget:
+        print("FAIL: cold start over budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
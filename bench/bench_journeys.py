@@ -0,0 +1,299 @@
+# bench/bench_journeys.py — end-to-end user journeys through the webhook against a fake Bot API
+#
+#   python bench/bench_journeys.py [--rate 40] [--seconds 20] [--latency-ms 30] [--rate-429 0.01]
+#                                  [--save-baseline] [--tolerance 0.25]
+#
+# Starts bench/fake_bot_api.py and the real bot (`python main.py`, WEBHOOK_MODE=inline, every
+# data path in a temp dir), then launches synthetic users open-loop so that about --rate
+# updates/s reach POST /webhook (handle_webhook). Each user is a fresh chat that walks one
+# journey with --think-ms between steps:
+#   classic: /start -> lang:uz -> "Katalog" -> sel: -> qinc: x2 -> addsel: -> contact -> location
+#   webapp:  /start -> lang:uz -> GET /api/products -> GET /images/<file_id> -> web_app_data checkout
+# In inline mode the webhook answers after the handler (Bot API calls, FSM write, order commit)
+# finished, so the request time is the update's end-to-end latency. p50/p99 overall and per
+# step, updates/s (steady state: once the first users could have finished, until arrivals
+# stop) and the fake API's call counts are printed.
+#
+# Baselines: bench/baselines/journeys.json holds p50/p99/updates/s per scenario (rate, latency,
+# 429 rate, think time, mix). --save-baseline records this run; otherwise the run fails (exit 1)
+# when p50 or p99 is more than --tolerance above the baseline or updates/s that much below.
+# Baselines are machine specific: re-record them on the box that runs the check.
+import os
+import sys
+import json
+import time
+import random
+import signal
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import multiprocessing as mp
+from typing import Dict, List
+
+from aiohttp import ClientSession, TCPConnector
+
+from bench_workers import ROOT, TOKEN, free_port, wait_ready
+from fake_bot_api import run as run_fake_api
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "journeys.json")
+ADMIN_CHAT = 999  # order notifications (sendMessage + sendLocation) go here via the admin outbox
+WEBAPP_UPDATES = 3  # webhook updates in a webapp journey (the two GETs are timed, not counted)
+CLASSIC_UPDATES = 8
+
+
+def percentile(xs: List[float], q: float) -> float:
+    if not xs:
+        return 0.0
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(round(q / 100 * (len(xs) - 1))))]
+
+
+def visible_products() -> List[dict]:
+    with open(os.path.join(ROOT, "products.json"), encoding="utf-8") as f:
+        data = json.load(f)
+    items = data if isinstance(data, list) else data.get("items", data.get("products", []))
+    return [p for p in items if p.get("available", True) and p.get("id")]
+
+
+class Journeys:
+    def __init__(self, base: str, session: ClientSession, products: List[dict], think: float):
+        self.base = base
+        self.session = session
+        self.products = products
+        self.think = think
+        self.update_id = 0
+        self.lat: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.updates = 0
+        self.done: List[float] = []  # completion times of webhook updates
+
+    def _record(self, step: str, dt: float, ok: bool) -> None:
+        self.lat.setdefault(step, []).append(dt)
+        if not ok:
+            self.errors[step] = self.errors.get(step, 0) + 1
+
+    async def _post(self, step: str, update: dict) -> None:
+        self.update_id += 1
+        update["update_id"] = self.update_id
+        body = json.dumps(update).encode("utf-8")
+        t = time.perf_counter()
+        ok = False
+        try:
+            async with self.session.post(self.base + "/webhook", data=body,
+                                         headers={"Content-Type": "application/json"}) as r:
+                await r.read()
+                ok = r.status == 200
+        except Exception:
+            pass
+        self._record(step, time.perf_counter() - t, ok)
+        self.updates += 1
+        self.done.append(time.perf_counter())
+        await asyncio.sleep(self.think)
+
+    async def _get(self, step: str, path: str) -> None:
+        t = time.perf_counter()
+        ok = False
+        try:
+            async with self.session.get(self.base + path) as r:
+                await r.read()
+                ok = r.status in (200, 304)
+        except Exception:
+            pass
+        self._record(step, time.perf_counter() - t, ok)
+        await asyncio.sleep(self.think)
+
+    @staticmethod
+    def _user(chat: int) -> dict:
+        return {"id": chat, "is_bot": False, "first_name": "Bench", "username": f"u{chat}"}
+
+    def _message(self, chat: int, **extra) -> dict:
+        return {"message": {"message_id": 1, "date": int(time.time()),
+                            "chat": {"id": chat, "type": "private"}, "from": self._user(chat), **extra}}
+
+    def _callback(self, chat: int, data: str, message_id: int = 100) -> dict:
+        msg = {"message_id": message_id, "date": int(time.time()), "chat": {"id": chat, "type": "private"},
+               "text": "card"}
+        return {"callback_query": {"id": f"{chat}-{self.update_id}", "from": self._user(chat),
+                                   "chat_instance": str(chat), "data": data, "message": msg}}
+
+    async def _start(self, chat: int) -> None:
+        await self._post("start", self._message(
+            chat, text="/start", entities=[{"type": "bot_command", "offset": 0, "length": 6}]))
+        await self._post("lang", self._callback(chat, "lang:uz"))
+
+    async def classic(self, chat: int) -> None:
+        pid = random.choice(self.products)["id"]
+        await self._start(chat)
+        await self._post("catalog", self._message(chat, text="Katalog"))
+        await self._post("sel", self._callback(chat, f"sel:{pid}"))
+        await self._post("qinc", self._callback(chat, f"qinc:{pid}:1"))
+        await self._post("qinc", self._callback(chat, f"qinc:{pid}:1"))
+        await self._post("addsel", self._callback(chat, f"addsel:{pid}:1"))
+        await self._post("contact", self._message(
+            chat, contact={"phone_number": "+998901234567", "first_name": "Bench", "user_id": chat}))
+        await self._post("location", self._message(chat, location={"latitude": 41.3111, "longitude": 69.2797}))
+
+    async def webapp(self, chat: int) -> None:
+        picks = random.sample(self.products, k=min(2, len(self.products)))
+        await self._start(chat)
+        await self._get("GET /api/products", "/api/products")
+        fid = picks[0].get("photo_file_id")
+        if fid:
+            await self._get("GET /images", f"/images/{fid}")
+        payload = {
+            "items": [{"id": p["id"], "qty": 1 + i} for i, p in enumerate(picks)],
+            "name": "Bench", "phone": "+998901234567", "address": "Toshkent, bench ko‘chasi 1",
+            "lat": 41.3111, "lon": 69.2797,
+        }
+        await self._post("web_app_data", self._message(
+            chat, web_app_data={"data": json.dumps(payload), "button_text": "Buyurtma"}))
+
+
+async def drive(base: str, args) -> dict:
+    products = visible_products()
+    per_journey = args.mix * CLASSIC_UPDATES + (1 - args.mix) * WEBAPP_UPDATES
+    journeys_per_s = args.rate / per_journey
+    async with ClientSession(connector=TCPConnector(limit=0)) as session:
+        # the first update waits for the bot side; not part of the measurement
+        warm = Journeys(base, session, products, 0.0)
+        await warm._start(1)
+        j = Journeys(base, session, products, args.think_ms / 1000)
+        j.update_id = 1_000
+        tasks = []
+        t0 = time.perf_counter()
+        n = 0
+        # open loop: users arrive on schedule whether or not earlier ones have finished
+        while time.perf_counter() - t0 < args.seconds:
+            n += 1
+            chat = 10_000_000 + n
+            flow = j.classic if random.random() < args.mix else j.webapp
+            tasks.append(asyncio.create_task(flow(chat)))
+            await asyncio.sleep(max(0.0, t0 + n / journeys_per_s - time.perf_counter()))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - t0
+    updates = [dt for step, xs in j.lat.items() if not step.startswith("GET") for dt in xs]
+    # Throughput in the steady state: after the first users could have finished a whole
+    # journey and before arrivals stop (falls back to the whole run when that is too short)
+    ramp = CLASSIC_UPDATES * args.think_ms / 1000
+    lo, hi = (t0 + ramp, t0 + args.seconds) if args.seconds > ramp + 1 else (t0, t0 + elapsed)
+    steady = sum(1 for t in j.done if lo <= t < hi) / (hi - lo)
+    return {
+        "journeys": n, "updates": j.updates, "elapsed": elapsed, "errors": j.errors, "steps": j.lat,
+        "p50_ms": percentile(updates, 50) * 1000, "p99_ms": percentile(updates, 99) * 1000,
+        "updates_per_s": steady,
+    }
+
+
+def scenario_key(args) -> str:
+    return (f"rate={args.rate:g} latency={args.latency_ms:g}±{args.jitter_ms:g}ms "
+            f"429={args.rate_429:g} think={args.think_ms:g}ms mix={args.mix:g}")
+
+
+def check_baseline(result: dict, args) -> bool:
+    baselines = {}
+    if os.path.exists(BASELINES):
+        with open(BASELINES, encoding="utf-8") as f:
+            baselines = json.load(f)
+    key = scenario_key(args)
+    current = {k: round(result[k], 2) for k in ("p50_ms", "p99_ms", "updates_per_s")}
+    if args.save_baseline:
+        baselines[key] = {**current, "cpus": os.cpu_count()}
+        os.makedirs(os.path.dirname(BASELINES), exist_ok=True)
+        with open(BASELINES, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True, ensure_ascii=False)
+            f.write("\n")
+        print(f"baseline saved: {key}")
+        return True
+    base = baselines.get(key)
+    if base is None:
+        print(f"no baseline for '{key}' (record one with --save-baseline)")
+        return True
+    tol = args.tolerance
+    failed = []
+    for k in ("p50_ms", "p99_ms"):
+        if current[k] > base[k] * (1 + tol):
+            failed.append(f"{k} {current[k]:.1f} > {base[k]:.1f} +{tol:.0%}")
+    if current["updates_per_s"] < base["updates_per_s"] * (1 - tol):
+        failed.append(f"updates/s {current['updates_per_s']:.1f} < {base['updates_per_s']:.1f} -{tol:.0%}")
+    for line in failed:
+        print(f"FAIL: {line}")
+    if not failed:
+        print(f"baseline ok: p50 {base['p50_ms']:.1f} ms, p99 {base['p99_ms']:.1f} ms, {base['updates_per_s']:.1f} updates/s")
+    return not failed
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rate", type=float, default=40.0, help="target webhook updates per second")
+    ap.add_argument("--seconds", type=float, default=20.0, help="how long new users keep arriving")
+    ap.add_argument("--think-ms", type=float, default=1000.0, help="pause between a user's steps")
+    ap.add_argument("--mix", type=float, default=0.7, help="share of classic (vs webapp) journeys")
+    ap.add_argument("--latency-ms", type=float, default=30.0)
+    ap.add_argument("--jitter-ms", type=float, default=10.0)
+    ap.add_argument("--rate-429", type=float, default=0.0)
+    ap.add_argument("--retry-after", type=int, default=1)
+    ap.add_argument("--tolerance", type=float, default=0.25)
+    ap.add_argument("--save-baseline", action="store_true")
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+    random.seed(args.seed)
+
+    api_port, port = free_port(), free_port()
+    api = mp.Process(target=run_fake_api, daemon=True,
+                     args=(api_port, args.latency_ms, args.jitter_ms, args.rate_429, args.retry_after))
+    api.start()
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ, BOT_TOKEN=TOKEN, WORKERS="1", PORT=str(port), APP_HOST="127.0.0.1",
+            TELEGRAM_API_URL=f"http://127.0.0.1:{api_port}", WEBHOOK_MODE="inline",
+            # the per-chat limits stay real; the ~30 msg/s bot-wide budget would only measure itself
+            TG_GLOBAL_RATE="1000000",
+            ADMIN_CHAT_ID=str(ADMIN_CHAT), ADMIN_USER_ID="0", LEADER_LOCK_PATH=os.path.join(tmp, "leader.lock"),
+            ORDERS_DB_PATH=os.path.join(tmp, "orders.db"), FSM_DB_PATH=os.path.join(tmp, "fsm.db"),
+            WEBHOOK_DEDUP_PATH=os.path.join(tmp, "seen.db"), STATIC_BUILD_DIR=os.path.join(tmp, "static"),
+            IMAGE_CACHE_DIR=os.path.join(tmp, "img_cache"), EXPORT_DIR=os.path.join(tmp, "exports"),
+            IMAGE_VARIANTS_DIR=os.path.join(tmp, "img_variants"),
+        )
+        env.pop("WORKER_ID", None)
+        log = open(os.path.join(tmp, "bot.log"), "wb")
+        proc = subprocess.Popen([sys.executable, "main.py"], cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+        base = f"http://127.0.0.1:{port}"
+        try:
+            asyncio.run(wait_ready(base))
+            result = asyncio.run(drive(base, args))
+            stats = asyncio.run(fetch_stats(f"http://127.0.0.1:{api_port}"))
+        finally:
+            proc.send_signal(signal.SIGTERM)
+            try:
+                proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+            log.close()
+    api.terminate()
+
+    print(f"scenario: {scenario_key(args)} cpus={os.cpu_count()}")
+    print(f"{result['journeys']} journeys, {result['updates']} updates in {result['elapsed']:.1f}s")
+    print(f"{'step':>18} | {'n':>5} | {'p50 ms':>7} | {'p99 ms':>7} | errors")
+    for step, xs in result["steps"].items():
+        print(f"{step:>18} | {len(xs):>5} | {percentile(xs, 50) * 1000:>7.1f} | "
+              f"{percentile(xs, 99) * 1000:>7.1f} | {result['errors'].get(step, 0)}")
+    print("fake Bot API: " + ", ".join(
+        f"{m} {s['calls']}" + (f" (+{s['429']}×429)" if s["429"] else "") for m, s in sorted(stats.items())))
+    print(f"updates: p50 {result['p50_ms']:.1f} ms, p99 {result['p99_ms']:.1f} ms, "
+          f"{result['updates_per_s']:.1f} updates/s (target {args.rate:g})")
+    errors = sum(result["errors"].values())
+    if errors:
+        print(f"FAIL: {errors} failed requests")
+    if not check_baseline(result, args) or errors:
+        sys.exit(1)
+
+
+async def fetch_stats(api: str) -> dict:
+    async with ClientSession() as session:
+        async with session.get(api + "/stats") as r:
+            return await r.json()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# bench/bench_order_browse.py — admin order browser page latency as the orders table grows
+# (keyset pagination + indexes vs the old unindexed LIMIT/OFFSET approach)
+#
+#   python bench/bench_order_browse.py [--sizes 10000,100000,1000000] [--page 20] [--db PATH]
+#
+# Builds a synthetic DB (grown in place between sizes) and times every /listorders shape:
+# first page, a page deep in the history, and the user / phone / date / search filters.
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from orders_db import OrderFilter, OrderRepository, query_orders_page  # noqa: E402
+
+NAMES = ["Ali", "Vali", "Aziza", "Dilnoza", "Jasur", "Malika", "Sardor", "Nodira", "Bekzod", "Shahnoza"]
+STREETS = ["Chilonzor", "Yunusobod", "Mirzo Ulug‘bek", "Sergeli", "Olmazor", "Yakkasaroy", "Shayxontohur"]
+CART = json.dumps([{"product_id": "p1", "name": "Togʻ rayhoni", "kg": 1.0, "qty": 2, "price": 500000}], ensure_ascii=False)
+START = datetime(2023, 1, 1)
+
+
+def synth_rows(first_id, n, rnd):
+    # ~3 orders per user, timestamps increase with id (as in production)
+    for i in range(first_id, first_id + n):
+        user = rnd.randrange(1, max(2, (first_id + n) // 3))
+        phone = f"+99890{user:07d}"
+        yield (
+            user, rnd.choice(NAMES), phone if i % 4 else phone[1:],
+            f"{rnd.choice(STREETS)} {rnd.randrange(1, 99)}-uy", CART, 500000,
+            (START + timedelta(seconds=i * 30)).isoformat(), None, None,
+        )
+
+
+def grow(repo, target, rnd):
+    con = repo._writer_con()
+    have = con.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+    if have >= target:
+        return
+    t0 = time.perf_counter()
+    con.execute("BEGIN IMMEDIATE")
+    con.executemany(
+        "INSERT INTO orders (user_id,user_name,phone,address,cart_json,total,created_at,lat,lon) "
+        "VALUES (?,?,?,?,?,?,?,?,?)",
+        synth_rows(have + 1, target - have, rnd),
+    )
+    con.execute("COMMIT")
+    con.execute("ANALYZE")
+    print(f"  grew to {target:,} rows in {time.perf_counter() - t0:.1f}s")
+
+
+def timed(fn, repeat=20):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def old_offset_page(con, offset, limit):
+    # Pre-index browser equivalent: OFFSET pagination, LIKE search, no secondary indexes used
+    return con.execute(
+        "SELECT id,user_name,phone,total,created_at,lat,lon FROM orders NOT INDEXED "
+        "ORDER BY id DESC LIMIT ? OFFSET ?", (limit, offset),
+    ).fetchall()
+
+
+def old_phone_page(con, phone, limit):
+    return con.execute(
+        "SELECT id,user_name,phone,total,created_at,lat,lon FROM orders NOT INDEXED "
+        "WHERE phone IN (?,?) ORDER BY id DESC LIMIT ?", ("+" + phone, phone, limit),
+    ).fetchall()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="10000,100000,1000000")
+    ap.add_argument("--page", type=int, default=20)
+    ap.add_argument("--db", default=None, help="reuse/grow this DB instead of a temp file")
+    args = ap.parse_args()
+    sizes = [int(s) for s in args.sizes.split(",")]
+
+    tmp = None
+    if args.db is None:
+        tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(tmp.name, "orders.db")
+    else:
+        path = args.db
+    repo = OrderRepository(path)
+    rnd = random.Random(42)
+    print(f"db={path} page={args.page} fts={'on' if repo._writer_con() and repo.has_fts else 'off'}")
+
+    header = f"{'rows':>10} | {'first':>7} {'deep':>7} {'user':>7} {'phone':>7} {'date':>7} {'search':>7} | {'old deep':>9} {'old phone':>9}  (ms/page)"
+    results = []
+    for size in sizes:
+        grow(repo, size, rnd)
+        con = repo._writer_con()
+        n = args.page
+        mid = size // 2
+        user = rnd.randrange(1, size // 3)
+        phone = f"99890{user:07d}"
+        day = (START + timedelta(seconds=mid * 30)).date()
+        f_none = OrderFilter()
+        f_user = OrderFilter.parse(f"user:{user}")
+        f_phone = OrderFilter.parse(f"phone:{phone}")
+        f_date = OrderFilter.parse(f"from:{day} to:{day + timedelta(days=2)}")
+        f_text = OrderFilter.parse("dilnoza chilonzor")
+        row = [
+            size,
+            timed(lambda: query_orders_page(con, f_none, None, None, n, repo.has_fts)),
+            timed(lambda: query_orders_page(con, f_none, mid, None, n, repo.has_fts)),
+            timed(lambda: query_orders_page(con, f_user, None, None, n, repo.has_fts)),
+            timed(lambda: query_orders_page(con, f_phone, None, None, n, repo.has_fts)),
+            timed(lambda: query_orders_page(con, f_date, None, None, n, repo.has_fts)),
+            timed(lambda: query_orders_page(con, f_text, mid, None, n, repo.has_fts)),
+            timed(lambda: old_offset_page(con, size - mid, n), repeat=3),
+            timed(lambda: old_phone_page(con, phone, n), repeat=3),
+        ]
+        results.append(row)
+    print(header)
+    for r in results:
+        print(f"{r[0]:>10,} | " + " ".join(f"{v:>7.3f}" for v in r[1:7]) + " | " + " ".join(f"{v:>9.2f}" for v in r[7:]))
+    repo.close()
+    if tmp is not None:
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# bench/bench_order_writes.py — event-loop latency and throughput during order insert bursts
+# (old inline sync code vs OrderRepository without and with group commit)
+#
+#   python bench/bench_order_writes.py [--orders 2000] [--concurrency 200] [--batch-ms 5]
+#
+# A 1 ms ticker task runs alongside the burst; its overshoot is the time the loop was blocked.
+import os
+import sys
+import json
+import time
+import asyncio
+import sqlite3
+import argparse
+import tempfile
+from contextlib import closing
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from orders_db import OrderRepository  # noqa: E402
+
+CART = [{"product_id": "p1", "name": "Togʻ rayhoni", "kg": 1.0, "qty": 2, "unit_price": 250000, "price": 500000}]
+
+
+def legacy_save(path, i):
+    # Baseline: the pre-repository save_order_to_db, executed on the event loop
+    with closing(sqlite3.connect(path)) as con:
+        cur = con.cursor()
+        cur.execute(
+            """CREATE TABLE IF NOT EXISTS orders(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER, user_name TEXT, phone TEXT, address TEXT,
+            cart_json TEXT, total INTEGER, created_at TEXT,
+            lat REAL, lon REAL)"""
+        )
+        cur.execute(
+            "INSERT INTO orders (user_id,user_name,phone,address,cart_json,total,created_at,lat,lon) "
+            "VALUES (?,?,?,?,?,?,?,?,?)",
+            (i, "Ali", "+998901234567", "Toshkent", json.dumps(CART, ensure_ascii=False),
+             500000, datetime.utcnow().isoformat(), None, None),
+        )
+        con.commit()
+        return cur.lastrowid
+
+
+async def ticker(lags, stop):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        t0 = loop.time()
+        await asyncio.sleep(0.001)
+        lags.append(max(0.0, loop.time() - t0 - 0.001))
+
+
+def pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(len(xs) * p))] if xs else 0.0
+
+
+async def run(mode, path, orders, concurrency, batch_ms):
+    lags, stop = [], asyncio.Event()
+    tick = asyncio.create_task(ticker(lags, stop))
+    sem = asyncio.Semaphore(concurrency)
+    repo = None
+    if mode == "repository":
+        repo = OrderRepository(path, batch_rows=1)
+    elif mode == "group-commit":
+        repo = OrderRepository(path, batch_latency=batch_ms / 1000)
+
+    async def one(i):
+        async with sem:
+            if repo is None:
+                legacy_save(path, i)
+                await asyncio.sleep(0)
+            else:
+                await repo.insert_order(i, "Ali", "+998901234567", "Toshkent", CART, 500000)
+
+    await asyncio.sleep(0.05)
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(orders)))
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    await tick
+    out = {"mode": mode}
+    if repo is not None:
+        out["batches"] = repo.ingest.stats["batches"]
+        out["max_batch"] = repo.ingest.stats["max_batch"]
+        out["max_depth"] = repo.ingest.stats["max_depth"]
+        await repo.ingest.drain()
+        repo.close()
+    return {
+        **out,
+        "orders/s": round(orders / elapsed),
+        "loop_lag_p50_ms": round(pct(lags, 0.50) * 1000, 2),
+        "loop_lag_p99_ms": round(pct(lags, 0.99) * 1000, 2),
+        "loop_lag_max_ms": round(max(lags, default=0) * 1000, 2),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--orders", type=int, default=2000)
+    ap.add_argument("--concurrency", type=int, default=200)
+    ap.add_argument("--batch-ms", type=float, default=5.0)
+    args = ap.parse_args()
+    with tempfile.TemporaryDirectory() as d:
+        for mode in ("legacy", "repository", "group-commit"):
+            res = asyncio.run(run(mode, os.path.join(d, f"{mode}.db"), args.orders, args.concurrency, args.batch_ms))
+            print(json.dumps(res))
+
+
+if __name__ == "__main__":
+    main()
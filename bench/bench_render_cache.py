@@ -0,0 +1,76 @@
+# bench/bench_render_cache.py — CPU per qinc:/qdec: callback, keyboards built each time vs RenderCache
+#
+#   python bench/bench_render_cache.py [--n 20000]
+#
+# "build" / "cached": just producing the selection keyboard.
+# "+ send": also what happens before the HTTP call — EditMessageReplyMarkup is created and
+# serialized to form fields by the aiohttp session, exactly as bot.edit_message_reply_markup does.
+# handlers.py (the bot side) is imported with every data path pointed at a temp dir.
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+_tmp = tempfile.TemporaryDirectory()
+os.environ.setdefault("BOT_TOKEN", "123456:bench")
+for var, name in (("ORDERS_DB_PATH", "orders.db"), ("FSM_DB_PATH", "fsm.db"), ("WEBHOOK_DEDUP_PATH", "seen.db"),
+                  ("STATIC_BUILD_DIR", "static"), ("IMAGE_CACHE_DIR", "img_cache"),
+                  ("IMAGE_VARIANTS_DIR", "img_variants"), ("EXPORT_DIR", "exports")):
+    os.environ[var] = os.path.join(_tmp.name, name)
+
+import logging  # noqa: E402
+logging.disable(logging.INFO)
+import handlers  # noqa: E402
+from aiogram.methods import EditMessageReplyMarkup  # noqa: E402
+
+
+def hot_path(kb_fn, data, lang):
+    # body of qty_inc/qty_dec minus the awaits
+    _, pid, raw = data.split(":")
+    qty = handlers.clamp(int(raw) + 1)
+    return kb_fn(pid, qty, lang)
+
+
+def send(bot, kb):
+    method = EditMessageReplyMarkup(chat_id=7110271171, message_id=42, reply_markup=kb)
+    return bot.session.build_form_data(bot, method)
+
+
+def bench(fn, n):
+    t0 = time.process_time()
+    for i in range(n):
+        fn(i)
+    return (time.process_time() - t0) / n * 1e6
+
+
+def run():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=20000)
+    args = ap.parse_args()
+    bot = handlers.bot
+    pids = [v["id"] for v in handlers.catalog.visible("uz")] or ["p1"]
+    datas = [f"qinc:{pid}:{q}" for pid in pids for q in range(1, 6)]
+    build = handlers.selection_menu_kb.build
+    cached = handlers.selection_menu_kb
+    handlers.warm_render_cache()
+
+    res = {
+        "build": bench(lambda i: hot_path(build, datas[i % len(datas)], "uz"), args.n),
+        "cached": bench(lambda i: hot_path(cached, datas[i % len(datas)], "uz"), args.n),
+        "build + send": bench(lambda i: send(bot, hot_path(build, datas[i % len(datas)], "uz")), args.n),
+        "cached + send": bench(lambda i: send(bot, hot_path(cached, datas[i % len(datas)], "uz")), args.n),
+    }
+    print(f"{len(pids)} products, render cache: {len(handlers.render_cache)} entries, stats {handlers.render_cache.stats}")
+    for name, us in res.items():
+        print(f"{name:>14}: {us:7.1f} µs/callback")
+    print(f"keyboard: {res['build'] / res['cached']:.0f}x less CPU; "
+          f"per callback incl. serialization: -{res['build + send'] - res['cached + send']:.1f} µs "
+          f"({(1 - res['cached + send'] / res['build + send']) * 100:.0f}%)")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,104 @@
+# bench/bench_update_decode.py — webhook body -> mounted Update, updates/sec on one core
+#
+#   python bench/bench_update_decode.py [--seconds 1.0]
+#
+# legacy:    json.loads + Update(**data), then the re-mount feed_update does for unmounted updates
+# orjson:    orjson.loads + Update.model_validate(context={"bot": bot}) (if orjson is installed)
+# fast:      webhook.decode_update (model_validate_json from bytes, mounted, type pre-filter)
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from aiogram import Bot, types  # noqa: E402
+from webhook import decode_update  # noqa: E402
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+USER = {"id": 7110271171, "is_bot": False, "first_name": "Ali", "last_name": "Valiyev",
+        "username": "ali_v", "language_code": "uz"}
+CHAT = {"id": 7110271171, "first_name": "Ali", "last_name": "Valiyev", "username": "ali_v", "type": "private"}
+PHOTO = [{"file_id": "AgACAgIAAxkBAAIH6WkAAZjCPaOvdq6rSWD5xKChepOEDQACN_oxG_RaAUgMWlyvuCM7cQEAAwIAA3kAAzYE",
+          "file_unique_id": "AQADN_oxG_RaAUh-", "file_size": 1000 * s, "width": 90 * s, "height": 60 * s}
+         for s in (1, 4, 8)]
+KB = {"inline_keyboard": [
+    [{"text": "Tanlash", "callback_data": "sel:p1"}, {"text": "Asal haqida", "callback_data": "info:p1"}],
+    [{"text": "◀️", "callback_data": "cat:18"}, {"text": "1/19", "callback_data": "noop"},
+     {"text": "▶️", "callback_data": "cat:1"}],
+]}
+
+
+def msg(i, **extra):
+    return {"message_id": i, "from": USER, "chat": CHAT, "date": 1760000000, **extra}
+
+
+def corpus():
+    bot_msg = msg(1, **{"from": {"id": 8311317527, "is_bot": True, "first_name": "Asalboy"}},
+                  photo=PHOTO, caption="Togʻ rayhoni\n\nNarx (1 kg): 250000 so'm", reply_markup=KB)
+    updates = [
+        {"message": msg(1, text="/start", entities=[{"type": "bot_command", "offset": 0, "length": 6}])},
+        {"callback_query": {"id": "1", "from": USER, "chat_instance": "-1", "data": "lang:uz", "message": bot_msg}},
+        {"message": msg(2, text="Katalog")},
+        {"callback_query": {"id": "2", "from": USER, "chat_instance": "-1", "data": "sel:p1", "message": bot_msg}},
+        {"callback_query": {"id": "3", "from": USER, "chat_instance": "-1", "data": "qinc:p1:1", "message": bot_msg}},
+        {"callback_query": {"id": "4", "from": USER, "chat_instance": "-1", "data": "addsel:p1:2", "message": bot_msg}},
+        {"message": msg(3, contact={"phone_number": "+998901234567", "first_name": "Ali", "user_id": USER["id"]})},
+        {"message": msg(4, location={"latitude": 41.2274, "longitude": 69.1777})},
+        {"message": msg(5, web_app_data={"button_text": "🛒 Interaktiv menyu", "data": json.dumps(
+            {"items": [{"id": "p1", "qty": 2}, {"id": "p4", "qty": 1}], "name": "Ali", "phone": "+998901234567",
+             "address": "Toshkent, Chilonzor 5", "lat": 41.2, "lon": 69.1})})},
+        # no handlers for these -> pre-filter drops them
+        {"edited_message": msg(6, text="Katalog!", edit_date=1760000100)},
+        {"my_chat_member": {"chat": CHAT, "from": USER, "date": 1760000000,
+                            "old_chat_member": {"status": "member", "user": USER},
+                            "new_chat_member": {"status": "kicked", "user": USER, "until_date": 0}}},
+    ]
+    # update_id first, as Telegram sends it
+    return [json.dumps({"update_id": 900000 + i, **u}, ensure_ascii=False).encode() for i, u in enumerate(updates)]
+
+
+def legacy(body, bot, allowed):
+    u = types.Update(**json.loads(body))
+    if u.bot != bot:
+        u = types.Update.model_validate(u.model_dump(), context={"bot": bot})
+    return u
+
+
+def with_orjson(body, bot, allowed):
+    return types.Update.model_validate(orjson.loads(body), context={"bot": bot})
+
+
+def rate(fn, bodies, bot, allowed, seconds):
+    n = 0
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < seconds:
+        for b in bodies:
+            fn(b, bot, allowed)
+        n += len(bodies)
+    return n / (time.perf_counter() - t0)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--seconds", type=float, default=1.0)
+    args = ap.parse_args()
+    bot = Bot("123456:TEST")
+    bodies = corpus()
+    allowed = frozenset({"message", "callback_query"})
+    modes = [("legacy", legacy), ("fast", decode_update)]
+    if orjson is not None:
+        modes.insert(1, ("orjson", with_orjson))
+    base = None
+    for name, fn in modes:
+        r = rate(fn, bodies, bot, allowed, args.seconds)
+        base = base or r
+        print(json.dumps({"mode": name, "updates_per_sec": round(r), "speedup": round(r / base, 2)}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+# bench/bench_workers.py — webhook + WebApp throughput of main.py with 1, 2, 4… worker processes
+#
+#   python bench/bench_workers.py [--workers 1,2,4] [--seconds 10] [--clients 2] [--concurrency 32]
+#
+# Starts the real bot (`python main.py`, WORKERS=N) on a free port with every data path in a
+# temp dir and TELEGRAM_API_URL pointed at bench/fake_bot_api.py in a separate process, so replies
+# cost a real HTTP round trip but never leave the machine. Client processes then post
+# /start and lang: callback updates to /webhook (WEBHOOK_MODE=inline: the response is sent
+# after the handler finished, FSM write included) mixed with GET /api/products, and the
+# completed requests per second are reported for every worker count.
+# Scaling needs free cores for the workers: on an N-core box expect up to ~N×.
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import multiprocessing as mp
+
+from aiohttp import ClientSession, TCPConnector
+
+from fake_bot_api import run as run_fake_api
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOKEN = "123456:bench"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# ---- load generator ----
+def make_update(uid: int, chat: int, kind: int) -> bytes:
+    user = {"id": chat, "is_bot": False, "first_name": "Bench"}
+    msg = {"message_id": 1, "date": 0, "chat": {"id": chat, "type": "private"}}
+    if kind == 0:
+        update = {"update_id": uid, "message": {
+            **msg, "from": user, "text": "/start",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        }}
+    else:
+        update = {"update_id": uid, "callback_query": {
+            "id": str(uid), "from": user, "chat_instance": "1", "data": "lang:uz", "message": msg,
+        }}
+    return json.dumps(update).encode("utf-8")
+
+
+async def client_loop(base: str, cid: int, seconds: float, concurrency: int) -> dict:
+    counts = {"ok": 0, "err": 0}
+    seq = 0
+    deadline = time.perf_counter() + seconds
+
+    async def one(session: ClientSession) -> None:
+        nonlocal seq
+        while time.perf_counter() < deadline:
+            seq += 1
+            n = seq
+            try:
+                if n % 3 == 2:
+                    async with session.get(base + "/api/products") as r:
+                        await r.read()
+                else:
+                    # fresh update_id and chat every time: no dedup hits, no per-chat throttling
+                    uid = cid * 100_000_000 + n
+                    body = make_update(uid, 10_000_000 + uid % 5_000_000, n % 3)
+                    async with session.post(base + "/webhook", data=body,
+                                            headers={"Content-Type": "application/json"}) as r:
+                        await r.read()
+                counts["ok" if r.status == 200 else "err"] += 1
+            except Exception:
+                counts["err"] += 1
+
+    async with ClientSession(connector=TCPConnector(limit=concurrency, force_close=False)) as session:
+        await asyncio.gather(*(one(session) for _ in range(concurrency)))
+    return counts
+
+
+def run_client(base: str, cid: int, seconds: float, concurrency: int, out) -> None:
+    out.put(asyncio.run(client_loop(base, cid, seconds, concurrency)))
+
+
+# ---- one measurement ----
+async def wait_ready(base: str, timeout: float = 60.0) -> None:
+    try:
+        import PIL  # noqa: F401  # the leader backfills thumbnails first; wait until srcset shows up
+        want = b"srcset"
+    except ImportError:
+        want = b"items"
+    deadline = time.perf_counter() + timeout
+    async with ClientSession() as session:
+        while time.perf_counter() < deadline:
+            try:
+                async with session.get(base + "/api/products") as r:
+                    if r.status == 200 and want in await r.read():
+                        return
+            except OSError:
+                pass
+            await asyncio.sleep(0.3)
+    raise RuntimeError("bot did not start")
+
+
+def measure(workers: int, tmp: str, api_port: int, args) -> dict:
+    port = free_port()
+    data = os.path.join(tmp, f"w{workers}")
+    env = dict(
+        os.environ, BOT_TOKEN=TOKEN, WORKERS=str(workers), PORT=str(port), APP_HOST="127.0.0.1",
+        TELEGRAM_API_URL=f"http://127.0.0.1:{api_port}", WEBHOOK_MODE="inline", TG_GLOBAL_RATE="1000000",
+        ADMIN_CHAT_ID="0", ADMIN_USER_ID="0", LEADER_LOCK_PATH=os.path.join(data, "leader.lock"),
+        CHAT_LOCK_PATH=os.path.join(data, "chat.lock"),
+        ORDERS_DB_PATH=os.path.join(data, "orders.db"), FSM_DB_PATH=os.path.join(data, "fsm.db"),
+        WEBHOOK_DEDUP_PATH=os.path.join(data, "seen.db"), STATIC_BUILD_DIR=os.path.join(data, "static"),
+        IMAGE_CACHE_DIR=os.path.join(data, "img_cache"), EXPORT_DIR=os.path.join(data, "exports"),
+        # thumbnails are made once and shared by every run
+        IMAGE_VARIANTS_DIR=os.path.join(tmp, "img_variants"),
+    )
+    env.pop("WORKER_ID", None)
+    log = open(os.path.join(tmp, f"bot_w{workers}.log"), "wb")
+    proc = subprocess.Popen([sys.executable, "main.py"], cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        asyncio.run(wait_ready(base))
+        time.sleep(1.0)  # let every worker bind before the clients connect
+        out = mp.Queue()
+        clients = [
+            mp.Process(target=run_client, args=(base, c + 1, args.seconds, args.concurrency, out))
+            for c in range(args.clients)
+        ]
+        t0 = time.perf_counter()
+        for c in clients:
+            c.start()
+        results = [out.get() for _ in clients]
+        elapsed = time.perf_counter() - t0
+        for c in clients:
+            c.join()
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        log.close()
+    ok = sum(r["ok"] for r in results)
+    err = sum(r["err"] for r in results)
+    return {"workers": workers, "ok": ok, "err": err, "rps": ok / elapsed}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", default="1,2,4")
+    ap.add_argument("--seconds", type=float, default=10.0)
+    ap.add_argument("--clients", type=int, default=2, help="load generator processes")
+    ap.add_argument("--concurrency", type=int, default=32, help="in-flight requests per client")
+    args = ap.parse_args()
+
+    api_port = free_port()
+    api = mp.Process(target=run_fake_api, args=(api_port,), daemon=True)
+    api.start()
+    print(f"cpus={os.cpu_count()} clients={args.clients}x{args.concurrency} seconds={args.seconds}")
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in (int(w) for w in args.workers.split(",")):
+            rows.append(measure(n, tmp, api_port, args))
+            r = rows[-1]
+            print(f"  workers={n}: {r['rps']:.0f} req/s ({r['ok']} ok, {r['err']} errors)")
+    api.terminate()
+    base = rows[0]["rps"] or 1
+    print(f"{'workers':>7} | {'req/s':>8} | {'speedup':>7}")
+    for r in rows:
+        print(f"{r['workers']:>7} | {r['rps']:>8.0f} | {r['rps'] / base:>6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
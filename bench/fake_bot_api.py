@@ -0,0 +1,135 @@
+# bench/fake_bot_api.py — local stand-in for the Telegram Bot API (latency + 429 injection)
+#
+#   python bench/fake_bot_api.py [--port 8081] [--latency-ms 30] [--jitter-ms 10] [--rate-429 0.01]
+#
+# Point the bot at it with TELEGRAM_API_URL=http://127.0.0.1:<port>. Every method succeeds
+# with a plausible result (getMe, getFile, sendMessage, sendPhoto, sendLocation,
+# editMessageReplyMarkup, ... ; anything else returns True) and /file/bot<token>/<path>
+# serves a product JPEG, so image downloads work too. Each call waits latency ± jitter ms;
+# rate-limited methods (send*/edit*/answerCallbackQuery) get a 429 with retry_after with
+# probability rate_429. GET /stats returns calls and injected 429s per method as JSON.
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+from typing import Dict
+
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+_LIMITED = ("send", "edit", "copy", "forward", "answercallbackquery")
+
+
+class FakeBotAPI:
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, rate_429: float = 0.0,
+                 retry_after: int = 1, seed: int = 0):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.stats: Dict[str, Dict[str, int]] = {}
+        self._message_id = 1000
+        with open(os.path.join(ROOT, "webapp", "img", "p1.jpg"), "rb") as f:
+            self.photo = f.read()
+
+    def _count(self, method: str, key: str) -> None:
+        s = self.stats.setdefault(method, {"calls": 0, "429": 0})
+        s[key] += 1
+
+    async def _delay(self) -> None:
+        d = self.latency + (self.rng.uniform(-self.jitter, self.jitter) if self.jitter else 0.0)
+        if d > 0:
+            await asyncio.sleep(d)
+
+    def _message(self, params, **extra) -> dict:
+        self._message_id += 1
+        try:
+            chat_id = int(params.get("chat_id", 1))
+        except ValueError:
+            chat_id = 1
+        return {
+            "message_id": self._message_id, "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "group"},
+            "from": BOT_USER, **extra,
+        }
+
+    def _result(self, method: str, params):
+        if method == "getme":
+            return BOT_USER
+        if method == "getfile":
+            fid = params.get("file_id", "file")
+            return {"file_id": fid, "file_unique_id": fid[-16:], "file_size": len(self.photo),
+                    "file_path": f"photos/{fid[-32:]}.jpg"}
+        if method == "sendphoto":
+            return self._message(params, photo=[
+                {"file_id": "fake-photo", "file_unique_id": "fake", "width": 640, "height": 640}
+            ], caption=params.get("caption"))
+        if method == "sendlocation":
+            return self._message(params, location={
+                "latitude": float(params.get("latitude", 0)), "longitude": float(params.get("longitude", 0))
+            })
+        if method == "sendmediagroup":
+            media = json.loads(params.get("media", "[]"))
+            return [self._message(params, photo=[
+                {"file_id": "fake-photo", "file_unique_id": "fake", "width": 640, "height": 640}
+            ]) for _ in media]
+        if method.startswith("send") or method in ("editmessagetext", "editmessagecaption", "editmessagemedia"):
+            return self._message(params, text=params.get("text", ""))
+        if method == "editmessagereplymarkup":
+            return True if params.get("inline_message_id") else self._message(params, text="")
+        return True
+
+    async def handle_method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        params = await request.post()
+        await self._delay()
+        if self.rate_429 and method.startswith(_LIMITED) and self.rng.random() < self.rate_429:
+            self._count(method, "429")
+            return web.json_response({
+                "ok": False, "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }, status=429)
+        self._count(method, "calls")
+        return web.json_response({"ok": True, "result": self._result(method, params)})
+
+    async def handle_file(self, request: web.Request) -> web.Response:
+        await self._delay()
+        self._count("file_download", "calls")
+        return web.Response(body=self.photo, content_type="image/jpeg")
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats)
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle_method)
+        app.router.add_get("/file/bot{token}/{path:.+}", self.handle_file)
+        app.router.add_get("/stats", self.handle_stats)
+        return app
+
+
+def run(port: int, latency_ms: float = 0.0, jitter_ms: float = 0.0, rate_429: float = 0.0, retry_after: int = 1) -> None:
+    """Blocking; meant as a multiprocessing.Process target."""
+    api = FakeBotAPI(latency_ms, jitter_ms, rate_429, retry_after)
+    web.run_app(api.app(), host="127.0.0.1", port=port, print=None, access_log=None)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--port", type=int, default=8081)
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--rate-429", type=float, default=0.0, help="probability of a 429 per limited call")
+    ap.add_argument("--retry-after", type=int, default=1)
+    args = ap.parse_args()
+    print(f"Fake Bot API on http://127.0.0.1:{args.port}")
+    run(args.port, args.latency_ms, args.jitter_ms, args.rate_429, args.retry_after)
+
+
+if __name__ == "__main__":
+    main()
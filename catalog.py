@@ -0,0 +1,180 @@
+# catalog.py — ASALBOY product catalog (indexed, versioned, hot-reloaded products.json)
+import os
+import json
+import asyncio
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+LANGS = ("uz", "ru")
+
+
+def unit_price_1kg(p: Dict[str, Any]) -> int:
+    if p.get("price_per_kg") is not None:
+        return int(float(p["price_per_kg"]))
+    if p.get("price_1") is not None:
+        return int(float(p["price_1"]))
+    return 0
+
+
+def _normalize(p: Dict[str, Any]) -> Dict[str, Any]:
+    # Ensure info fields exist (fallback to empty strings)
+    if "info_short" not in p:
+        p["info_short"] = ""
+    if "info_full" not in p:
+        p["info_full"] = ""
+    return p
+
+
+def _view(p: Dict[str, Any], lang: str) -> Dict[str, Any]:
+    """Language-specific, read-only projection of one product."""
+    if lang == "uz":
+        name = p.get("name_uz", "Nomsiz")
+        desc = p.get("desc_uz") or ""
+        short = p.get("info_short") or ""
+    else:
+        name = p.get("name_ru", "Без названия")
+        desc = p.get("desc_ru") or ""
+        short = p.get("info_short_ru") or p.get("info_short") or ""
+    full = (
+        p.get("info_full") or p.get("info_short")
+        or p.get("desc_uz") or p.get("desc_ru") or ""
+    )
+    # None when the product has no photo of its own; the bot falls back to webapp/img/<id>.jpg
+    photo = p.get("photo_file_id") or p.get("photo") or p.get("photo_url") or None
+    return {
+        "id": str(p.get("id")),
+        "name": name,
+        "desc": desc,
+        "short": short,
+        "full": full,
+        "price": unit_price_1kg(p),
+        "photo": photo,
+        "available": p.get("available") is not False,
+    }
+
+
+class CatalogSnapshot:
+    """Immutable view of products.json at one version. Never mutated after build."""
+
+    __slots__ = ("version", "items", "by_id", "views", "visible")
+
+    def __init__(self, version: int, items: List[Dict[str, Any]]):
+        self.version = version
+        self.items: Tuple[Dict[str, Any], ...] = tuple(items)
+        self.by_id: Dict[str, Dict[str, Any]] = {str(p.get("id")): p for p in items}
+        self.views: Dict[str, Dict[str, Dict[str, Any]]] = {
+            lang: {pid: _view(p, lang) for pid, p in self.by_id.items()} for lang in LANGS
+        }
+        # Products shown in the bot catalog, in file order
+        self.visible: Dict[str, Tuple[Dict[str, Any], ...]] = {
+            lang: tuple(v for v in self.views[lang].values() if v["available"]) for lang in LANGS
+        }
+
+
+class ProductCatalog:
+    """
+    Id-indexed product catalog backed by products.json.
+    Readers grab `catalog.snapshot` (or use the helpers) and never see a half-built state:
+    reload/add build a new CatalogSnapshot and swap it in with a single assignment.
+    """
+
+    def __init__(self, path: str = "products.json"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stat: Optional[Tuple[int, int]] = None
+        self._listeners: List[Any] = []
+        self.snapshot = CatalogSnapshot(0, [])
+        self.reload(force=True)
+
+    # ---- read API ----
+    @property
+    def version(self) -> int:
+        return self.snapshot.version
+
+    @property
+    def items(self) -> Tuple[Dict[str, Any], ...]:
+        return self.snapshot.items
+
+    def __len__(self) -> int:
+        return len(self.snapshot.items)
+
+    def get(self, pid) -> Optional[Dict[str, Any]]:
+        return self.snapshot.by_id.get(pid if isinstance(pid, str) else str(pid))
+
+    def view(self, pid, lang: str) -> Optional[Dict[str, Any]]:
+        views = self.snapshot.views.get(lang) or self.snapshot.views["uz"]
+        return views.get(pid if isinstance(pid, str) else str(pid))
+
+    def visible(self, lang: str) -> Tuple[Dict[str, Any], ...]:
+        return self.snapshot.visible.get(lang) or self.snapshot.visible["uz"]
+
+    def on_change(self, fn) -> None:
+        """Register fn(snapshot) to be called after every swap."""
+        self._listeners.append(fn)
+
+    # ---- write API ----
+    def _file_stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _swap(self, items: List[Dict[str, Any]]) -> None:
+        snap = CatalogSnapshot(self.snapshot.version + 1, items)
+        self.snapshot = snap
+        for fn in self._listeners:
+            try:
+                fn(snap)
+            except Exception:
+                logging.exception("Catalog listener failed")
+
+    def reload(self, force: bool = False) -> bool:
+        """Re-read products.json if it changed on disk. Returns True when a new version was swapped in."""
+        with self._lock:
+            st = self._file_stat()
+            if st is None:
+                with open(self.path, "w", encoding="utf-8") as f:
+                    json.dump([], f, ensure_ascii=False, indent=2)
+                st = self._file_stat()
+            if not force and st == self._stat:
+                return False
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                # Half-written file (editor save in progress) — keep serving the old snapshot
+                logging.exception("products.json o‘qilmadi, eski katalog qoldi")
+                return False
+            self._stat = st
+            self._swap([_normalize(p) for p in data])
+        logging.info("Catalog v%d: %d products", self.version, len(self))
+        return True
+
+    def add(self, prod: Dict[str, Any]) -> None:
+        """Append a product, persist atomically and swap in the new version."""
+        with self._lock:
+            items = list(self.snapshot.items) + [_normalize(prod)]
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(items, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.path)
+            self._stat = self._file_stat()
+            self._swap(items)
+
+    def next_id(self) -> str:
+        ids = self.snapshot.by_id
+        n = 1
+        while f"p{n}" in ids:
+            n += 1
+        return f"p{n}"
+
+    async def watch(self, interval: float = 5.0) -> None:
+        """Poll products.json and hot-swap the catalog when admins edit it."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.reload()
+            except Exception:
+                logging.exception("Catalog reload failed")
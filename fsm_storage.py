@@ -0,0 +1,321 @@
+# fsm_storage.py — ASALBOY persistent FSM storage (SQLite + in-memory LRU front cache)
+import os
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+
+from orders_db import connect
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS fsm(
+        key TEXT PRIMARY KEY,
+        state TEXT,
+        data TEXT NOT NULL DEFAULT '{}',
+        updated_at REAL NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS fsm_updated_at ON fsm(updated_at)",
+    "CREATE TABLE IF NOT EXISTS fsm_meta(name TEXT PRIMARY KEY, value TEXT)",
+)
+
+
+class _Record:
+    __slots__ = ("state", "data", "touched", "dirty")
+
+    def __init__(self, state: Optional[str], data: Dict[str, Any], touched: float):
+        self.state = state
+        self.data = data
+        self.touched = touched
+        self.dirty = False
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    aiogram FSM storage that survives restarts.
+
+    - Hot users live in a bounded LRU (`max_cached` entries); misses are read from SQLite.
+    - Writes are write-behind: set_state/set_data/update_data only mark the entry dirty and a
+      flush runs `flush_delay` seconds later, so the 2–4 updates a handler typically makes
+      become one row write. All dirty rows are flushed in a single transaction.
+    - Sessions idle longer than `ttl` seconds are treated as empty and swept from disk.
+    - `shared=True` (several worker processes on one DB): reads always go to SQLite and
+      every change is written before the call returns, so the next update of the chat
+      sees it whichever worker handles it. Only entries mid-write stay in memory.
+    """
+
+    def __init__(
+        self,
+        path: str = "data/fsm.db",
+        max_cached: int = 10_000,
+        flush_delay: float = 0.05,
+        ttl: float = 30 * 24 * 3600,
+        sweep_every: float = 3600,
+        shared: bool = False,
+    ):
+        self.path = path
+        self.shared = shared
+        self.max_cached = max_cached
+        self.flush_delay = flush_delay
+        self.ttl = ttl
+        self.sweep_every = sweep_every
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._cache: "OrderedDict[str, _Record]" = OrderedDict()
+        self._dirty: Dict[str, _Record] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._last_sweep = time.time()
+        self._exec = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm-db")
+        self._con: Optional[sqlite3.Connection] = None
+        self.stats = {"hit": 0, "miss": 0, "writes": 0, "flushes": 0, "evicted": 0, "expired": 0}
+
+    # ---- sqlite (dedicated thread) ----
+    def _db(self) -> sqlite3.Connection:
+        if self._con is None:
+            d = os.path.dirname(self.path)
+            if d:
+                os.makedirs(d, exist_ok=True)
+            con = connect(self.path)
+            for stmt in SCHEMA:
+                con.execute(stmt)
+            self._con = con
+        return self._con
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._exec, lambda: fn(self._db(), *args))
+
+    @staticmethod
+    def _load_row(con: sqlite3.Connection, key: str) -> Optional[Tuple[Optional[str], str, float]]:
+        return con.execute("SELECT state,data,updated_at FROM fsm WHERE key=?", (key,)).fetchone()
+
+    @staticmethod
+    def _write_rows(con: sqlite3.Connection, upserts, deletes, sweep_before: Optional[float]) -> int:
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            if upserts:
+                con.executemany(
+                    "INSERT INTO fsm(key,state,data,updated_at) VALUES (?,?,?,?) "
+                    "ON CONFLICT(key) DO UPDATE SET state=excluded.state, data=excluded.data, "
+                    "updated_at=excluded.updated_at",
+                    upserts,
+                )
+            if deletes:
+                con.executemany("DELETE FROM fsm WHERE key=?", deletes)
+            swept = 0
+            if sweep_before is not None:
+                swept = con.execute("DELETE FROM fsm WHERE updated_at < ?", (sweep_before,)).rowcount
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+        return swept
+
+    # ---- cache ----
+    def _k(self, key: StorageKey) -> str:
+        return self.key_builder.build(key)
+
+    async def _get(self, key: StorageKey) -> _Record:
+        k = self._k(key)
+        now = time.time()
+        rec = self._cache.get(k)
+        if self.shared and rec is not None and not rec.dirty:
+            # another worker may have changed the row since we cached it
+            del self._cache[k]
+            rec = None
+        if rec is not None and now - rec.touched > self.ttl:
+            self.stats["expired"] += 1
+            rec.state, rec.data = None, {}
+            rec.dirty = True
+            self._dirty[k] = rec
+            self._schedule_flush()
+        if rec is None:
+            self.stats["miss"] += 1
+            row = await self._run(self._load_row, k)
+            # A concurrent call may have filled the slot while we were reading
+            rec = self._cache.get(k)
+            if rec is None:
+                if row is not None and now - row[2] <= self.ttl:
+                    rec = _Record(row[0], json.loads(row[1]), row[2])
+                else:
+                    rec = _Record(None, {}, now)
+                self._cache[k] = rec
+                self._evict()
+        else:
+            self.stats["hit"] += 1
+            self._cache.move_to_end(k)
+        rec.touched = now
+        return rec
+
+    def _evict(self) -> None:
+        if len(self._cache) <= self.max_cached:
+            return
+        # Only clean entries can be dropped; dirty ones leave after the next flush
+        for k in list(self._cache.keys()):
+            if len(self._cache) <= self.max_cached:
+                break
+            if not self._cache[k].dirty:
+                del self._cache[k]
+                self.stats["evicted"] += 1
+
+    async def _mark(self, key: StorageKey, rec: _Record) -> None:
+        rec.dirty = True
+        self._dirty[self._k(key)] = rec
+        if self.shared:
+            await self.flush()  # write-through
+        else:
+            self._schedule_flush()
+
+    def _schedule_flush(self) -> None:
+        if self._flush_handle is None and (self._flush_task is None or self._flush_task.done()):
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(self.flush_delay, self._start_flush)
+
+    def _start_flush(self) -> None:
+        self._flush_handle = None
+        self._flush_task = asyncio.get_running_loop().create_task(self.flush())
+
+    async def flush(self) -> None:
+        """Persist every dirty entry in one transaction."""
+        if not self._dirty and time.time() - self._last_sweep < self.sweep_every:
+            return
+        batch, self._dirty = self._dirty, {}
+        upserts, deletes = [], []
+        for k, rec in batch.items():
+            rec.dirty = False
+            if rec.state is None and not rec.data:
+                deletes.append((k,))
+            else:
+                upserts.append((k, rec.state, json.dumps(rec.data, ensure_ascii=False), rec.touched))
+        sweep_before = None
+        if time.time() - self._last_sweep >= self.sweep_every:
+            sweep_before = time.time() - self.ttl
+            self._last_sweep = time.time()
+        try:
+            swept = await self._run(self._write_rows, upserts, deletes, sweep_before)
+        except Exception:
+            # Keep the entries dirty; the next state change schedules another attempt
+            logging.exception("FSM flush failed")
+            for k, rec in batch.items():
+                if k not in self._dirty:
+                    rec.dirty = True
+                    self._dirty[k] = rec
+            return
+        finally:
+            self._flush_task = None
+        self.stats["flushes"] += 1
+        self.stats["writes"] += len(upserts) + len(deletes)
+        if swept:
+            logging.info("FSM: %d eskirgan sessiya o‘chirildi", swept)
+        if self._dirty:
+            self._schedule_flush()
+        self._evict()
+
+    @property
+    def size(self) -> int:
+        return len(self._cache)
+
+    # ---- BaseStorage ----
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        rec = await self._get(key)
+        rec.state = state.state if isinstance(state, State) else state
+        await self._mark(key, rec)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._get(key)).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        rec = await self._get(key)
+        rec.data = data.copy()
+        await self._mark(key, rec)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._get(key)).data.copy()
+
+    async def update_data(self, key: StorageKey, data: Dict[str, Any]) -> Dict[str, Any]:
+        rec = await self._get(key)
+        rec.data.update(data)
+        await self._mark(key, rec)
+        return rec.data.copy()
+
+    async def close(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._flush_task is not None:
+            await self._flush_task
+        if self._dirty:
+            await self.flush()
+
+        def _close(con):
+            con.close()
+            self._con = None
+
+        if self._con is not None:
+            await self._run(_close)
+        self._exec.shutdown(wait=True)
+
+    # ---- one-time users.json import ----
+    async def import_users_json(self, path: str, bot_id: int, catalog=None) -> int:
+        """
+        Import the legacy users.json ({user_id: {lang, phone, cart, ...}}) once.
+        Carts are converted to the current item shape when a catalog is given;
+        items for unknown products are dropped. Existing sessions are never overwritten.
+        """
+        marker = f"import:{path}"
+        done = await self._run(
+            lambda con: con.execute("SELECT 1 FROM fsm_meta WHERE name=?", (marker,)).fetchone()
+        )
+        if done:
+            return 0
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                users = json.load(f)
+        except FileNotFoundError:
+            return 0
+
+        now = time.time()
+        rows = []
+        for uid, u in users.items():
+            lang = u.get("lang") or "uz"
+            data: Dict[str, Any] = {"lang": lang}
+            if u.get("phone"):
+                data["phone"] = u["phone"]
+            cart = []
+            for it in u.get("cart") or []:
+                p = catalog.get(it.get("product_id")) if catalog is not None else None
+                if p is None:
+                    continue
+                qty = int(it.get("qty") or 1)
+                v = catalog.view(p["id"], lang)
+                cart.append({
+                    "product_id": v["id"],
+                    "name": v["name"],
+                    "kg": 1.0,
+                    "qty": qty,
+                    "unit_price": v["price"],
+                    "price": v["price"] * qty,
+                })
+            if cart:
+                data["cart"] = cart
+            uid = int(uid)
+            k = self._k(StorageKey(bot_id=bot_id, chat_id=uid, user_id=uid))
+            rows.append((k, None, json.dumps(data, ensure_ascii=False), now))
+
+        def _import(con):
+            con.execute("BEGIN IMMEDIATE")
+            con.executemany(
+                "INSERT OR IGNORE INTO fsm(key,state,data,updated_at) VALUES (?,?,?,?)", rows
+            )
+            con.execute("INSERT INTO fsm_meta(name,value) VALUES (?,?)", (marker, str(now)))
+            con.execute("COMMIT")
+
+        await self._run(_import)
+        logging.info("users.json: %d foydalanuvchi import qilindi", len(rows))
+        return len(rows)
@@ -0,0 +1,1448 @@
+# handlers.py — ASALBOY bot side (aiogram v3): translations, keyboards, handlers, webhook intake — info_full support (single "Asal haqida" button)
+#
+# Imported by app.create_dispatcher(); importing it is what pulls in aiogram.
+import os
+import json
+import time
+import logging
+import asyncio
+import hashlib
+from datetime import date, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher, F, types, html
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import Command, CommandObject, StateFilter
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.state import StatesGroup, State
+from aiogram.types import (
+    Message, ReplyKeyboardMarkup, KeyboardButton,
+    InlineKeyboardMarkup, InlineKeyboardButton, WebAppInfo, InputMediaPhoto, FSInputFile, BufferedInputFile
+)
+
+import app
+from app import (
+    ADMIN_CHAT_ID, ADMIN_USER_ID, APP_PUBLIC_URL, BOT_TOKEN, CHAT_LOCK_PATH, FSM_CACHE_SIZE, FSM_DB_PATH,
+    FSM_TTL_DAYS, LANG_DEFAULT, SHARED_STATE, SHARED_SYNC_SEC, TELEGRAM_API_URL, WORKERS,
+    image_variants, rebuild_products_body, static_assets,
+)
+from catalog import unit_price_1kg
+from render_cache import RenderCache
+from qty_stepper import QtyStepper, SharedQtyStepper
+from orders_db import OrderFilter
+from sales_rollup import query_stats, today
+from order_export import OrderExport
+from fsm_storage import SQLiteStorage
+from outbox import AdminOutbox
+from ratelimit import TelegramRateLimiter
+from metrics import REGISTRY, ORDER_INSERT_SECONDS, ApiMetrics, HandlerMetrics
+from webhook import (
+    ChatLock, UpdateDeduplicator, UpdateWorkerPool, decode_update, peek_update_id, secret_ok
+)
+
+# ============ BOT ============
+logging.info(f"ADMIN_CHAT_ID={ADMIN_CHAT_ID}")
+bot = Bot(
+    BOT_TOKEN,
+    session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None,
+    default=DefaultBotProperties(parse_mode="HTML"),
+)
+# Global ~30 msg/s + per-chat buckets, priority for callback answers, automatic 429 retry
+# (the global budget is per bot, so each worker gets its share)
+TG_GLOBAL_RATE = float(os.getenv("TG_GLOBAL_RATE", "30"))
+rate_limiter = TelegramRateLimiter(global_rate=TG_GLOBAL_RATE / WORKERS)
+bot.session.middleware(rate_limiter)
+fsm_storage = SQLiteStorage(
+    FSM_DB_PATH, max_cached=FSM_CACHE_SIZE, ttl=FSM_TTL_DAYS * 24 * 3600, shared=SHARED_STATE
+)
+dp  = Dispatcher(storage=fsm_storage)
+
+# /metrics: per-method Bot API time (inside the limiter, so one HTTP attempt each) and
+# per-handler run time on every event type
+bot.session.middleware(ApiMetrics())
+_handler_metrics = HandlerMetrics()
+for _name, _observer in dp.observers.items():
+    if _name != "update":
+        _observer.middleware(_handler_metrics)
+
+
+def _fsm_db_bytes() -> int:
+    return sum(os.path.getsize(p) for p in (FSM_DB_PATH, FSM_DB_PATH + "-wal") if os.path.exists(p))
+
+
+# /profile and GET /api/profile time these handlers while a profile runs
+app.profiler.dp = dp
+
+REGISTRY.gauge("asalboy_fsm_cached_sessions", "FSM records held in memory", lambda: fsm_storage.size)
+REGISTRY.gauge("asalboy_fsm_db_bytes", "FSM SQLite file size (WAL included)", _fsm_db_bytes)
+REGISTRY.counter_func("asalboy_fsm_ops", "FSM storage cache and write counters",
+                      lambda: [((k,), v) for k, v in fsm_storage.stats.items()], ("op",))
+REGISTRY.counter_func("asalboy_tg_api_limiter", "Bot API calls through the rate limiter: all, throttled, retried after 429, gave up",
+                      lambda: [((k,), rate_limiter.stats[k]) for k in ("calls", "throttled", "retried", "gave_up")], ("kind",))
+REGISTRY.counter_func("asalboy_tg_api_limiter_wait_seconds", "Time Bot API calls waited in the limiter, by reason",
+                      lambda: [(("throttle",), rate_limiter.stats["throttle_wait_s"]),
+                               (("retry_after",), rate_limiter.stats["retry_after_s"])], ("reason",))
+
+
+def is_admin(uid: int) -> bool:
+    return bool(ADMIN_USER_ID and uid == ADMIN_USER_ID)
+
+
+# ============ TRANSLATIONS ============
+TR = {
+    "uz": {
+        "welcome": "Assalomu alaykum! <b>Asalboy</b>ga xush kelibsiz.\nKatalog uchun <b>“Katalog”</b> yoki <b>“🛒 Interaktiv menyu”</b> tugmasini bosing.",
+        "menu": ["Katalog", "Savatcha", "Kontakt"],
+        "contact": "<b>Kontakt</b>\n📞 +998953442020\n📲 Instagram: @asalboy_att",
+        "choose_lang": "Bot tilini tanlang:",
+        "uzbek": "🇺🇿 O‘zbekcha",
+        "russian": "🇷🇺 Русский",
+        "price_kg_only": "Narx (1 kg): <b>{price}</b> so'm",
+        "no_products": "Hozircha mahsulotlar yo‘q.",
+        "cart_empty": "Savatcha bo'sh.",
+        "cart_total": "<b>Jami:</b> {total} so'm",
+        "name_ask": "Ismingizni kiriting:",
+        "name_short": "Ism juda qisqa. To‘liqroq kiriting.",
+        "phone_ask": "Telefon (masalan +998901234567):",
+        "phone_bad": "Telefon formati xato. Masalan: +998901234567",
+        "addr_ask": "Yetkazib berish manzili:",
+        "addr_short": "Manzil juda qisqa.",
+        "order_ok": "✅ Buyurtmangiz qabul qilindi! Tez orada bog‘lanamiz.",
+        "added": "{name} — {qty} ta (1 kg) savatchaga qo‘shildi. {price} so‘m",
+        "select": "Tanlash",
+        "qty": "Miqdor",
+        "add_to_cart": "➕ Savatchaga",
+        "back": "⬅️ Orqaga",
+        "checkout": "Checkout",
+        "clear_cart": "Clear cart",
+        "webapp": "🛒 Interaktiv menyu",
+        "phone_share": "📱 Telefon raqamingizni yuboring (tugma orqali yoki yozib):",
+        "loc_ask": "📍 Iltimos, lokatsiyangizni yuboring (tugma orqali):",
+        "loc_bad": "Lokatsiya olinmadi. 'Lokatsiyani yuborish' tugmasini bosing.",
+        "thanks": "✅ Rahmat! Buyurtmangiz qabul qilindi.",
+        "info_btn": "Asal haqida",
+        # New keys for WebApp keys
+        "ord_new": "🆕 WebApp buyurtma #{id}",
+        "ord_from": "👤 Kimdan: {name}",
+        "ord_user": "🧑‍💻 User: {user}",
+        "ord_phone": "📞 Telefon: {phone}",
+        "ord_addr": "🏠 Manzil: {addr}",
+        "ord_items": "🛒 Mahsulotlar:",
+        "ord_total": "<b>Jami:</b> {total} so'm",
+        "ord_map": "\n📍 <a href='{link}'>Google Xarita</a>",
+        "ord_received": "✅ WebApp orqali buyurtma qabul qilindi. Rahmat!",
+    },
+    "ru": {
+        "welcome": "Здравствуйте! Добро пожаловать в <b>Asalboy</b>.",
+        "menu": ["Каталог", "Корзина", "Контакт"],
+        "contact": "<b>Контакты</b>\n📞 +998953442020\n📲 Instagram: @asalboy_att",
+        "choose_lang": "Выберите язык:",
+        "uzbek": "🇺🇿 Узбекский",
+        "russian": "🇷🇺 Русский",
+        "price_kg_only": "Цена (1 кг): <b>{price}</b> сум",
+        "no_products": "Пока нет товаров.",
+        "cart_empty": "Корзина пустая.",
+        "cart_total": "<b>Итого:</b> {total} сум",
+        "name_ask": "Введите имя:",
+        "name_short": "Имя слишком короткое.",
+        "phone_ask": "Введите телефон (например +998901234567):",
+        "phone_bad": "Неверный формат телефона.",
+        "addr_ask": "Адрес доставки:",
+        "addr_short": "Адрес слишком короткий.",
+        "order_ok": "✅ Заказ принят! Мы скоро свяжемся.",
+        "added": "{name} — {qty} шт (1 кг) добавлен. {price} сум",
+        "select": "Выбрать",
+        "qty": "Кол-во",
+        "add_to_cart": "➕ В корзину",
+        "back": "⬅️ Назад",
+        "checkout": "Оформить",
+        "clear_cart": "Очистить",
+        "webapp": "🛒 Интерактивное меню",
+        "phone_share": "📱 Отправьте номер телефона (кнопкой или текстом):",
+        "loc_ask": "📍 Отправьте вашу геолокацию (кнопкой):",
+        "loc_bad": "Геолокация не получена.",
+        "thanks": "✅ Спасибо! Заказ принят.",
+        "info_btn": "О мёде",
+        # New keys for WebApp keys
+        "ord_new": "🆕 Заказ WebApp #{id}",
+        "ord_from": "👤 От: {name}",
+        "ord_user": "🧑‍💻 User: {user}",
+        "ord_phone": "📞 Телефон: {phone}",
+        "ord_addr": "🏠 Адрес: {addr}",
+        "ord_items": "🛒 Товары:",
+        "ord_total": "<b>Итого:</b> {total} сум",
+        "ord_map": "\n📍 <a href='{link}'>Google Maps</a>",
+        "ord_received": "✅ Заказ через WebApp принят. Спасибо!",
+    }
+}
+
+
+def t(lang, key, **kw):
+    lang = lang if lang in TR else "uz"
+    s = TR[lang].get(key, "")
+    return s.format(**kw) if kw else s
+
+
+# ============ DB ============
+# Opened here at the latest (lazy in app.py); handlers use the real object
+orders_repo = app.orders_repo.resolve()
+
+# Admin notifications are queued in the orders DB and sent by a background task
+ADMIN_MIN_INTERVAL = float(os.getenv("ADMIN_MIN_INTERVAL", "3"))
+ADMIN_DIGEST_THRESHOLD = int(os.getenv("ADMIN_DIGEST_THRESHOLD", "3"))
+admin_outbox = AdminOutbox(
+    orders_repo, bot,
+    min_interval=ADMIN_MIN_INTERVAL, digest_threshold=ADMIN_DIGEST_THRESHOLD,
+    poll_interval=SHARED_SYNC_SEC if SHARED_STATE else 30.0,
+    keep_days=float(os.getenv("OUTBOX_KEEP_DAYS", "7")),
+)
+
+# ============ PRODUCTS ============
+catalog = app.catalog.resolve()
+
+
+def find_product(pid) -> Optional[Dict[str, Any]]:
+    return catalog.get(pid)
+
+
+# ============ STATES ============
+class AdminAddProduct(StatesGroup):
+    waiting_photo = State()
+    waiting_name_uz = State()
+    waiting_desc_uz = State()
+    waiting_price = State()
+
+
+class ClassicCheckout(StatesGroup):
+    waiting_name = State()
+    waiting_phone = State()
+    waiting_address = State()
+
+
+class QuickCheckout(StatesGroup):
+    waiting_phone = State()
+    waiting_location = State()
+
+
+# ============ KEYBOARDS ============
+# Builders below are memoized per (kind, args) for the current catalog version; see
+# warm_render_cache(). TR is fixed at import: an in-place edit of it needs render_cache.invalidate()
+render_cache = RenderCache(lambda: catalog.version)
+
+
+@render_cache.cached("main")
+def main_kb(lang="uz") -> ReplyKeyboardMarkup:
+    labels = TR[lang]["menu"] if lang in TR else TR["uz"]["menu"]
+    # App URL with language query param
+    web_url = f"{APP_PUBLIC_URL}?lang={lang}"
+    
+    kb_rows = [
+        # [KeyboardButton(text=labels[0])],  <-- Removed Katalog
+        [KeyboardButton(text=labels[1])],
+        [KeyboardButton(text=labels[2])],
+        [KeyboardButton(text=t(lang, "webapp"), web_app=WebAppInfo(url=web_url))],
+    ]
+    return ReplyKeyboardMarkup(keyboard=kb_rows, resize_keyboard=True)
+
+
+@render_cache.cached("lang")
+def lang_select_kb() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text=TR["uz"]["uzbek"], callback_data="lang:uz")],
+            [InlineKeyboardButton(text=TR["ru"]["russian"], callback_data="lang:ru")],
+        ]
+    )
+
+
+@render_cache.cached("card")
+def product_inline_kb(pid: str, lang: str) -> InlineKeyboardMarkup:
+    """
+    Inline keyboard for product: Select + Asal haqida
+    - second button callback will be "info:{pid}" and handler will send full info
+    """
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [
+                InlineKeyboardButton(text=t(lang, "select"), callback_data=f"sel:{pid}"),
+                InlineKeyboardButton(text=t(lang, "info_btn"), callback_data=f"info:{pid}")
+            ]
+        ]
+    )
+
+
+# ---- catalog pages (carousel / album); built once per (catalog version, lang) ----
+CATALOG_MODE = os.getenv("CATALOG_MODE", "carousel")  # carousel | album | list
+ALBUM_SIZE = 10  # Telegram media group limit
+
+_catalog_pages: Dict[Tuple[int, str], Dict[str, Any]] = {}
+
+# Products without a Telegram file_id fall back to the WebApp's webapp/img/<id>.jpg; the
+# file_id Telegram returns for that upload is reused until the file changes
+PRODUCT_IMG_DIR = os.path.join("webapp", "img")
+_uploaded_photos: Dict[str, Tuple[int, str]] = {}  # pid -> (file mtime_ns, file_id)
+_bad_photos: set = set()  # file_ids / URLs Telegram rejected
+
+
+def product_photo(v: Dict[str, Any]):
+    """file_id, local FSInputFile or URL for a catalog view; None when it has no usable photo."""
+    photo = v["photo"]
+    if photo in _bad_photos:
+        photo = None
+    if photo and not photo.startswith(("http://", "https://")):
+        return photo  # Telegram file_id
+    path = os.path.join(PRODUCT_IMG_DIR, f"{v['id']}.jpg")
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return photo
+    known = _uploaded_photos.get(v["id"])
+    if known and known[0] == mtime:
+        return known[1]
+    return FSInputFile(path)
+
+
+def remember_photo(v: Dict[str, Any], photo, sent) -> None:
+    """Keep the file_id of a local photo Telegram has just accepted."""
+    if isinstance(photo, FSInputFile) and getattr(sent, "photo", None):
+        try:
+            _uploaded_photos[v["id"]] = (os.stat(photo.path).st_mtime_ns, sent.photo[-1].file_id)
+        except OSError:
+            pass
+
+
+_PHOTO_ERRORS = ("file", "url", "photo", "image", "media", "web page")
+
+
+def reject_photo(v: Dict[str, Any], photo, e: Exception) -> None:
+    """Stop offering a photo Telegram refused (network errors and 429s are retried next time)."""
+    logging.warning("Mahsulot rasmi yuborilmadi (%s): %s", v["id"], e)
+    if not isinstance(e, TelegramBadRequest) or not any(w in str(e).lower() for w in _PHOTO_ERRORS):
+        return
+    known = _uploaded_photos.get(v["id"])
+    if known and known[1] == photo:
+        del _uploaded_photos[v["id"]]  # upload the local file again
+    elif isinstance(photo, str):
+        _bad_photos.add(photo)
+
+
+def catalog_caption(v: Dict[str, Any], lang: str) -> str:
+    price_text = t(lang, "price_kg_only", price=v["price"])
+    return f"<b>{html.quote(v['name'])}</b>\n{html.quote(v['desc'])}\n\n{price_text}"
+
+
+def carousel_kb(idx: int, total: int, pid: str, lang: str) -> InlineKeyboardMarkup:
+    rows = product_inline_kb(pid, lang).inline_keyboard
+    nav = [
+        InlineKeyboardButton(text="◀️", callback_data=f"cat:{(idx - 1) % total}"),
+        InlineKeyboardButton(text=f"{idx + 1}/{total}", callback_data="noop"),
+        InlineKeyboardButton(text="▶️", callback_data=f"cat:{(idx + 1) % total}"),
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=[*rows, nav])
+
+
+def catalog_pages(lang: str) -> Dict[str, Any]:
+    """Captions, carousel keyboards and the album picker for the current catalog version."""
+    key = (catalog.version, lang)
+    pages = _catalog_pages.get(key)
+    if pages is None:
+        views = catalog.visible(lang)
+        total = len(views)
+        pages = {
+            "views": views,
+            "index": {v["id"]: i for i, v in enumerate(views)},
+            "captions": [catalog_caption(v, lang) for v in views],
+            "kbs": [carousel_kb(i, total, v["id"], lang) for i, v in enumerate(views)],
+        }
+        pages["album_pick_kb"] = InlineKeyboardMarkup(
+            inline_keyboard=[
+                [InlineKeyboardButton(text=v["name"], callback_data=f"cat:{i}:open")]
+                for i, v in enumerate(views)
+            ]
+        )
+        # Old catalog versions are never needed again; the other language's pages still are
+        for old in [k for k in _catalog_pages if k[0] != key[0]]:
+            del _catalog_pages[old]
+        _catalog_pages[key] = pages
+    return pages
+
+
+def card_kb(pid: str, lang: str) -> InlineKeyboardMarkup:
+    """Keyboard a product card returns to after "Orqaga"."""
+    if CATALOG_MODE != "list":
+        pages = catalog_pages(lang)
+        idx = pages["index"].get(pid)
+        if idx is not None:
+            return pages["kbs"][idx]
+    return product_inline_kb(pid, lang)
+
+
+@render_cache.cached("sel")
+def selection_menu_kb(pid: str, qty: int, lang: str) -> InlineKeyboardMarkup:
+    qbtn = InlineKeyboardButton(text=f"{t(lang,'qty')}: {qty}", callback_data="noop")
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [
+                InlineKeyboardButton(text="−", callback_data=f"qdec:{pid}:{qty}"),
+                qbtn,
+                InlineKeyboardButton(text="+", callback_data=f"qinc:{pid}:{qty}"),
+            ],
+            [
+                InlineKeyboardButton(
+                    text=t(lang, "add_to_cart"),
+                    callback_data=f"addsel:{pid}:{qty}",
+                )
+            ],
+            [InlineKeyboardButton(text=t(lang, "back"), callback_data=f"back:{pid}")],
+        ]
+    )
+
+
+@render_cache.cached("cart")
+def cart_kb(lang: str) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text=t(lang, "checkout"), callback_data="checkout")],
+            [
+                InlineKeyboardButton(
+                    text=t(lang, "clear_cart"), callback_data="clear_cart"
+                )
+            ],
+        ]
+    )
+
+
+@render_cache.cached("phone")
+def share_phone_kb(lang: str) -> ReplyKeyboardMarkup:
+    label = "📱 Telefonni yuborish" if lang == "uz" else "📱 Отправить телефон"
+    return ReplyKeyboardMarkup(
+        keyboard=[[KeyboardButton(text=label, request_contact=True)]],
+        resize_keyboard=True,
+    )
+
+
+@render_cache.cached("location")
+def share_location_kb(lang: str) -> ReplyKeyboardMarkup:
+    label = (
+        "📍 Lokatsiyani yuborish"
+        if lang == "uz"
+        else "📍 Отправить локацию"
+    )
+    return ReplyKeyboardMarkup(
+        keyboard=[[KeyboardButton(text=label, request_location=True)]],
+        resize_keyboard=True,
+    )
+
+
+WARM_QTY = 10  # selection keyboards prebuilt for qty 1..WARM_QTY; higher ones on first use
+
+
+def warm_render_cache() -> int:
+    calls = [(lang_select_kb, ())]
+    for lang in TR:
+        calls += [(main_kb, (lang,)), (cart_kb, (lang,)), (share_phone_kb, (lang,)), (share_location_kb, (lang,))]
+        for v in catalog.visible(lang):
+            calls.append((product_inline_kb, (v["id"], lang)))
+            calls += [(selection_menu_kb, (v["id"], q, lang)) for q in range(1, WARM_QTY + 1)]
+    n = render_cache.warm(calls)
+    for lang in TR:
+        catalog_pages(lang)
+    return n
+
+
+# ============ HELPERS ============
+PHONE_RE =  r"^\+?\d{9,15}$"
+import re as _re
+PHONE_RE = _re.compile(PHONE_RE)
+
+
+def get_lang(sd: dict) -> str:
+    return sd.get("lang") or LANG_DEFAULT or "uz"
+
+
+async def save_order_to_db(
+    user_id,
+    name,
+    phone,
+    address,
+    cart,
+    total,
+    lat: Optional[float] = None,
+    lon: Optional[float] = None,
+    lang: Optional[str] = None,
+) -> int:
+    # Runs on the orders writer thread; the event loop only awaits the result
+    with ORDER_INSERT_SECONDS.time():
+        return await orders_repo.insert_order(
+            user_id, name, phone, address, cart, total, lat, lon, lang
+        )
+
+
+# ============ COMMON UTILS ============
+@dp.message(Command("whoami"))
+async def whoami(message: Message):
+    await message.answer(
+        f"🆔 user_id: <code>{message.from_user.id}</code>\n"
+        f"👥 chat_id: <code>{message.chat.id}</code>\n"
+        f"⚙️ ADMIN_CHAT_ID: <code>{ADMIN_CHAT_ID}</code>"
+    )
+
+
+@dp.message(Command("testadmin"))
+async def testadmin(message: Message):
+    try:
+        await bot.send_message(ADMIN_CHAT_ID, "✅ Admin chat sinovi")
+        await message.answer("Yuborildi.")
+    except Exception as e:
+        await message.answer(f"❌ Yuborilmadi: {e}")
+
+
+# ============ HANDLERS ============
+@dp.message(Command("start"))
+async def cmd_start(message: Message, state: FSMContext):
+    await message.answer(t("uz", "choose_lang"), reply_markup=lang_select_kb())
+
+
+@dp.callback_query(F.data.startswith("lang:"))
+async def set_lang(callback: types.CallbackQuery, state: FSMContext):
+    _, lang = callback.data.split(":")
+    await state.update_data(lang=lang)
+    await callback.answer("OK")
+    await callback.message.answer(t(lang, "welcome"), reply_markup=main_kb(lang))
+
+
+@dp.message(F.text.lower().in_(["kontakt", "контакт"]))
+async def contact_info(message: Message, state: FSMContext):
+    s = await state.get_data()
+    lang = get_lang(s)
+    await message.answer(t(lang, "contact"))
+
+
+@dp.message(F.text.lower().in_(["katalog", "каталог"]))
+async def show_catalog(message: Message, state: FSMContext):
+    s = await state.get_data()
+    lang = get_lang(s)
+    if not catalog.visible(lang):
+        await message.answer(t(lang, "no_products"))
+        return
+    if CATALOG_MODE == "carousel":
+        # One photo message; ◀️/▶️ edit it in place
+        await send_catalog_page(message, 0, lang)
+        return
+    if CATALOG_MODE == "album":
+        pages = catalog_pages(lang)
+        await send_catalog_albums(message, pages)
+        # every product, with or without a photo, is in the picker
+        await message.answer(t(lang, "select"), reply_markup=pages["album_pick_kb"])
+        return
+    # legacy "list" mode: one photo per product
+    pages = catalog_pages(lang)
+    for v, caption in zip(pages["views"], pages["captions"]):
+        photo = product_photo(v)
+        kb = product_inline_kb(v["id"], lang)
+        if photo is not None:
+            try:
+                remember_photo(v, photo, await message.answer_photo(photo, caption=caption, reply_markup=kb))
+                await asyncio.sleep(0.03)
+                continue
+            except Exception as e:
+                reject_photo(v, photo, e)
+        # fallback to plain text
+        await message.answer(caption, reply_markup=kb)
+        await asyncio.sleep(0.03)
+
+
+async def send_catalog_albums(message: Message, pages: Dict[str, Any]):
+    items = []
+    for v, caption in zip(pages["views"], pages["captions"]):
+        photo = product_photo(v)
+        if photo is not None:
+            items.append((v, photo, caption))
+    for i in range(0, len(items), ALBUM_SIZE):
+        chunk = items[i:i + ALBUM_SIZE]
+        if len(chunk) > 1:  # a media group needs 2..10 items
+            try:
+                sent = await message.answer_media_group(
+                    [InputMediaPhoto(media=photo, caption=caption) for _, photo, caption in chunk]
+                )
+                for (v, photo, _), m in zip(chunk, sent):
+                    remember_photo(v, photo, m)
+                continue
+            except Exception as e:
+                logging.warning("Albom yuborilmadi, rasmlar birma-bir yuboriladi: %s", e)
+        # One bad photo fails the whole group: send them one by one so only that one is lost
+        for v, photo, caption in chunk:
+            try:
+                remember_photo(v, photo, await message.answer_photo(photo, caption=caption))
+            except Exception as e:
+                reject_photo(v, photo, e)
+
+
+async def send_catalog_page(message: Message, idx: int, lang: str):
+    pages = catalog_pages(lang)
+    v = pages["views"][idx]
+    caption, kb = pages["captions"][idx], pages["kbs"][idx]
+    photo = product_photo(v)
+    if photo is not None:
+        try:
+            return remember_photo(v, photo, await message.answer_photo(photo, caption=caption, reply_markup=kb))
+        except Exception as e:
+            reject_photo(v, photo, e)
+    await message.answer(caption, reply_markup=kb)
+
+
+async def edit_catalog_page(message: Message, idx: int, lang: str):
+    """Turn the carousel message into page idx, in place whenever Telegram allows it."""
+    pages = catalog_pages(lang)
+    v = pages["views"][idx]
+    caption, kb = pages["captions"][idx], pages["kbs"][idx]
+    photo = product_photo(v)
+    if (photo is not None) != bool(message.photo):
+        # photo <-> text page: a message cannot change its type, so replace it
+        try:
+            await message.delete()
+        except TelegramBadRequest:
+            pass
+        return await send_catalog_page(message, idx, lang)
+    try:
+        if photo is None:
+            await message.edit_text(caption, reply_markup=kb)
+        else:
+            remember_photo(v, photo, await message.edit_media(
+                InputMediaPhoto(media=photo, caption=caption), reply_markup=kb
+            ))
+        return
+    except TelegramBadRequest as e:
+        if "not modified" in str(e):
+            return
+        if photo is None:
+            return logging.warning("Katalog sahifasi yangilanmadi (%s): %s", v["id"], e)
+        reject_photo(v, photo, e)
+    # Photo rejected: keep the current picture but still move the caption and ◀️/▶️ on
+    try:
+        await message.edit_caption(caption=caption, reply_markup=kb)
+    except TelegramBadRequest as e:
+        logging.warning("Katalog sahifasi yangilanmadi (%s): %s", v["id"], e)
+
+
+@dp.callback_query(F.data.startswith("cat:"))
+async def catalog_page(callback: types.CallbackQuery, state: FSMContext):
+    s = await state.get_data()
+    lang = get_lang(s)
+    pages = catalog_pages(lang)
+    if not pages["views"]:
+        return await callback.answer(t(lang, "no_products"))
+    # index may be stale after a catalog reload — wrap around
+    parts = callback.data.split(":")
+    idx = int(parts[1]) % len(pages["views"])
+    await callback.answer()
+    if parts[2:] == ["open"]:
+        # album mode picker -> open the carousel at this product
+        return await send_catalog_page(callback.message, idx, lang)
+    await edit_catalog_page(callback.message, idx, lang)
+
+
+@dp.callback_query(F.data == "noop")
+async def noop_cb(callback: types.CallbackQuery):
+    await callback.answer()
+
+
+# ====== INFO CALLBACK: single-step (Asal haqida => full info) ======
+@dp.callback_query(F.data.startswith("info:"))
+async def show_info_full(callback: types.CallbackQuery, state: FSMContext):
+    """
+    When user presses "Asal haqida", send full info (info_full).
+    Fallback: try info_short, desc_uz/desc_ru, or default message.
+    """
+    s = await state.get_data()
+    lang = get_lang(s)
+    _, pid = callback.data.split(":")
+    await callback.answer()
+    v = catalog.view(pid, lang)
+    # view["full"] already falls back to info_short / desc_uz / desc_ru
+    full = v["full"] if v else ""
+    if not full:
+        full = "Ma'lumot mavjud emas."
+    # Send full info as a message (may be long)
+    await callback.message.answer(full)
+
+
+# ====== EXISTING CALLBACKS (selection, qty, add to cart, back) ======
+@dp.callback_query(F.data.startswith("sel:"))
+async def select_qty(callback: types.CallbackQuery, state: FSMContext):
+    s = await state.get_data()
+    lang = get_lang(s)
+    _, pid = callback.data.split(":")
+    await callback.answer()
+    await qty_stepper.discard(state, callback.message.chat.id, callback.message.message_id)
+    await callback.message.edit_reply_markup(
+        reply_markup=selection_menu_kb(pid, 1, lang)
+    )
+
+
+def clamp(q: int) -> int:
+    return max(1, min(99, q))
+
+
+# "+"/"−" taps are answered at once; the keyboard is edited once per burst of taps. With
+# several workers the quantity is kept in the shared FSM row and each tap edits at once.
+QTY_DEBOUNCE_MS = float(os.getenv("QTY_DEBOUNCE_MS", "400"))
+if SHARED_STATE:
+    qty_stepper = SharedQtyStepper(bot, selection_menu_kb)
+else:
+    qty_stepper = QtyStepper(bot, selection_menu_kb, delay=QTY_DEBOUNCE_MS / 1000)
+
+
+async def _qty_step(callback: types.CallbackQuery, state: FSMContext, delta: int):
+    s = await state.get_data()
+    lang = get_lang(s)
+    _, pid, raw = callback.data.split(":")
+    msg = callback.message
+    qty = await qty_stepper.tap(state, msg.chat.id, msg.message_id, pid, int(raw), delta, lang)
+    await callback.answer(f"{t(lang, 'qty')}: {qty}")
+
+
+@dp.callback_query(F.data.startswith("qinc:"))
+async def qty_inc(callback: types.CallbackQuery, state: FSMContext):
+    await _qty_step(callback, state, +1)
+
+
+@dp.callback_query(F.data.startswith("qdec:"))
+async def qty_dec(callback: types.CallbackQuery, state: FSMContext):
+    await _qty_step(callback, state, -1)
+
+
+@dp.callback_query(F.data.startswith("addsel:"))
+async def add_selected(callback: types.CallbackQuery, state: FSMContext):
+    s = await state.get_data()
+    lang = get_lang(s)
+    _, pid, raw = callback.data.split(":")
+    # a debounced edit may not have landed yet: the stepper has the real quantity
+    pending = await qty_stepper.current(state, callback.message.chat.id, callback.message.message_id, pid)
+    qty = clamp(pending if pending is not None else int(raw))
+    await qty_stepper.discard(state, callback.message.chat.id, callback.message.message_id)
+    p = find_product(pid)
+    if not p:
+        await callback.answer("Not found")
+        return
+    one = unit_price_1kg(p)
+    total = one * qty
+    cart = s.get("cart", [])
+    cart.append(
+        {
+            "product_id": str(p.get("id")),
+            "name": p.get("name_uz") if lang == "uz" else p.get("name_ru"),
+            "kg": 1.0,
+            "qty": qty,
+            "unit_price": one,
+            "price": total,
+        }
+    )
+    await state.update_data(cart=cart)
+    await callback.answer("OK")
+    await callback.message.answer(
+        t(
+            lang,
+            "added",
+            name=p.get("name_uz") if lang == "uz" else p.get("name_ru"),
+            qty=qty,
+            price=total,
+        )
+    )
+    # Tezkor checkoutni boshlash: telefon so'raymiz
+    await callback.message.answer(
+        t(lang, "phone_share"), reply_markup=share_phone_kb(lang)
+    )
+    await state.set_state(QuickCheckout.waiting_phone)
+
+
+@dp.callback_query(F.data.startswith("back:"))
+async def back_to_card(callback: types.CallbackQuery, state: FSMContext):
+    s = await state.get_data()
+    lang = get_lang(s)
+    _, pid = callback.data.split(":")
+    await callback.answer()
+    await qty_stepper.discard(state, callback.message.chat.id, callback.message.message_id)
+    await callback.message.edit_reply_markup(
+        reply_markup=card_kb(pid, lang)
+    )
+
+
+@dp.message(F.text.lower().in_(["savatcha", "корзина"]))
+async def show_cart(message: Message, state: FSMContext):
+    s = await state.get_data()
+    lang = get_lang(s)
+    cart = s.get("cart", [])
+    if not cart:
+        await message.answer(t(lang, "cart_empty"))
+        return
+    total = sum(i["price"] for i in cart)
+    rows = []
+    for i, it in enumerate(cart, 1):
+        rows.append(
+            f"{i}. {it['name']} — 1 kg x{it.get('qty',1)} — {it['price']} so'm"
+        )
+    text = "\n".join(rows) + f"\n\n{t(lang,'cart_total', total=total)}"
+    await message.answer(text, reply_markup=cart_kb(lang))
+
+
+@dp.callback_query(F.data == "clear_cart")
+async def clear_cart_cb(callback: types.CallbackQuery, state: FSMContext):
+    await state.update_data(cart=[])
+    await callback.message.answer("OK")
+
+
+# ====== KLASSIK CHECKOUT (optional) ======
+@dp.callback_query(F.data == "checkout")
+async def checkout_start(callback: types.CallbackQuery, state: FSMContext):
+    s = await state.get_data()
+    lang = get_lang(s)
+    cart = s.get("cart", [])
+    if not cart:
+        await callback.message.answer(t(lang, "cart_empty"))
+        return
+    await callback.message.answer(t(lang, "name_ask"))
+    await state.set_state(ClassicCheckout.waiting_name)
+
+
+@dp.message(StateFilter(ClassicCheckout.waiting_name))
+async def cs_name(message: Message, state: FSMContext):
+    s = await state.get_data()
+    lang = get_lang(s)
+    name = (message.text or "").strip()
+    if len(name) < 2:
+        await message.answer(t(lang, "name_short"))
+        return
+    await state.update_data(checkout_name=name)
+    await message.answer(t(lang, "phone_ask"))
+    await state.set_state(ClassicCheckout.waiting_phone)
+
+
+@dp.message(StateFilter(ClassicCheckout.waiting_phone))
+async def cs_phone(message: Message, state: FSMContext):
+    s = await state.get_data()
+    lang = get_lang(s)
+    phone = (message.text or "").strip()
+    if not PHONE_RE.match(phone):
+        await message.answer(t(lang, "phone_bad"))
+        return
+    await state.update_data(checkout_phone=phone)
+    await message.answer(t(lang, "addr_ask"))
+    await state.set_state(ClassicCheckout.waiting_address)
+
+
+@dp.message(StateFilter(ClassicCheckout.waiting_address))
+async def cs_addr(message: Message, state: FSMContext):
+    s = await state.get_data()
+    lang = get_lang(s)
+    address = (message.text or "").strip()
+    if len(address) < 5:
+        await message.answer(t(lang, "addr_short"))
+        return
+    data = await state.get_data()
+    name = data.get("checkout_name")
+    phone = data.get("checkout_phone")
+    cart = data.get("cart", [])
+    total = sum(i["price"] for i in cart)
+    order_id = await save_order_to_db(
+        message.from_user.id, name, phone, address, cart, total, lang=lang
+    )
+
+    txt = (
+        f"🆕 Buyurtma #{order_id}\n"
+        f"👤 From: {name}\n"
+        f"🧑‍💻 User: @{message.from_user.username or 'N/A'} ({message.from_user.id})\n"
+        f"📞 Phone: {phone}\n"
+        f"🏠 Address: {address}\n\n🛒 Items:\n"
+    )
+    for it in cart:
+        txt += (
+            f"• {it['name']} — 1 kg x{it.get('qty',1)} — {it['price']} so'm\n"
+        )
+    txt += f"\n<b>Jami:</b> {total} so'm"
+    if ADMIN_CHAT_ID:
+        try:
+            await admin_outbox.send_message(ADMIN_CHAT_ID, txt)
+        except Exception:
+            logging.exception("Adminga yuborilmadi (klassik)")
+    await message.answer(t(lang, "order_ok"))
+    await state.update_data(cart=[])
+    await state.clear()
+
+
+# ====== TEZKOR CHECKOUT: Telefon → Geo ======
+@dp.message(StateFilter(QuickCheckout.waiting_phone))
+async def qc_phone(message: Message, state: FSMContext):
+    s = await state.get_data()
+    lang = get_lang(s)
+    if message.contact:
+        phone = (message.contact.phone_number or "").strip()
+        name = (
+            (message.contact.first_name or "")
+            + (" " + (message.contact.last_name or "")).rstrip()
+        )
+        name = name.strip() or (message.from_user.full_name or "")
+    else:
+        raw = (message.text or "").strip()
+        if not PHONE_RE.match(raw):
+            await message.answer(t(lang, "phone_bad"))
+            return
+        phone = raw
+        name = message.from_user.full_name or ""
+    await state.update_data(qc_phone=phone, qc_name=name)
+    await message.answer(
+        t(lang, "loc_ask"), reply_markup=share_location_kb(lang)
+    )
+    await state.set_state(QuickCheckout.waiting_location)
+
+
+@dp.message(StateFilter(QuickCheckout.waiting_location))
+async def qc_location(message: Message, state: FSMContext):
+    s = await state.get_data()
+    lang = get_lang(s)
+    if not message.location:
+        await message.answer(
+            t(lang, "loc_bad"), reply_markup=share_location_kb(lang)
+        )
+        return
+    lat, lon = message.location.latitude, message.location.longitude
+    cart = s.get("cart", [])
+    if not cart:
+        await message.answer(t(lang, "cart_empty"))
+        await state.clear()
+        return
+    total = sum(i["price"] for i in cart)
+    name = s.get("qc_name") or (message.from_user.full_name or "")
+    phone = s.get("qc_phone") or ""
+    address = f"geo:{lat},{lon}"
+    order_id = await save_order_to_db(
+        message.from_user.id, name, phone, address, cart, total, lat, lon, lang=lang
+    )
+
+    link = f"https://maps.google.com/?q={lat},{lon}"
+    txt = (
+        f"🆕 Quick buyurtma #{order_id}\n"
+        f"👤 From: {name}\n"
+        f"🧑‍💻 User: @{message.from_user.username or 'N/A'} ({message.from_user.id})\n"
+        f"📞 Phone: {phone}\n"
+        f"📍 Geo: {lat:.6f}, {lon:.6f}\n{link}\n\n🛒 Items:\n"
+    )
+    for it in cart:
+        txt += (
+            f"• {it['name']} — 1 kg x{it['qty']} — {it['price']} so'm\n"
+        )
+    txt += f"\n<b>Jami:</b> {total} so'm"
+
+    if ADMIN_CHAT_ID:
+        try:
+            await admin_outbox.send_message(
+                ADMIN_CHAT_ID, txt, disable_web_page_preview=True
+            )
+            await admin_outbox.send_location(
+                ADMIN_CHAT_ID, latitude=lat, longitude=lon
+            )  # jonli pin
+        except Exception:
+            logging.exception("Adminga yuborilmadi (quick)")
+
+    await message.answer(t(lang, "thanks"), reply_markup=main_kb(lang))
+    await state.update_data(cart=[])
+    await state.clear()
+
+
+# ====== ADMIN: addproduct ======
+@dp.message(Command("addproduct"))
+async def addproduct(message: Message, state: FSMContext):
+    if not is_admin(message.from_user.id):
+        return await message.reply("Siz admin emassiz.")
+    await message.reply("🖼 Rasm yuboring (photo yoki URL):")
+    await state.set_state(AdminAddProduct.waiting_photo)
+
+
+@dp.message(StateFilter(AdminAddProduct.waiting_photo))
+async def ap1(message: Message, state: FSMContext):
+    if message.photo:
+        await state.update_data(photo=message.photo[-1].file_id)
+    else:
+        await state.update_data(photo=(message.text or "").strip())
+    await message.answer("📝 Nomi (o‘zbekcha):")
+    await state.set_state(AdminAddProduct.waiting_name_uz)
+
+
+@dp.message(StateFilter(AdminAddProduct.waiting_name_uz))
+async def ap2(message: Message, state: FSMContext):
+    await state.update_data(name_uz=(message.text or "").strip())
+    await message.answer("✍️ Ta’rif (o‘zbekcha), ixtiyoriy:")
+    await state.set_state(AdminAddProduct.waiting_desc_uz)
+
+
+@dp.message(StateFilter(AdminAddProduct.waiting_desc_uz))
+async def ap3(message: Message, state: FSMContext):
+    await state.update_data(desc_uz=(message.text or "").strip())
+    await message.answer(
+        "💰 Narx (1 kg, so‘m) — faqat son, masalan 350000"
+    )
+    await state.set_state(AdminAddProduct.waiting_price)
+
+
+@dp.message(StateFilter(AdminAddProduct.waiting_price))
+async def ap4(message: Message, state: FSMContext):
+    try:
+        price = int((message.text or "").strip())
+    except Exception:
+        return await message.answer(
+            "Faqat son kiriting (masalan 350000)."
+        )
+    d = await state.get_data()
+    new_id = catalog.next_id()
+    prod = {
+        "id": new_id,
+        "name_uz": d.get("name_uz") or "Nomsiz",
+        "name_ru": d.get("name_uz") or "Без названия",
+        "desc_uz": d.get("desc_uz") or "",
+        "desc_ru": d.get("desc_uz") or "",
+        "price_1": price,
+        "photo": d.get("photo"),
+        "available": True,
+        "info_short": d.get("desc_uz") or "",
+        "info_full": d.get("desc_uz") or "",
+    }
+    # writes products.json atomically and bumps catalog.version
+    catalog.add(prod)
+    await message.answer(
+        f"✅ Qo‘shildi: <b>{html.quote(prod['name_uz'])}</b> (1 kg: {price} so‘m)\nID: {new_id}"
+    )
+    await state.clear()
+
+
+ORDERS_PAGE_SIZE = int(os.getenv("ORDERS_PAGE_SIZE", "20"))
+# callback_data is capped at 64 bytes, so ◀️/▶️ carry a short token for the filter text;
+# the texts live in the FSM storage (per chat, own destiny), which every worker shares
+ORDER_FILTERS_KEPT = 32
+
+
+def _filter_token(args: str) -> str:
+    return hashlib.sha1(args.encode("utf-8")).hexdigest()[:10] if args else "-"
+
+
+def _filter_store(state: FSMContext) -> FSMContext:
+    k = state.key
+    return FSMContext(state.storage, StorageKey(k.bot_id, k.chat_id, k.chat_id, destiny="listorders"))
+
+
+async def _remember_filter(state: FSMContext, args: str) -> None:
+    if not args:
+        return
+    store = _filter_store(state)
+    kept = await store.get_data()
+    token = _filter_token(args)
+    kept.pop(token, None)
+    kept[token] = args
+    await store.set_data(dict(list(kept.items())[-ORDER_FILTERS_KEPT:]))
+
+
+def order_line(r) -> str:
+    _id, uname, phone, total, ts, lat, lon = r
+    geo = (
+        f" ({lat:.5f},{lon:.5f})"
+        if (lat is not None and lon is not None)
+        else ""
+    )
+    return f"#{_id} — {uname} — {phone} — {total} — {ts}{geo}"
+
+
+async def orders_page_view(args: str, before: Optional[int] = None, after: Optional[int] = None):
+    flt = OrderFilter.parse(args)
+    rows, has_older, has_newer = await orders_repo.page(flt, before, after, ORDERS_PAGE_SIZE)
+    if not rows:
+        return "Buyurtma yo‘q.", None
+    head = "🧾 Buyurtmalar" + (f" ({html.quote(flt.describe())})" if flt else "") + ":\n"
+    text = head + "\n".join(html.quote(order_line(r)) for r in rows)
+    token = _filter_token(args)
+    nav = []
+    if has_newer:
+        nav.append(InlineKeyboardButton(text="◀️ Yangiroq", callback_data=f"lo:{token}:n:{rows[0][0]}"))
+    if has_older:
+        nav.append(InlineKeyboardButton(text="Eskiroq ▶️", callback_data=f"lo:{token}:o:{rows[-1][0]}"))
+    return text, (InlineKeyboardMarkup(inline_keyboard=[nav]) if nav else None)
+
+
+@dp.message(Command("listorders"))
+async def listorders(message: Message, command: CommandObject, state: FSMContext):
+    # /listorders [user:<id>] [phone:<raqam>] [product:<id>] [from:YYYY-MM-DD] [to:YYYY-MM-DD] [qidiruv so‘zlari]
+    if not is_admin(message.from_user.id):
+        return await message.reply("Siz admin emassiz.")
+    args = (command.args or "").strip()
+    try:
+        text, kb = await orders_page_view(args)
+    except ValueError:
+        return await message.answer(
+            "Filtr xato. Masalan: /listorders user:123 phone:998901234567 product:p1 "
+            "from:2025-01-01 to:2025-01-31 Ali"
+        )
+    if kb is not None:
+        await _remember_filter(state, args)
+    await message.answer(text, reply_markup=kb)
+
+
+@dp.callback_query(F.data.startswith("lo:"))
+async def listorders_page(callback: types.CallbackQuery, state: FSMContext):
+    if not is_admin(callback.from_user.id):
+        return await callback.answer("Siz admin emassiz.", show_alert=True)
+    _, token, direction, cursor = callback.data.split(":")
+    args = "" if token == "-" else (await _filter_store(state).get_data()).get(token)
+    if args is None:
+        return await callback.answer("Filtr eskirgan, /listorders ni qayta yuboring.", show_alert=True)
+    cursor = int(cursor)
+    text, kb = await orders_page_view(
+        args, before=cursor if direction == "o" else None, after=cursor if direction == "n" else None
+    )
+    await callback.answer()
+    try:
+        await callback.message.edit_text(text, reply_markup=kb)
+    except Exception:
+        logging.exception("Buyurtmalar sahifasi yangilanmadi")
+
+
+def stats_range(arg: str) -> Tuple[str, str, str]:
+    """/stats argument -> (from, to, title); days are shop-local, both ends inclusive."""
+    end = today()
+    arg = (arg or "").strip().lower()
+    if arg in ("", "week", "hafta"):
+        return (end - timedelta(days=6)).isoformat(), end.isoformat(), "so‘nggi 7 kun"
+    if arg in ("today", "bugun"):
+        return end.isoformat(), end.isoformat(), "bugun"
+    if arg in ("month", "oy"):
+        return end.replace(day=1).isoformat(), end.isoformat(), "shu oy"
+    if arg.isdigit() and 0 < int(arg) <= 3660:
+        return (end - timedelta(days=int(arg) - 1)).isoformat(), end.isoformat(), f"so‘nggi {arg} kun"
+    if ":" in arg:
+        a, b = arg.split(":", 1)
+        d1, d2 = date.fromisoformat(a), date.fromisoformat(b)
+        return d1.isoformat(), d2.isoformat(), f"{d1} — {d2}"
+    raise ValueError(arg)
+
+
+@dp.message(Command("stats"))
+async def stats_cmd(message: Message, command: CommandObject):
+    # /stats [bugun|hafta|oy|<N kun>|YYYY-MM-DD:YYYY-MM-DD] — read from rollups only
+    if not is_admin(message.from_user.id):
+        return await message.reply("Siz admin emassiz.")
+    try:
+        d1, d2, title = stats_range(command.args)
+    except ValueError:
+        return await message.answer("Masalan: /stats, /stats bugun, /stats oy, /stats 30, /stats 2025-01-01:2025-01-31")
+    st = await orders_repo.read(lambda con: query_stats(con, d1, d2))
+    lines = [
+        f"📊 <b>Statistika</b> ({title})",
+        f"Buyurtmalar: <b>{st['orders']}</b>",
+        f"Tushum: <b>{st['revenue']}</b> so'm",
+    ]
+    if st["by_product"]:
+        lines.append("\n🍯 Mahsulotlar:")
+        for pid, n_orders, qty, kg, revenue in st["by_product"][:15]:
+            v = catalog.view(pid, "uz")
+            name = html.quote(v["name"]) if v else pid
+            lines.append(f"• {name}: {kg:g} kg ({n_orders} ta buyurtma) — {revenue} so'm")
+    if st["by_lang"]:
+        lines.append("\n🌐 Til bo‘yicha: " + ", ".join(f"{lang}: {n} ta" for lang, n, _ in st["by_lang"]))
+    if len(st["by_day"]) > 1:
+        lines.append("\n📅 Kunlar:")
+        lines += [f"{day}: {n} ta — {revenue} so'm" for day, n, revenue in st["by_day"][-31:]]
+    await message.answer("\n".join(lines))
+
+
+# /export builds the file here, then sends it as a document (bots may send up to 50 MB)
+EXPORT_DIR = os.getenv("EXPORT_DIR", "data/exports")
+TG_DOCUMENT_LIMIT = 50 * 1024 * 1024
+
+
+@dp.message(Command("export"))
+async def export_cmd(message: Message, command: CommandObject):
+    # /export [YYYY-MM-DD [YYYY-MM-DD]] [csv|jsonl] [gz]
+    if not is_admin(message.from_user.id):
+        return await message.reply("Siz admin emassiz.")
+    words = (command.args or "").split()
+    dates = [w for w in words if w[:1].isdigit()]
+    fmt = "jsonl" if "jsonl" in words else "csv"
+    try:
+        exp = OrderExport(
+            orders_repo,
+            dates[0] if dates else None,
+            dates[1] if len(dates) > 1 else (dates[0] if dates else None),
+            fmt,
+            gzip="gz" in words or "gzip" in words,
+        )
+    except ValueError:
+        return await message.answer("Masalan: /export 2025-01-01 2025-01-31 csv gz")
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    path = os.path.join(EXPORT_DIR, f"{message.message_id}_{exp.filename}")
+    try:
+        # streamed to disk chunk by chunk, then uploaded from the file (never held in memory)
+        rows = await exp.to_file(path)
+        if exp.bytes > TG_DOCUMENT_LIMIT:
+            return await message.answer(
+                f"Fayl juda katta ({exp.bytes // 1024 // 1024} MB). «gz» qo‘shing yoki /api/orders/export dan foydalaning."
+            )
+        await message.answer_document(
+            FSInputFile(path, filename=exp.filename), caption=f"🧾 {rows} ta buyurtma"
+        )
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# /profile runs detached from the command; the loop only keeps weak references to tasks
+_profile_tasks = set()
+
+
+async def _run_profile(chat_id: int, seconds: float):
+    try:
+        report = await app.profiler.run(seconds)
+    except Exception as e:
+        logging.exception("Profile failed")
+        return await bot.send_message(chat_id, f"Profil xatosi: {e}")
+    name = f"profile-{app.WORKER_ID}-{time.strftime('%Y%m%d-%H%M%S')}.folded"
+    await bot.send_document(
+        chat_id,
+        BufferedInputFile(report.collapsed().encode("utf-8"), filename=name),
+        caption=f"🔥 {report.samples} namuna — flamegraph.pl yoki speedscope.app uchun",
+    )
+    await bot.send_message(chat_id, html.quote(report.summary()[:3500]))
+
+
+@dp.message(Command("profile"))
+async def profile_cmd(message: Message, command: CommandObject):
+    # /profile [seconds] — samples this worker; runs in the background so the update is not held open
+    if not is_admin(message.from_user.id):
+        return await message.reply("Siz admin emassiz.")
+    if app.profiler.active:
+        return await message.answer("Profil allaqachon yozilmoqda.")
+    try:
+        seconds = float(command.args or 10)
+    except ValueError:
+        return await message.answer("Masalan: /profile 15")
+    seconds = max(1.0, min(seconds, app.profiler.max_seconds))
+    task = asyncio.create_task(_run_profile(message.chat.id, seconds))
+    _profile_tasks.add(task)
+    task.add_done_callback(_profile_tasks.discard)
+    await message.answer(f"⏱ Profil yozilmoqda: {seconds:g} s (worker {app.WORKER_ID})…")
+
+
+PRODUCT_ID_RE = _re.compile(r"[A-Za-z0-9_]+")
+
+
+@dp.message(F.photo)
+async def on_photo_upload_debug(message: Message):
+    # Admin sends a photo with a product ID caption -> webapp/img/<id>.jpg
+    if not is_admin(message.from_user.id):
+        return
+    product_id = (message.caption or "").strip()
+    # The ID becomes a file name: only existing catalog IDs, never a path
+    if PRODUCT_ID_RE.fullmatch(product_id) and catalog.get(product_id) is not None:
+        photo = message.photo[-1]
+        file_info = await bot.get_file(photo.file_id)
+
+        logging.info(f"Rasm keldi: {message.from_user.id} -> {product_id}")
+
+        save_path = os.path.join(PRODUCT_IMG_DIR, f"{product_id}.jpg")
+        # download next to the target and swap, so the WebApp never sees a half-written file
+        await bot.download_file(file_info.file_path, save_path + ".tmp")
+        os.replace(save_path + ".tmp", save_path)
+        # new ?v= for this image -> rebuild the /api/products body
+        version = static_assets.bump_image(product_id)
+        if version:
+            await image_variants.generate(product_id, version)
+        rebuild_products_body()
+        await message.answer(f"✅ Rasm saqlandi: <b>{product_id}.jpg</b>")
+    else:
+        await message.answer("⚠️ Iltimos, rasm izohiga mavjud mahsulot ID sini yozing (masalan: p1).")
+
+
+# ====== WEBAPP callback: Telegram.WebApp.sendData(JSON) ======
+@dp.message(F.web_app_data)
+async def on_webapp_data(message: Message, state: FSMContext):
+    try:
+        payload = json.loads(message.web_app_data.data)
+    except Exception:
+        return await message.answer("Error parsing data.")
+    
+    # Get user language
+    s = await state.get_data()
+    lang = get_lang(s)
+
+    cart = []
+    total = 0
+    for it in payload.get("items", []):
+        p = find_product(it.get("id"))
+        if not p:
+            continue
+        qty = int(it.get("qty", 1))
+        one = unit_price_1kg(p)
+        price = one * qty
+        # Choose name based on language
+        p_name = p.get("name_uz") if lang == "uz" else p.get("name_ru")
+        p_name = p_name or p.get("name_uz") or "Nomsiz"
+
+        cart.append(
+            {
+                "product_id": str(p["id"]),
+                "name": p_name,
+                "kg": 1.0,
+                "qty": qty,
+                "unit_price": one,
+                "price": price,
+            }
+        )
+        total += price
+    name = payload.get("name", "")
+    phone = payload.get("phone", "")
+    address = payload.get("address", "")
+    lat = payload.get("lat")
+    lon = payload.get("lon")
+    
+    order_id = await save_order_to_db(
+        message.from_user.id, name, phone, address, cart, total, lat=lat, lon=lon, lang=lang
+    )
+    
+    maps_link = ""
+    if lat and lon:
+        link_url = f"https://www.google.com/maps?q={lat},{lon}"
+        maps_link = t(lang, "ord_map", link=link_url)
+
+    # Build msg using translations
+    user_handle = f"@{message.from_user.username}" if message.from_user.username else "N/A"
+    
+    txt = (
+        f"{t(lang, 'ord_new', id=order_id)}\n"
+        f"{t(lang, 'ord_from', name=html.quote(name))}\n"
+        f"{t(lang, 'ord_user', user=f'{user_handle} ({message.from_user.id})')}\n"
+        f"{t(lang, 'ord_phone', phone=html.quote(phone))}\n"
+        f"{t(lang, 'ord_addr', addr=html.quote(address))}{maps_link}\n\n"
+        f"{t(lang, 'ord_items')}\n"
+    )
+    for it in cart:
+        txt += (
+            f"• {it['name']} — 1 kg x{it['qty']} — {it['price']} \n"
+        )
+    # Total
+    # Note: t() returns string. We can just append.
+    # We used 'so\'m' in translation, but here let's stick to formatted string if needed or translation
+    # The translation key "ord_total" already has {total} placeholder
+    txt += f"\n{t(lang, 'ord_total', total=total)}"
+    
+    if ADMIN_CHAT_ID:
+        try:
+            await admin_outbox.send_message(ADMIN_CHAT_ID, txt, disable_web_page_preview=True)
+            if lat and lon:
+                await admin_outbox.send_location(ADMIN_CHAT_ID, latitude=lat, longitude=lon)
+        except Exception:
+            logging.exception("Adminga yuborilmadi (webapp)")
+    
+    await message.answer(t(lang, "ord_received"))
+
+
+# ====== WEBHOOK ======
+# queue: ack immediately, handle on a worker pool (per-chat order kept); inline: old behaviour
+WEBHOOK_MODE = os.getenv("WEBHOOK_MODE", "queue")
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "16"))
+WEBHOOK_QUEUE_LIMIT = int(os.getenv("WEBHOOK_QUEUE_LIMIT", "1000"))
+# One update per chat at a time, across every worker when there are several
+chat_lock = ChatLock(CHAT_LOCK_PATH if SHARED_STATE else None)
+update_pool = UpdateWorkerPool(dp, bot, workers=WEBHOOK_WORKERS, limit=WEBHOOK_QUEUE_LIMIT, chat_lock=chat_lock)
+
+
+def _pool_latency(stats):
+    # p50/p99 over the pool's recent window (queue mode only; inline mode has no queue)
+    def collect():
+        if WEBHOOK_MODE != "queue":
+            return None
+        snap = stats.snapshot()
+        return [(("0.5",), snap["p50_ms"] / 1000), (("0.99",), snap["p99_ms"] / 1000)]
+    return collect
+
+
+REGISTRY.gauge("asalboy_update_queue_depth", "Webhook updates accepted and not yet handled",
+               lambda: update_pool.depth if WEBHOOK_MODE == "queue" else None)
+REGISTRY.gauge("asalboy_update_queue_wait_seconds", "Time updates waited for a pool worker (recent window)",
+               _pool_latency(update_pool.wait_stats), ("quantile",))
+REGISTRY.gauge("asalboy_update_handler_seconds", "dp.feed_update time per update in the pool (recent window)",
+               _pool_latency(update_pool.handler_stats), ("quantile",))
+REGISTRY.counter_func("asalboy_update_pool", "Webhook pool updates: accepted, rejected (503), handler errors",
+                      lambda: [((k,), v) for k, v in update_pool.counters.items()] if WEBHOOK_MODE == "queue" else None,
+                      ("result",))
+
+# Same value is passed to set_webhook; Telegram echoes it in X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_DEDUP_WINDOW = float(os.getenv("WEBHOOK_DEDUP_WINDOW", "3600"))
+WEBHOOK_DEDUP_PATH = os.getenv("WEBHOOK_DEDUP_PATH", "data/seen_updates.db") or None
+# Workers share the seen_updates table, so a redelivery to another worker is dropped too
+update_dedup = UpdateDeduplicator(window=WEBHOOK_DEDUP_WINDOW, path=WEBHOOK_DEDUP_PATH, shared=SHARED_STATE)
+_handled_types: Optional[frozenset] = None
+
+
+def handled_update_types() -> frozenset:
+    # Computed once, after every router/handler has been registered
+    global _handled_types
+    if _handled_types is None:
+        _handled_types = frozenset(dp.resolve_used_update_types())
+    return _handled_types
+
+
+async def handle_webhook(request):
+    # Forged requests are dropped before the body is even read
+    if not secret_ok(request.headers.get("X-Telegram-Bot-Api-Secret-Token"), WEBHOOK_SECRET):
+        update_dedup.stats["forged"] += 1
+        return web.Response(status=401)
+    body = await request.read()
+    update_id = peek_update_id(body)
+    if update_id is not None and not await update_dedup.claim(update_id):
+        # Redelivery of something we already accepted
+        return web.Response(text="OK")
+    try:
+        update = decode_update(body, bot, handled_update_types())
+    except Exception as e:
+        logging.error(f"Webhook error: {e}")
+        return web.Response(status=400)
+    if update is None:
+        # No handler for this update type — skip validation entirely
+        return web.Response(text="OK")
+    if update_id is None and not await update_dedup.claim(update.update_id):
+        return web.Response(text="OK")
+    if WEBHOOK_MODE != "queue":
+        try:
+            async with chat_lock.hold(update):
+                await dp.feed_update(bot, update)
+            return web.Response(text="OK")
+        except Exception as e:
+            logging.error(f"Webhook error: {e}")
+            await update_dedup.release(update.update_id)
+            return web.Response(status=500)
+    if not await update_pool.submit(update):
+        # Backpressure: Telegram will redeliver this update later
+        await update_dedup.release(update.update_id)
+        return web.Response(status=503)
+    return web.Response(text="OK")
+
+
+async def start_update_intake():
+    if WEBHOOK_MODE == "queue":
+        update_pool.start()
+    await update_dedup.start()
+
+
+async def stop_update_intake():
+    await update_pool.stop()
+    await update_dedup.stop()
+    chat_lock.close()
+
+
+# Keyboards and catalog pages for the current catalog, rebuilt on every swap
+catalog.on_change(lambda snap: warm_render_cache())
+warm_render_cache()
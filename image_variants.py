@@ -0,0 +1,168 @@
+# image_variants.py — ASALBOY responsive product thumbnails (WebP + JPEG, generated in a process pool)
+import os
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+try:
+    import PIL  # optional: pip install Pillow (PIL.Image itself is imported where it is used)
+except ImportError:  # pragma: no cover - depends on environment
+    PIL = None
+
+WIDTHS = (160, 320, 480, 640)
+FORMATS = ("webp", "jpg")
+IMMUTABLE = "public, max-age=31536000, immutable"
+CONTENT_TYPES = {"webp": "image/webp", "jpg": "image/jpeg"}
+# Cards are square (object-fit: cover), two per row on phones
+SIZES = "(max-width: 480px) 50vw, 200px"
+
+
+def render_variants(src: str, out_dir: str, pid: str, version: str, widths=WIDTHS, quality: int = 78) -> List[Tuple[int, str]]:
+    """
+    Runs in a worker process: square-crop `src` to every width (not larger than the
+    source) in every format, write atomically, then record `version` in <pid>.ver.
+    """
+    from PIL import Image, ImageOps
+
+    made = []
+    with Image.open(src) as im:
+        im = ImageOps.exif_transpose(im).convert("RGB")
+        side = min(im.size)
+        for w in widths:
+            if w > side and made:
+                break
+            w = min(w, side)
+            thumb = ImageOps.fit(im, (w, w), Image.LANCZOS)
+            for fmt in FORMATS:
+                path = os.path.join(out_dir, f"{pid}-{w}.{fmt}")
+                tmp = path + ".tmp"
+                if fmt == "webp":
+                    thumb.save(tmp, "WEBP", quality=quality, method=6)
+                else:
+                    thumb.save(tmp, "JPEG", quality=quality, optimize=True, progressive=True)
+                os.replace(tmp, path)
+            made.append(w)
+    with open(os.path.join(out_dir, f"{pid}.ver"), "w", encoding="ascii") as f:
+        f.write(version + "\n" + ",".join(map(str, made)))
+    return [(w, fmt) for w in made for fmt in FORMATS]
+
+
+class ImageVariants:
+    """
+    Thumbnails of webapp/img/<pid>.jpg in data/img_variants/<pid>-<w>.<fmt>.
+    Generation happens in a ProcessPoolExecutor so resizing never blocks the event loop;
+    <pid>.ver stores the source version the variants were made from.
+    Without Pillow the pipeline is disabled and the WebApp keeps using the original JPEG.
+    """
+
+    def __init__(self, src_dir: str = "webapp/img", out_dir: str = "data/img_variants", processes: int = 2):
+        self.src_dir = src_dir
+        self.out_dir = out_dir
+        self.processes = processes
+        self.enabled = PIL is not None
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._ready: Dict[str, Tuple[str, List[int]]] = {}  # pid -> (version, widths)
+        self._jobs: Dict[Tuple[str, str], asyncio.Future] = {}
+        if not self.enabled:
+            logging.warning("Pillow o‘rnatilmagan — rasm variantlari yaratilmaydi")
+            return
+        os.makedirs(out_dir, exist_ok=True)
+
+    def _pool_get(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Not fork: the bot process has threads (to_thread pool, SQLite writers) by now,
+            # and a child forked while one of them holds a lock can hang on it
+            methods = multiprocessing.get_all_start_methods()
+            ctx = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            self._pool = ProcessPoolExecutor(max_workers=self.processes, mp_context=ctx)
+        return self._pool
+
+    def _read_ver(self, pid: str) -> Optional[Tuple[str, List[int]]]:
+        try:
+            with open(os.path.join(self.out_dir, f"{pid}.ver"), "r", encoding="ascii") as f:
+                version, widths = (f.read().split("\n") + [""])[:2]
+        except OSError:
+            return None
+        return version, [int(w) for w in widths.split(",") if w]
+
+    async def generate(self, pid: str, version: str) -> bool:
+        """Make sure variants for `pid` match source `version` (no-op when already current)."""
+        if not self.enabled:
+            return False
+        cur = self._ready.get(pid) or self._read_ver(pid)
+        if cur and cur[0] == version:
+            self._ready[pid] = cur
+            return True
+        job = self._jobs.get((pid, version))
+        if job is None:
+            src = os.path.join(self.src_dir, f"{pid}.jpg")
+            loop = asyncio.get_running_loop()
+            job = loop.run_in_executor(self._pool_get(), render_variants, src, self.out_dir, pid, version)
+            self._jobs[(pid, version)] = job
+        try:
+            made = await job
+        except Exception:
+            logging.exception("Rasm variantlari yaratilmadi: %s", pid)
+            return False
+        finally:
+            self._jobs.pop((pid, version), None)
+        self._ready[pid] = (version, sorted({w for w, _ in made}))
+        return True
+
+    async def ensure_all(self, versions: Dict[str, str]) -> int:
+        """Backfill variants for every existing image ({"p1.jpg": version})."""
+        if not self.enabled:
+            return 0
+        pids = {name[:-4]: v for name, v in versions.items() if name.endswith(".jpg")}
+        results = await asyncio.gather(*(self.generate(pid, v) for pid, v in pids.items()))
+        return sum(results)
+
+    def sync(self, versions: Dict[str, str]) -> int:
+        """
+        Adopt variants another worker process generated ({"p1.jpg": version}) by reading
+        their <pid>.ver; returns how many products became current.
+        """
+        if not self.enabled:
+            return 0
+        n = 0
+        for name, v in versions.items():
+            pid = name[:-4]
+            cur = self._ready.get(pid)
+            if cur and cur[0] == v:
+                continue
+            cur = self._read_ver(pid)
+            if cur and cur[0] == v:
+                self._ready[pid] = cur
+                n += 1
+        return n
+
+    def srcset(self, pid: str, version: str) -> Optional[Dict[str, str]]:
+        """{"webp": "...160w, ...", "jpg": "...", "sizes": ...} for current variants, else None."""
+        cur = self._ready.get(pid)
+        if not cur or cur[0] != version or not cur[1]:
+            return None
+        out = {
+            fmt: ", ".join(f"/webapp/img/{pid}-{w}.{fmt}?v={version} {w}w" for w in cur[1])
+            for fmt in FORMATS
+        }
+        out["sizes"] = SIZES
+        return out
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        pid, w, fmt = request.match_info["pid"], request.match_info["w"], request.match_info["fmt"]
+        path = os.path.join(self.out_dir, f"{pid}-{w}.{fmt}")
+        if not os.path.isfile(path):
+            return web.Response(status=404)
+        cur = self._ready.get(pid)
+        # Same rule as the originals: only the versioned URL is immutable
+        cache = IMMUTABLE if cur and request.query.get("v") == cur[0] else "no-cache"
+        return web.FileResponse(path, headers={"Cache-Control": cache, "Content-Type": CONTENT_TYPES[fmt]})
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
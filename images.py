@@ -0,0 +1,292 @@
+# images.py — ASALBOY Telegram image proxy cache (memory LRU + content-addressed disk + single-flight)
+import os
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import aiohttp
+from aiohttp import web
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+_MAGIC = (
+    (b"\xff\xd8\xff", ".jpg", "image/jpeg"),
+    (b"\x89PNG", ".png", "image/png"),
+    (b"RIFF", ".webp", "image/webp"),
+    (b"GIF8", ".gif", "image/gif"),
+)
+
+
+def sniff(head: bytes) -> Tuple[str, str]:
+    for magic, ext, ctype in _MAGIC:
+        if head.startswith(magic):
+            return ext, ctype
+    return ".jpg", "image/jpeg"
+
+
+class CachedImage:
+    __slots__ = ("digest", "path", "content_type", "data")
+
+    def __init__(self, digest: str, path: str, content_type: str, data: Optional[bytes] = None):
+        self.digest = digest
+        self.path = path
+        self.content_type = content_type
+        self.data = data
+
+
+class ImageCache:
+    """
+    Proxy for Telegram photos by file_id.
+
+    Layout under `root`:
+      blobs/ab/<sha256>.<ext>   — image bytes, named by content hash (dedups identical photos)
+      ids/<sha1(file_id)>       — one line: "<sha256>.<ext>"
+    Hot images are also kept in a byte-bounded in-memory LRU. Concurrent misses for the
+    same file_id share one upstream fetch (single-flight), run as its own task so a
+    cancelled first requester does not fail the others.
+
+    The disk store is capped at `disk_bytes`: once a download pushes it over, a sweep in
+    a thread deletes the least recently used blobs (disk hits refresh the mtime) down to
+    90% of the cap, then the ids/ entries whose blob is gone.
+    """
+
+    def __init__(
+        self,
+        bot,
+        root: str = "data/img_cache",
+        mem_bytes: int = 32 * 1024 * 1024,
+        mem_item_max: int = 2 * 1024 * 1024,
+        negative_ttl: float = 60.0,
+        max_missing: int = 10_000,
+        disk_bytes: int = 1024 * 1024 * 1024,
+    ):
+        self.bot = bot
+        self.root = root
+        self.mem_bytes = mem_bytes
+        self.mem_item_max = mem_item_max
+        self.negative_ttl = negative_ttl
+        self.max_missing = max_missing
+        self.disk_bytes = disk_bytes
+        self._disk_used: Optional[int] = None  # unknown until the first sweep
+        self._sweep_task: Optional[asyncio.Task] = None
+        self._mem: "OrderedDict[str, CachedImage]" = OrderedDict()
+        self._mem_used = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # file_id -> when it failed; keyed by unauthenticated URL input, so bounded (oldest out)
+        self._missing: "OrderedDict[str, float]" = OrderedDict()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.stats = {"mem_hit": 0, "disk_hit": 0, "miss": 0, "coalesced": 0, "error": 0, "disk_evicted": 0}
+        os.makedirs(os.path.join(root, "blobs"), exist_ok=True)
+        os.makedirs(os.path.join(root, "ids"), exist_ok=True)
+
+    # ---- shared client session ----
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=32, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=30),
+            )
+        return self._session
+
+    async def close(self) -> None:
+        if self._sweep_task is not None:
+            await self._sweep_task
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    # ---- memory LRU ----
+    def _mem_get(self, file_id: str) -> Optional[CachedImage]:
+        img = self._mem.get(file_id)
+        if img is not None:
+            self._mem.move_to_end(file_id)
+        return img
+
+    def _mem_put(self, file_id: str, img: CachedImage) -> None:
+        if img.data is None or len(img.data) > self.mem_item_max:
+            return
+        old = self._mem.pop(file_id, None)
+        if old is not None:
+            self._mem_used -= len(old.data)
+        self._mem[file_id] = img
+        self._mem_used += len(img.data)
+        while self._mem_used > self.mem_bytes and self._mem:
+            _, ev = self._mem.popitem(last=False)
+            self._mem_used -= len(ev.data)
+
+    # ---- disk store ----
+    def _id_path(self, file_id: str) -> str:
+        return os.path.join(self.root, "ids", hashlib.sha1(file_id.encode()).hexdigest())
+
+    def _blob_path(self, name: str) -> str:
+        return os.path.join(self.root, "blobs", name[:2], name)
+
+    def _disk_get(self, file_id: str) -> Optional[CachedImage]:
+        try:
+            with open(self._id_path(file_id), "r", encoding="ascii") as f:
+                name = f.read().strip()
+        except OSError:
+            return None
+        path = self._blob_path(name)
+        if not os.path.exists(path):
+            return None
+        digest, ext = os.path.splitext(name)
+        ctype = next((c for _, e, c in _MAGIC if e == ext), "image/jpeg")
+        try:
+            os.utime(path)  # recently used: the sweep evicts by mtime
+        except OSError:
+            return None
+        return CachedImage(digest, path, ctype)
+
+    def _sweep_sync(self) -> Tuple[int, int]:
+        """Evict LRU blobs over the cap and dangling ids/; returns (bytes kept, blobs removed)."""
+        blobs = []
+        for dirpath, _, files in os.walk(os.path.join(self.root, "blobs")):
+            for name in files:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                blobs.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in blobs)
+        removed = 0
+        if total > self.disk_bytes:
+            low = self.disk_bytes * 9 // 10
+            for _, size, path in sorted(blobs):
+                if total <= low:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+        ids = os.path.join(self.root, "ids")
+        for name in os.listdir(ids):
+            path = os.path.join(ids, name)
+            try:
+                with open(path, "r", encoding="ascii") as f:
+                    blob = self._blob_path(f.read().strip())
+                if not os.path.exists(blob):
+                    os.remove(path)
+            except (OSError, ValueError):
+                continue
+        return total, removed
+
+    async def _sweep(self) -> None:
+        try:
+            self._disk_used, removed = await asyncio.to_thread(self._sweep_sync)
+        except Exception:
+            logging.exception("Rasm keshi tozalanmadi")
+            return
+        if removed:
+            self.stats["disk_evicted"] += removed
+            logging.info("Rasm keshi: %d ta eski fayl o‘chirildi (%d MB qoldi)", removed, self._disk_used // (1024 * 1024))
+
+    def _disk_added(self, path: str) -> None:
+        if self._disk_used is not None:
+            try:
+                self._disk_used += os.path.getsize(path)
+            except OSError:
+                pass
+        if (self._disk_used is None or self._disk_used > self.disk_bytes) and (
+                self._sweep_task is None or self._sweep_task.done()):
+            self._sweep_task = asyncio.get_running_loop().create_task(self._sweep())
+
+    async def _fetch(self, file_id: str) -> Optional[CachedImage]:
+        """Download file_id from Telegram into the blob store, streaming in chunks."""
+        f_info = await self.bot.get_file(file_id)
+        if not f_info or not f_info.file_path:
+            return None
+        url = self.bot.session.api.file_url(self.bot.token, f_info.file_path)
+        tmp = os.path.join(self.root, f"tmp-{os.getpid()}-{id(asyncio.current_task())}")
+        h = hashlib.sha256()
+        head = b""
+        small = bytearray()
+        try:
+            async with self.session().get(url) as resp:
+                if resp.status != 200:
+                    logging.error(f"❌ DOWNLOAD FAILED {resp.status}: {f_info.file_path}")
+                    return None
+                with open(tmp, "wb") as out:
+                    async for chunk in resp.content.iter_chunked(64 * 1024):
+                        if not head:
+                            head = chunk[:16]
+                        h.update(chunk)
+                        out.write(chunk)
+                        if len(small) <= self.mem_item_max:
+                            small += chunk
+            digest = h.hexdigest()
+            ext, ctype = sniff(head)
+            name = digest + ext
+            path = self._blob_path(name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp, path)
+            with open(self._id_path(file_id), "w", encoding="ascii") as f:
+                f.write(name)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        data = bytes(small) if len(small) <= self.mem_item_max else None
+        return CachedImage(digest, path, ctype, data)
+
+    async def get(self, file_id: str) -> Optional[CachedImage]:
+        img = self._mem_get(file_id)
+        if img is not None:
+            self.stats["mem_hit"] += 1
+            return img
+        miss_at = self._missing.get(file_id)
+        if miss_at and time.monotonic() - miss_at < self.negative_ttl:
+            return None
+        img = self._disk_get(file_id)
+        if img is not None:
+            self.stats["disk_hit"] += 1
+            if os.path.getsize(img.path) <= self.mem_item_max:
+                with open(img.path, "rb") as f:
+                    img.data = f.read()
+                self._mem_put(file_id, img)
+            return img
+
+        task = self._inflight.get(file_id)
+        if task is not None:
+            self.stats["coalesced"] += 1
+        else:
+            self.stats["miss"] += 1
+            # Own task, referenced from _inflight until done: cancelling any requester
+            # (client gone, timeout) leaves the download running for the others
+            task = self._inflight[file_id] = asyncio.ensure_future(self._load(file_id))
+        return await asyncio.shield(task)
+
+    async def _load(self, file_id: str) -> Optional[CachedImage]:
+        img = None
+        try:
+            img = await self._fetch(file_id)
+        except Exception as e:
+            self.stats["error"] += 1
+            logging.exception(f"❌ PROXY EXCEPTION for {file_id}: {e}")
+        finally:
+            self._inflight.pop(file_id, None)
+        if img is None:
+            self._missing[file_id] = time.monotonic()
+            self._missing.move_to_end(file_id)
+            while len(self._missing) > self.max_missing:
+                self._missing.popitem(last=False)
+        else:
+            self._missing.pop(file_id, None)
+            self._mem_put(file_id, img)
+            self._disk_added(img.path)
+        return img
+
+    def response(self, request: web.Request, img: CachedImage) -> web.StreamResponse:
+        etag = f'"{img.digest[:32]}"'
+        headers = {"Cache-Control": IMMUTABLE, "ETag": etag}
+        if etag in request.headers.get("If-None-Match", ""):
+            return web.Response(status=304, headers=headers)
+        if img.data is not None:
+            return web.Response(body=img.data, content_type=img.content_type, headers=headers)
+        # Large file: stream from disk (sendfile where available)
+        return web.FileResponse(img.path, headers={"Cache-Control": IMMUTABLE})
@@ -0,0 +1,264 @@
+# metrics.py — ASALBOY Prometheus text-format metrics (counters, histograms, scrape-time gauges)
+#
+# No client library: recording is a dict lookup, a bisect and a few increments, and
+# everything that costs more (cache hit ratios, FSM sizes, queue depths) is read by
+# collectors only when /metrics is scraped. With WORKERS>1 every worker keeps its own
+# numbers and app.py adds a worker label to every sample, so scrapes that land on
+# different workers can be told apart.
+import time
+import bisect
+import logging
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+# Seconds; Telegram round trips and handlers sit between a few ms and a few seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Sample = Tuple[str, Dict[str, str], float]  # (suffix, labels, value)
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(d: Dict[str, str]) -> str:
+    if not d:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in d.items()) + "}"
+
+
+def _num(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def samples(self) -> Iterable[Sample]:
+        raise NotImplementedError
+
+    def _named(self, key: Tuple) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels: str, n: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + n
+
+    def samples(self) -> Iterable[Sample]:
+        for key, v in self._values.items():
+            yield "_total", self._named(key), v
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple, List] = {}  # labels -> [per-bucket counts (+Inf last), sum]
+
+    def observe(self, value: float, *labels: str) -> None:
+        s = self._series.get(labels)
+        if s is None:
+            s = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        s[0][bisect.bisect_left(self.buckets, value)] += 1
+        s[1] += value
+
+    def time(self, *labels: str) -> "_Timer":
+        """with HIST.time("label"): ... — observes the block's wall time."""
+        return _Timer(self, labels)
+
+    def samples(self) -> Iterable[Sample]:
+        for key, (counts, total) in self._series.items():
+            named = self._named(key)
+            acc = 0
+            for le, c in zip(self.buckets + (float("inf"),), counts):
+                acc += c
+                yield "_bucket", {**named, "le": _num(le)}, acc
+            yield "_sum", named, total
+            yield "_count", named, acc
+
+
+class _Timer:
+    __slots__ = ("hist", "labels", "t")
+
+    def __init__(self, hist: Histogram, labels: Tuple):
+        self.hist = hist
+        self.labels = labels
+
+    def __enter__(self):
+        self.t = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.t, *self.labels)
+        return False
+
+
+class Gauge(_Metric):
+    """
+    Value computed at scrape time: `fn()` returns a number, or an iterable of
+    (label values tuple, number) for a labelled gauge. None = no sample.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, fn: Callable, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self.fn = fn
+
+    def samples(self) -> Iterable[Sample]:
+        v = self.fn()
+        if v is None:
+            return
+        if isinstance(v, (int, float)):
+            yield "", {}, v
+            return
+        for key, x in v:
+            yield "", self._named(tuple(key)), x
+
+
+class CounterFunc(Gauge):
+    """A counter kept elsewhere (e.g. a module's stats dict), read at scrape time."""
+
+    kind = "counter"
+
+    def samples(self) -> Iterable[Sample]:
+        for suffix, labels, v in super().samples():
+            yield "_total", labels, v
+
+
+class Registry:
+    def __init__(self, const_labels: Optional[Dict[str, str]] = None):
+        self.const_labels = dict(const_labels or {})
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        # Re-registering a name replaces it (e.g. a gauge bound to a rebuilt object)
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name: str, help: str, fn: Callable, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help, fn, labelnames))
+
+    def counter_func(self, name: str, help: str, fn: Callable, labelnames: Sequence[str] = ()) -> CounterFunc:
+        return self.register(CounterFunc(name, help, fn, labelnames))
+
+    def render(self) -> str:
+        out: List[str] = []
+        for m in list(self._metrics.values()):
+            try:
+                samples = list(m.samples())
+            except Exception:
+                logging.exception("Metric %s collection failed", m.name)
+                continue
+            out.append(f"# HELP {m.name} {m.help}")
+            out.append(f"# TYPE {m.name} {m.kind}")
+            for suffix, labels, v in samples:
+                out.append(f"{m.name}{suffix}{_labels({**self.const_labels, **labels})} {_num(v)}")
+        return "\n".join(out) + "\n"
+
+    def handler(self, authorized: Optional[Callable[[web.Request], bool]] = None):
+        """GET /metrics; `authorized(request)` False -> 401."""
+
+        async def metrics(request: web.Request) -> web.Response:
+            if authorized is not None and not authorized(request):
+                return web.Response(status=401, text="unauthorized")
+            return web.Response(body=self.render().encode("utf-8"), headers={"Content-Type": CONTENT_TYPE})
+
+        return metrics
+
+
+REGISTRY = Registry()
+
+# ---- hot-path instruments ----
+HANDLER_SECONDS = REGISTRY.histogram(
+    "asalboy_handler_seconds", "aiogram handler run time", ("handler",))
+HANDLER_ERRORS = REGISTRY.counter(
+    "asalboy_handler_errors", "aiogram handlers that raised", ("handler",))
+TG_API_SECONDS = REGISTRY.histogram(
+    "asalboy_telegram_api_seconds", "Outbound Bot API call time (one attempt)", ("method",))
+TG_API_ERRORS = REGISTRY.counter(
+    "asalboy_telegram_api_errors", "Failed Bot API calls", ("method", "error"))
+ORDER_INSERT_SECONDS = REGISTRY.histogram(
+    "asalboy_order_insert_seconds", "Order insert, submit to commit (group commit wait included)")
+HTTP_SECONDS = REGISTRY.histogram(
+    "asalboy_http_seconds", "WebApp responses", ("route", "status"))
+
+
+class HandlerMetrics:
+    """
+    aiogram inner middleware (register on every event observer): run time and errors per
+    handler function. Plain callable, so this module does not import aiogram.
+    """
+
+    async def __call__(self, handler, event, data):
+        ho = data.get("handler")
+        name = getattr(getattr(ho, "callback", None), "__name__", "unknown")
+        t = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - t, name)
+
+
+class ApiMetrics:
+    """
+    Bot session middleware: time per Bot API method. Registered after the rate limiter,
+    so it measures each HTTP attempt and not the time spent waiting for a token.
+    """
+
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        t = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            TG_API_ERRORS.inc(name, type(e).__name__)
+            raise
+        finally:
+            TG_API_SECONDS.observe(time.perf_counter() - t, name)
+
+
+def timed_route(route: str, handler):
+    """Wrap an aiohttp handler: response time by route and status code."""
+
+    async def wrapped(request: web.Request):
+        t = time.perf_counter()
+        status = 500
+        try:
+            resp = await handler(request)
+            status = resp.status
+            return resp
+        except web.HTTPException as e:
+            status = e.status
+            raise
+        finally:
+            HTTP_SECONDS.observe(time.perf_counter() - t, route, str(status))
+
+    return wrapped
@@ -0,0 +1,187 @@
+# order_export.py — ASALBOY streaming order export (CSV / JSONL, optional gzip) for accounting
+import io
+import csv
+import hmac
+import json
+import zlib
+import sqlite3
+import logging
+from typing import AsyncIterator, List, Optional, Tuple
+
+from aiohttp import web
+
+from orders_db import OrderFilter, id_bounds, item_rows, load_cart
+
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson; charset=utf-8",
+}
+CSV_HEADER = (
+    "id", "created_at", "user_id", "user_name", "phone", "address",
+    "lang", "total", "lat", "lon", "items",
+)
+SQL_EXPORT_COLUMNS = "id,created_at,user_id,user_name,phone,address,lang,total,lat,lon,cart_json"
+
+
+def _fetch_chunk(con: sqlite3.Connection, flt: OrderFilter, lo: int, hi: int, chunk: int) -> List[Tuple]:
+    where = ["id BETWEEN ? AND ?"]
+    params: list = [lo, hi]
+    if flt.date_from:
+        where.append("created_at >= ?")
+        params.append(flt.date_from)
+    if flt.date_to:
+        where.append("created_at < ?")
+        params.append(flt.date_to)
+    return con.execute(
+        f"SELECT {SQL_EXPORT_COLUMNS} FROM orders WHERE {' AND '.join(where)} ORDER BY id LIMIT ?",
+        params + [chunk],
+    ).fetchall()
+
+
+def _csv_lines(rows: List[Tuple], header: bool) -> str:
+    buf = io.StringIO()
+    w = csv.writer(buf, lineterminator="\r\n")
+    if header:
+        w.writerow(CSV_HEADER)
+    for r in rows:
+        items = "; ".join(
+            f"{it[1]} x{it[4]} = {it[6]}" for it in item_rows(r[0], load_cart(r[10]))
+        )
+        w.writerow(r[:10] + (items,))
+    return buf.getvalue()
+
+
+def _jsonl_lines(rows: List[Tuple]) -> str:
+    out = []
+    for r in rows:
+        doc = dict(zip(CSV_HEADER[:10], r[:10]))
+        doc["items"] = [
+            {"product_id": pid, "name": name, "kg": kg, "qty": qty, "unit_price": unit, "price": price}
+            for _, pid, name, kg, qty, unit, price in item_rows(r[0], load_cart(r[10]))
+        ]
+        out.append(json.dumps(doc, ensure_ascii=False, separators=(",", ":")))
+    return "\n".join(out) + "\n" if out else ""
+
+
+class OrderExport:
+    """
+    One export run: orders in [date_from, date_to] as CSV or JSONL, optionally gzipped.
+
+    Rows are read `chunk` at a time with keyset pagination on id, and each chunk is
+    fetched, formatted and compressed in the repository's reader thread, so the event
+    loop only moves finished byte blocks and memory is bounded by one chunk. The id
+    range is fixed when the export starts: orders arriving meanwhile are not included.
+    """
+
+    def __init__(
+        self,
+        repo,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        fmt: str = "csv",
+        gzip: bool = False,
+        chunk: int = 2000,
+    ):
+        """Dates are YYYY-MM-DD UTC days, both inclusive; raises ValueError on bad input."""
+        if fmt not in FORMATS:
+            raise ValueError(fmt)
+        self.repo = repo
+        self.flt = OrderFilter.parse(" ".join(f"{k}:{v}" for k, v in (("from", date_from), ("to", date_to)) if v))
+        self.label = "_".join(d for d in (date_from, date_to) if d)
+        self.fmt = fmt
+        self.gzip = gzip
+        self.chunk = chunk
+        self.rows = 0
+        self.bytes = 0
+
+    @property
+    def filename(self) -> str:
+        name = f"orders{'_' + self.label if self.label else ''}.{self.fmt}"
+        return name + ".gz" if self.gzip else name
+
+    @property
+    def content_type(self) -> str:
+        return "application/gzip" if self.gzip else FORMATS[self.fmt]
+
+    def _bounds(self, con: sqlite3.Connection) -> Optional[Tuple[int, int]]:
+        bounds = id_bounds(con, self.flt.date_from, self.flt.date_to)
+        if bounds is None:
+            return None
+        top = con.execute("SELECT MAX(id) FROM orders").fetchone()[0]
+        return (bounds[0], min(bounds[1], top)) if top is not None else None
+
+    def _encode(self, con: sqlite3.Connection, lo: int, hi: int, z, first: bool) -> Tuple[bytes, int, int]:
+        rows = _fetch_chunk(con, self.flt, lo, hi, self.chunk)
+        if self.fmt == "csv":
+            # BOM first, so Excel opens the UTF-8 names correctly
+            text = ("\ufeff" if first else "") + _csv_lines(rows, header=first)
+        else:
+            text = _jsonl_lines(rows)
+        data = text.encode("utf-8")
+        if z is not None:
+            data = z.compress(data) + (z.flush() if not rows else b"")
+        return data, len(rows), rows[-1][0] if rows else hi
+
+    def __aiter__(self) -> AsyncIterator[bytes]:
+        return self.blocks()
+
+    async def blocks(self) -> AsyncIterator[bytes]:
+        bounds = await self.repo.read(self._bounds)
+        z = zlib.compressobj(6, zlib.DEFLATED, 31) if self.gzip else None
+        lo, hi = bounds if bounds is not None else (1, 0)
+        first = True
+        while True:
+            data, n, last = await self.repo.read(lambda con, lo=lo, f=first: self._encode(con, lo, hi, z, f))
+            first = False
+            self.rows += n
+            if data:
+                self.bytes += len(data)
+                yield data
+            if not n:
+                return
+            lo = last + 1
+
+    async def to_file(self, path: str) -> int:
+        """Write the whole export to `path` (chunk by chunk); returns the row count."""
+        with open(path, "wb") as f:
+            async for block in self:
+                f.write(block)
+        return self.rows
+
+
+def token_ok(request: web.Request, token: str) -> bool:
+    """Authorization: Bearer <token> (or ?token=). No token configured = export disabled."""
+    if not token:
+        return False
+    auth = request.headers.get("Authorization", "")
+    given = auth[7:] if auth.startswith("Bearer ") else request.query.get("token", "")
+    return hmac.compare_digest(given.encode(), token.encode())
+
+
+def export_handler(repo, token: str, chunk: int = 2000):
+    """GET /api/orders/export?from=&to=&format=csv|jsonl&gzip=1"""
+
+    async def handler(request: web.Request) -> web.StreamResponse:
+        if not token_ok(request, token):
+            return web.Response(status=401, text="unauthorized")
+        try:
+            exp = OrderExport(
+                repo, request.query.get("from"), request.query.get("to"), request.query.get("format", "csv"),
+                gzip=request.query.get("gzip") in ("1", "true", "yes"), chunk=chunk,
+            )
+        except ValueError:
+            return web.Response(status=400, text="bad from/to/format")
+        resp = web.StreamResponse(headers={
+            "Content-Type": exp.content_type,
+            "Content-Disposition": f'attachment; filename="{exp.filename}"',
+            "Cache-Control": "no-store",
+        })
+        resp.enable_chunked_encoding()
+        await resp.prepare(request)
+        async for block in exp:
+            await resp.write(block)  # waits for the socket to drain (backpressure)
+        await resp.write_eof()
+        logging.info("Export: %d buyurtma, %d bayt (%s)", exp.rows, exp.bytes, exp.filename)
+        return resp
+
+    return handler
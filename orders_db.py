@@ -0,0 +1,662 @@
+# orders_db.py — ASALBOY async order repository (one long-lived WAL connection per thread)
+import os
+import re
+import sys
+import json
+import asyncio
+import sqlite3
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Deque, List, Optional, Tuple
+
+from sales_rollup import apply_order, load_cart, rebuild as rebuild_rollups
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",  # WAL + NORMAL: durable on app crash, fsync only at checkpoint
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",  # ~16 MB page cache
+    "PRAGMA mmap_size=134217728",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA foreign_keys=ON",
+)
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS orders(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER, user_name TEXT, phone TEXT, address TEXT,
+        cart_json TEXT, total INTEGER, created_at TEXT,
+        lat REAL, lon REAL, lang TEXT
+    )""",
+    # Admin browsing: every filter is an index range that is already ordered by id
+    "CREATE INDEX IF NOT EXISTS orders_created_at ON orders(created_at)",
+    "CREATE INDEX IF NOT EXISTS orders_user_id ON orders(user_id, id)",
+    "CREATE INDEX IF NOT EXISTS orders_phone ON orders(phone, id)",
+    # Line items, one row per cart entry (cart_json is kept as the original record)
+    """CREATE TABLE IF NOT EXISTS order_items(
+        id INTEGER PRIMARY KEY,
+        order_id INTEGER NOT NULL REFERENCES orders(id) ON DELETE CASCADE,
+        product_id TEXT NOT NULL, name TEXT,
+        kg REAL, qty INTEGER NOT NULL, unit_price INTEGER, price INTEGER NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS order_items_order ON order_items(order_id)",
+    "CREATE INDEX IF NOT EXISTS order_items_product ON order_items(product_id, order_id)",
+    "CREATE TABLE IF NOT EXISTS orders_meta(key TEXT PRIMARY KEY, value TEXT)",
+)
+
+# Full-text search over name/phone/address (external content: the index stores no copy
+# of the text). Kept in sync by triggers; created only when SQLite has FTS5.
+FTS_SCHEMA = (
+    """CREATE VIRTUAL TABLE orders_fts USING fts5(
+        user_name, phone, address,
+        content='orders', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS orders_fts_ai AFTER INSERT ON orders BEGIN
+        INSERT INTO orders_fts(rowid, user_name, phone, address)
+        VALUES (new.id, new.user_name, new.phone, new.address);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS orders_fts_ad AFTER DELETE ON orders BEGIN
+        INSERT INTO orders_fts(orders_fts, rowid, user_name, phone, address)
+        VALUES ('delete', old.id, old.user_name, old.phone, old.address);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS orders_fts_au AFTER UPDATE ON orders BEGIN
+        INSERT INTO orders_fts(orders_fts, rowid, user_name, phone, address)
+        VALUES ('delete', old.id, old.user_name, old.phone, old.address);
+        INSERT INTO orders_fts(rowid, user_name, phone, address)
+        VALUES (new.id, new.user_name, new.phone, new.address);
+    END""",
+)
+
+# Statement text is kept constant so sqlite3's per-connection statement cache reuses
+# the prepared statement instead of re-parsing SQL on every call.
+SQL_INSERT_ORDER = (
+    "INSERT INTO orders (user_id,user_name,phone,address,cart_json,total,created_at,lat,lon,lang) "
+    "VALUES (?,?,?,?,?,?,?,?,?,?)"
+)
+SQL_INSERT_ITEM = (
+    "INSERT INTO order_items (order_id,product_id,name,kg,qty,unit_price,price) VALUES (?,?,?,?,?,?,?)"
+)
+SQL_RECENT_ORDERS = (
+    "SELECT id,user_name,phone,total,created_at,lat,lon "
+    "FROM orders ORDER BY id DESC LIMIT ?"
+)
+
+
+ORDER_LIST_COLUMNS = "o.id,o.user_name,o.phone,o.total,o.created_at,o.lat,o.lon"
+
+
+def connect(path: str, readonly: bool = False) -> sqlite3.Connection:
+    con = sqlite3.connect(path, check_same_thread=False, cached_statements=256, isolation_level=None)
+    for p in PRAGMAS:
+        if readonly and p.startswith("PRAGMA journal_mode"):
+            continue
+        con.execute(p)
+    if readonly:
+        con.execute("PRAGMA query_only=ON")
+    return con
+
+
+def order_row(user_id, name, phone, address, cart, total, lat=None, lon=None, lang=None) -> Tuple:
+    return (
+        user_id,
+        name,
+        phone,
+        address,
+        json.dumps(cart, ensure_ascii=False),
+        total,
+        datetime.utcnow().isoformat(),
+        lat,
+        lon,
+        lang,
+    )
+
+
+def item_rows(order_id: int, cart) -> List[Tuple]:
+    """Cart items (as saved by checkout) -> order_items rows."""
+    rows = []
+    for it in load_cart(cart):
+        qty = int(it.get("qty") or 1)
+        price = int(it.get("price") or 0)
+        unit = it.get("unit_price")
+        rows.append((
+            order_id,
+            str(it.get("product_id") or it.get("id") or "?"),
+            it.get("name"),
+            float(it.get("kg") or 1.0),
+            qty,
+            int(unit) if unit is not None else (price // qty if qty else price),
+            price,
+        ))
+    return rows
+
+
+def migrate_items_chunk(con: sqlite3.Connection, after_id: int, chunk: int = 1000) -> Tuple[int, int, int]:
+    """
+    Expand the next `chunk` orders (id > after_id) that have no order_items yet, in one
+    short transaction. Returns (last order id looked at, orders expanded, items written);
+    last id == after_id means the migration is complete. An order whose cart does not
+    parse is logged, added to the 'items_migration_skipped' meta list and passed over.
+    """
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        rows = con.execute(
+            "SELECT o.id, o.cart_json FROM orders o WHERE o.id > ? "
+            "AND NOT EXISTS (SELECT 1 FROM order_items i WHERE i.order_id = o.id) ORDER BY o.id LIMIT ?",
+            (after_id, chunk),
+        ).fetchall()
+        items, skipped = [], []
+        for oid, cart_json in rows:
+            try:
+                items.extend(item_rows(oid, cart_json))
+            except (TypeError, ValueError, AttributeError) as e:
+                logging.warning("order_items: #%s savati o‘qilmadi, o‘tkazib yuborildi: %s", oid, e)
+                skipped.append(oid)
+        con.executemany(SQL_INSERT_ITEM, items)
+        if skipped:
+            row = con.execute("SELECT value FROM orders_meta WHERE key='items_migration_skipped'").fetchone()
+            con.execute(
+                "INSERT OR REPLACE INTO orders_meta(key, value) VALUES ('items_migration_skipped', ?)",
+                (",".join(filter(None, [row[0] if row else "", ",".join(map(str, skipped))])),),
+            )
+        last = rows[-1][0] if rows else after_id
+        con.execute(
+            "INSERT OR REPLACE INTO orders_meta(key, value) VALUES ('items_migrated_upto', ?)",
+            ("done" if not rows else str(last),),
+        )
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    return last, len(rows), len(items)
+
+
+def items_migration_cursor(con: sqlite3.Connection) -> Optional[int]:
+    """Where the cart_json -> order_items migration stopped; None once it has finished."""
+    row = con.execute("SELECT value FROM orders_meta WHERE key='items_migrated_upto'").fetchone()
+    if row is None:
+        return 0
+    return None if row[0] == "done" else int(row[0])
+
+
+class OrderFilter:
+    """
+    Admin order browser filter. Parsed from "/listorders" arguments:
+        user:<id>  phone:<number>  product:<id>  from:YYYY-MM-DD  to:YYYY-MM-DD
+        <other words = search, word* = prefix>
+    Dates are UTC days (created_at is stored in UTC); `to` is inclusive.
+    """
+
+    __slots__ = ("user_id", "phone", "product_id", "date_from", "date_to", "text")
+
+    def __init__(self, user_id=None, phone=None, date_from=None, date_to=None, text="", product_id=None):
+        self.user_id: Optional[int] = user_id
+        self.phone: Optional[str] = phone
+        self.product_id: Optional[str] = product_id
+        self.date_from: Optional[str] = date_from
+        self.date_to: Optional[str] = date_to
+        self.text: str = text
+
+    @classmethod
+    def parse(cls, args: str) -> "OrderFilter":
+        """Raises ValueError on a malformed user id, phone or date."""
+        f = cls()
+        words = []
+        for tok in (args or "").split():
+            key, sep, val = tok.partition(":")
+            key = key.lower()
+            if not sep or not val or key not in ("user", "phone", "product", "from", "to"):
+                words.append(tok)
+            elif key == "user":
+                f.user_id = int(val)
+            elif key == "product":
+                f.product_id = val
+            elif key == "phone":
+                digits = re.sub(r"\D", "", val)
+                if not digits:
+                    raise ValueError(val)
+                f.phone = digits
+            elif key == "from":
+                f.date_from = datetime.strptime(val, "%Y-%m-%d").date().isoformat()
+            else:
+                day = datetime.strptime(val, "%Y-%m-%d").date() + timedelta(days=1)
+                f.date_to = day.isoformat()  # exclusive bound
+        f.text = " ".join(words)
+        return f
+
+    def __bool__(self) -> bool:
+        return bool(
+            self.user_id is not None or self.phone or self.product_id
+            or self.date_from or self.date_to or self.text
+        )
+
+    def describe(self) -> str:
+        parts = []
+        if self.user_id is not None:
+            parts.append(f"user:{self.user_id}")
+        if self.phone:
+            parts.append(f"phone:{self.phone}")
+        if self.product_id:
+            parts.append(f"product:{self.product_id}")
+        if self.date_from:
+            parts.append(f"from:{self.date_from}")
+        if self.date_to:
+            last = datetime.strptime(self.date_to, "%Y-%m-%d").date() - timedelta(days=1)
+            parts.append(f"to:{last.isoformat()}")
+        if self.text:
+            parts.append(f"«{self.text}»")
+        return " ".join(parts)
+
+
+def fts_query(text: str) -> Optional[str]:
+    """
+    User words -> FTS5 query matching all of them as whole words ("ali tosh*" ->
+    '"ali" "tosh"*'). Only an explicit trailing * asks for a prefix match: prefix
+    terms merge every matching doclist, so they get slower as the table grows.
+    None if no words are left.
+    """
+    terms = [f'"{w}"{"*" if star else ""}' for w, star in re.findall(r"(\w+)(\*?)", text)]
+    return " ".join(terms) or None
+
+
+# Longest an order can wait between order_row() (created_at) and its commit (id)
+ID_SKEW_SECONDS = 300
+
+
+def id_bounds(con: sqlite3.Connection, date_from: Optional[str], date_to: Optional[str]) -> Optional[Tuple[int, int]]:
+    """
+    Date range -> id range with index probes on created_at, so the page query can walk
+    the primary key. Ids follow commit order, and created_at is taken when the order is
+    submitted, up to ID_SKEW_SECONDS earlier (longer with several workers committing).
+    An order created before date_from - skew has therefore committed before any order
+    of the range, and one created at date_to + skew or later after all of them: those
+    two neighbours bound the range. Callers still filter on created_at, so the extra
+    ids inside the bounds cost a few index steps and never show up.
+    None = no order in the range.
+    """
+    where, params = [], []
+    if date_from:
+        where.append("created_at >= ?")
+        params.append(date_from)
+    if date_to:
+        where.append("created_at < ?")
+        params.append(date_to)
+    if where and con.execute(f"SELECT 1 FROM orders WHERE {' AND '.join(where)} LIMIT 1", params).fetchone() is None:
+        return None
+    lo, hi = 0, 2 ** 63 - 1
+    skew = timedelta(seconds=ID_SKEW_SECONDS)
+    if date_from:
+        before = (datetime.fromisoformat(date_from) - skew).isoformat()
+        row = con.execute(
+            "SELECT id FROM orders WHERE created_at < ? ORDER BY created_at DESC LIMIT 1", (before,)
+        ).fetchone()
+        if row is not None:
+            lo = row[0]
+    if date_to:
+        after = (datetime.fromisoformat(date_to) + skew).isoformat()
+        row = con.execute(
+            "SELECT id FROM orders WHERE created_at >= ? ORDER BY created_at LIMIT 1", (after,)
+        ).fetchone()
+        if row is not None:
+            hi = row[0]
+    return lo, hi
+
+
+def query_orders_page(
+    con: sqlite3.Connection,
+    flt: OrderFilter,
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+    limit: int = 20,
+    fts: bool = True,
+) -> Tuple[List[Tuple], bool, bool]:
+    """
+    One page of orders, newest first, with keyset pagination on id:
+      before=<smallest id shown>  -> the next older page
+      after=<largest id shown>    -> the next newer page
+    Every filter maps to an index range ordered by id (or the FTS rowid), so a page
+    costs O(limit) index steps no matter how many orders there are.
+    Returns (rows, has_older, has_newer).
+    """
+    bounds = id_bounds(con, flt.date_from, flt.date_to) if (flt.date_from or flt.date_to) else (0, 2 ** 63 - 1)
+    if bounds is None:
+        return [], False, False
+    lo, hi = bounds
+    if before is not None:
+        hi = min(hi, before - 1)
+    if after is not None:
+        lo = max(lo, after + 1)
+
+    query = fts_query(flt.text) if flt.text else None
+    if flt.text and query is None:
+        return [], False, False
+    # With a search, walk the FTS index in rowid order and look orders up by id;
+    # with a product, walk order_items(product_id, order_id)
+    by_product = bool(flt.product_id) and not (query is not None and fts)
+    if query is not None and fts:
+        key = "f.rowid"
+    elif by_product:
+        key = "i.order_id"
+    else:
+        key = "o.id"
+    where = [f"{key} BETWEEN ? AND ?"]
+    params: List[Any] = [lo, hi]
+    if flt.date_from:
+        where.append("o.created_at >= ?")
+        params.append(flt.date_from)
+    if flt.date_to:
+        where.append("o.created_at < ?")
+        params.append(flt.date_to)
+    if flt.user_id is not None:
+        where.append("o.user_id = ?")
+        params.append(flt.user_id)
+    if flt.phone:
+        # Typed numbers are stored as "+998…", shared contacts often without the plus
+        where.append("o.phone IN (?, ?)")
+        params += ["+" + flt.phone, flt.phone]
+
+    source = "orders o"
+    group = ""
+    if by_product:
+        source = "order_items i JOIN orders o ON o.id = i.order_id"
+        where.insert(0, "i.product_id = ?")
+        params.insert(0, flt.product_id)
+        group = f"GROUP BY {key} "  # an order may list the same product twice
+    elif flt.product_id:
+        where.append("EXISTS (SELECT 1 FROM order_items i WHERE i.order_id = o.id AND i.product_id = ?)")
+        params.append(flt.product_id)
+    if query is not None:
+        if fts:
+            source = "orders_fts f JOIN orders o ON o.id = f.rowid"
+            where.insert(0, "orders_fts MATCH ?")
+            params.insert(0, query)
+        else:
+            # No FTS5 in this SQLite build: substring match (scans, but still stops at limit)
+            like = "%" + flt.text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            where.append("(o.user_name LIKE ? ESCAPE '\\' OR o.phone LIKE ? ESCAPE '\\' OR o.address LIKE ? ESCAPE '\\')")
+            params += [like, like, like]
+
+    order = "ASC" if after is not None and before is None else "DESC"
+    sql = (
+        f"SELECT {ORDER_LIST_COLUMNS} FROM {source} WHERE {' AND '.join(where)} "
+        f"{group}ORDER BY {key} {order} LIMIT ?"
+    )
+    rows = con.execute(sql, params + [limit + 1]).fetchall()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if order == "ASC":
+        rows.reverse()
+        # We came from an older page, so there is one; `more` means newer rows remain
+        return rows, True, more
+    return rows, more, before is not None
+
+
+class OrderIngestQueue:
+    """
+    Group commit for order inserts. Callers get their own lastrowid back, but rows that
+    arrive within `max_latency` seconds (or until `max_rows` are pending) share one
+    transaction — one fsync/WAL frame flush instead of one per order. While a batch is
+    being written the next one keeps accumulating.
+    """
+
+    def __init__(self, repo: "OrderRepository", max_latency: float = 0.005, max_rows: int = 200):
+        self.repo = repo
+        self.max_latency = max_latency
+        self.max_rows = max(1, max_rows)
+        self._pending: Deque[Tuple[Tuple, asyncio.Future]] = deque()
+        self._wake: Optional[asyncio.Event] = None
+        self._full: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._busy = False
+        self.stats = {"batches": 0, "rows": 0, "max_batch": 0, "max_depth": 0, "failed": 0}
+
+    @property
+    def depth(self) -> int:
+        """Orders waiting to be committed."""
+        return len(self._pending)
+
+    def _ensure_started(self) -> None:
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._full = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def submit(self, row: Tuple) -> "asyncio.Future[int]":
+        self._ensure_started()
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append((row, fut))
+        self._wake.set()
+        if len(self._pending) > self.stats["max_depth"]:
+            self.stats["max_depth"] = len(self._pending)
+        if len(self._pending) >= self.max_rows:
+            self._full.set()
+        return fut
+
+    async def _run(self) -> None:
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            if not self._pending:
+                continue
+            if len(self._pending) < self.max_rows and self.max_latency > 0:
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.max_latency)
+                except asyncio.TimeoutError:
+                    pass
+            self._full.clear()
+            n = min(len(self._pending), self.max_rows)
+            batch = [self._pending.popleft() for _ in range(n)]
+            if self._pending:
+                self._wake.set()
+            self._busy = True
+            try:
+                await self._flush(batch)
+            finally:
+                self._busy = False
+
+    async def _flush(self, batch) -> None:
+        rows = [row for row, _ in batch]
+        try:
+            results = await self.repo.write(lambda con: self.repo._commit_batch(con, rows))
+        except Exception as e:
+            logging.exception("Order batch commit failed (%d rows)", len(rows))
+            results = [e] * len(rows)
+        self.stats["batches"] += 1
+        self.stats["rows"] += len(rows)
+        self.stats["max_batch"] = max(self.stats["max_batch"], len(rows))
+        for (_, fut), res in zip(batch, results):
+            if fut.done():
+                continue
+            if isinstance(res, BaseException):
+                self.stats["failed"] += 1
+                fut.set_exception(res)
+            else:
+                fut.set_result(res)
+
+    async def drain(self) -> None:
+        """Commit everything still pending and stop the flusher."""
+        while self._task is not None and not self._task.done() and (self._pending or self._busy):
+            self._full.set()
+            self._wake.set()
+            await asyncio.sleep(0.001)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+class OrderRepository:
+    """
+    All SQLite work runs off the event loop:
+      - writer: a single dedicated thread owning one persistent connection (serialized writes)
+      - reader: a second thread with its own read-only connection (WAL lets it run alongside writes)
+    Handlers only await futures.
+    """
+
+    def __init__(self, path: str = "data/orders.db", batch_latency: float = 0.005, batch_rows: int = 200):
+        self.path = path
+        self.ingest = OrderIngestQueue(self, max_latency=batch_latency, max_rows=batch_rows)
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="orders-writer")
+        self._reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="orders-reader")
+        self._wcon: Optional[sqlite3.Connection] = None
+        self._rcon: Optional[sqlite3.Connection] = None
+        self.has_fts = False
+
+    # ---- connections (created lazily inside their own thread) ----
+    def _writer_con(self) -> sqlite3.Connection:
+        if self._wcon is None:
+            d = os.path.dirname(self.path)
+            if d:
+                os.makedirs(d, exist_ok=True)
+            con = connect(self.path)
+            for stmt in SCHEMA:
+                con.execute(stmt)
+            # Columns added after the first release
+            if "lang" not in {r[1] for r in con.execute("PRAGMA table_info(orders)")}:
+                con.execute("ALTER TABLE orders ADD COLUMN lang TEXT")
+            self.has_fts = self._ensure_fts(con)
+            self._ensure_rollups(con)
+            self._wcon = con
+        return self._wcon
+
+    @staticmethod
+    def _ensure_rollups(con: sqlite3.Connection) -> None:
+        if con.execute("SELECT 1 FROM sqlite_master WHERE name='sales_daily'").fetchone():
+            return
+        # First start with rollups: fold in the orders written before they existed
+        n = rebuild_rollups(con)
+        logging.info("Sotuv rollup jadvallari yaratildi (%d buyurtma)", n)
+
+    @staticmethod
+    def _ensure_fts(con: sqlite3.Connection) -> bool:
+        if con.execute("SELECT 1 FROM sqlite_master WHERE name='orders_fts'").fetchone():
+            return True
+        try:
+            con.execute("BEGIN IMMEDIATE")
+            for stmt in FTS_SCHEMA:
+                con.execute(stmt)
+            # Index the orders written before search existed
+            con.execute("INSERT INTO orders_fts(orders_fts) VALUES ('rebuild')")
+            con.execute("COMMIT")
+        except sqlite3.OperationalError as e:
+            con.execute("ROLLBACK")
+            logging.warning("FTS5 mavjud emas, qidiruv LIKE bilan ishlaydi: %s", e)
+            return False
+        return True
+
+    def _reader_con(self) -> sqlite3.Connection:
+        if self._rcon is None:
+            # Make sure the file + schema exist before opening the read-only side
+            self._writer.submit(self._writer_con).result()
+            self._rcon = connect(self.path, readonly=True)
+        return self._rcon
+
+    # ---- generic executors ----
+    async def write(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, lambda: fn(self._writer_con()))
+
+    async def read(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._reader, lambda: fn(self._reader_con()))
+
+    # ---- orders ----
+    def _insert_one(self, con: sqlite3.Connection, row: Tuple) -> int:
+        oid = con.execute(SQL_INSERT_ORDER, row).lastrowid
+        # Same savepoint as the order: items and rollups never drift from the orders table
+        cart = load_cart(row[4])
+        con.executemany(SQL_INSERT_ITEM, item_rows(oid, cart))
+        apply_order(con, row[6], row[9], cart, row[5])
+        return oid
+
+    def _commit_batch(self, con: sqlite3.Connection, rows: List[Tuple]) -> List[Any]:
+        """
+        Insert all rows in one transaction (writer thread). Each row gets its own
+        savepoint, so a bad row fails only its caller, not the whole batch.
+        """
+        results: List[Any] = []
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            for row in rows:
+                con.execute("SAVEPOINT o")
+                try:
+                    results.append(self._insert_one(con, row))
+                    con.execute("RELEASE o")
+                except Exception as e:
+                    # sqlite errors, and also ValueError/TypeError from a malformed cart in
+                    # item_rows()/apply_order(): only this row is rolled back
+                    con.execute("ROLLBACK TO o")
+                    con.execute("RELEASE o")
+                    results.append(e)
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+        return results
+
+    async def insert_order(self, user_id, name, phone, address, cart, total, lat=None, lon=None, lang=None) -> int:
+        row = order_row(user_id, name, phone, address, cart, total, lat, lon, lang)
+        return await self.ingest.submit(row)
+
+    async def recent(self, limit: int = 20) -> List[Tuple]:
+        return await self.read(lambda con: con.execute(SQL_RECENT_ORDERS, (limit,)).fetchall())
+
+    async def page(
+        self,
+        flt: Optional[OrderFilter] = None,
+        before: Optional[int] = None,
+        after: Optional[int] = None,
+        limit: int = 20,
+    ) -> Tuple[List[Tuple], bool, bool]:
+        """Keyset-paginated, filtered order list: (rows, has_older, has_newer)."""
+        flt = flt or OrderFilter()
+        return await self.read(lambda con: query_orders_page(con, flt, before, after, limit, self.has_fts))
+
+    async def migrate_items(self, chunk: int = 1000) -> int:
+        """
+        Backfill order_items from cart_json for orders saved before the table existed.
+        Each chunk is its own short write, so new orders keep flowing in between.
+        Returns the number of orders expanded (0 when already done).
+        """
+        cursor = await self.read(items_migration_cursor)
+        total = 0
+        while cursor is not None:
+            last, n, _ = await self.write(lambda con, c=cursor: migrate_items_chunk(con, c, chunk))
+            total += n
+            cursor = None if not n else last
+        if total:
+            logging.info("order_items: %d buyurtma ko‘chirildi", total)
+        return total
+
+    def init_sync(self) -> None:
+        """Create the DB file and schema (blocking; safe to call at startup)."""
+        self._writer.submit(self._writer_con).result()
+
+    def close(self) -> None:
+        def _close(attr):
+            con = getattr(self, attr)
+            if con is not None:
+                try:
+                    con.close()
+                except Exception:
+                    logging.exception("SQLite close failed")
+                setattr(self, attr, None)
+
+        self._reader.submit(_close, "_rcon").result()
+        self._writer.submit(_close, "_wcon").result()
+        self._reader.shutdown(wait=True)
+        self._writer.shutdown(wait=True)
+
+
+if __name__ == "__main__":
+    # python orders_db.py migrate-items [data/orders.db] [chunk]
+    if len(sys.argv) < 2 or sys.argv[1] != "migrate-items":
+        sys.exit("usage: python orders_db.py migrate-items [data/orders.db] [chunk]")
+    logging.basicConfig(level=logging.INFO)
+    repo = OrderRepository(sys.argv[2] if len(sys.argv) > 2 else "data/orders.db")
+    print(f"migrated {asyncio.run(repo.migrate_items(int(sys.argv[3]) if len(sys.argv) > 3 else 1000))} orders")
+    repo.close()
@@ -0,0 +1,282 @@
+# outbox.py — ASALBOY admin notification outbox (durable queue + paced background sender)
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+from ratelimit import PRIO_BACKGROUND, REQUEST_PRIORITY
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS outbox(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_id INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_at REAL NOT NULL,
+        created_at REAL NOT NULL,
+        sent_at REAL,
+        last_error TEXT
+    )""",
+    "CREATE INDEX IF NOT EXISTS outbox_due ON outbox(status, next_at)",
+)
+
+TG_TEXT_LIMIT = 4096
+DIGEST_SEP = "\n\n➖➖➖➖➖\n\n"
+
+
+def _tx(con: sqlite3.Connection, sql: str, rows) -> None:
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        con.executemany(sql, rows)
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+
+
+class AdminOutbox:
+    """
+    Admin chat notifications go through a table instead of being awaited inline,
+    so checkout replies never wait on (or fail because of) the admin chat.
+
+    The sender task:
+      - sends at most one API call per `min_interval` seconds to the chat (Telegram
+        allows ~20 msg/min in groups),
+      - sleeps for `retry_after` on 429 without spending an attempt,
+      - retries other failures with exponential backoff up to `max_attempts`,
+      - when `digest_threshold` or more messages are due at once, merges them into
+        as few messages as fit in 4096 chars (location pins are dropped then — every
+        order text already carries a maps link),
+      - once every `prune_every` seconds deletes sent rows older than `keep_days`
+        (failed rows stay for inspection).
+    """
+
+    def __init__(
+        self,
+        repo,
+        bot,
+        min_interval: float = 3.0,
+        digest_threshold: int = 3,
+        max_attempts: int = 8,
+        poll_interval: float = 30.0,
+        keep_days: float = 7.0,
+        prune_every: float = 3600.0,
+    ):
+        self.repo = repo
+        self.bot = bot
+        self.min_interval = min_interval
+        self.digest_threshold = digest_threshold
+        self.max_attempts = max_attempts
+        # Rows enqueued by other worker processes cannot wake us: they wait at most this long
+        self.poll_interval = poll_interval
+        self.keep_days = keep_days
+        self.prune_every = prune_every
+        self._pruned_at = 0.0
+        self._ready = False
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._last_send = 0.0
+        self.stats = {"enqueued": 0, "sent": 0, "digests": 0, "retry_after": 0, "errors": 0, "failed": 0, "pruned": 0}
+
+    async def _ensure_schema(self) -> None:
+        if not self._ready:
+            def _create(con):
+                for stmt in SCHEMA:
+                    con.execute(stmt)
+            await self.repo.write(_create)
+            self._ready = True
+
+    # ---- producer side ----
+    async def _enqueue(self, chat_id: int, kind: str, payload: Dict[str, Any]) -> None:
+        await self._ensure_schema()
+        now = time.time()
+        row = (chat_id, kind, json.dumps(payload, ensure_ascii=False), now, now)
+        await self.repo.write(lambda con: _tx(
+            con, "INSERT INTO outbox(chat_id,kind,payload,next_at,created_at) VALUES (?,?,?,?,?)", [row]
+        ))
+        self.stats["enqueued"] += 1
+        if self._wake is not None:
+            self._wake.set()
+
+    async def send_message(self, chat_id: int, text: str, **kwargs) -> None:
+        await self._enqueue(chat_id, "message", {"text": text, **kwargs})
+
+    async def send_location(self, chat_id: int, latitude: float, longitude: float) -> None:
+        await self._enqueue(chat_id, "location", {"latitude": latitude, "longitude": longitude})
+
+    async def pending(self) -> int:
+        await self._ensure_schema()
+        return await self.repo.read(
+            lambda con: con.execute("SELECT COUNT(*) FROM outbox WHERE status='pending'").fetchone()[0]
+        )
+
+    # ---- sender side ----
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    @staticmethod
+    def _due(con: sqlite3.Connection, now: float) -> List[Tuple]:
+        return con.execute(
+            "SELECT id,chat_id,kind,payload,attempts FROM outbox "
+            "WHERE status='pending' AND next_at<=? ORDER BY id LIMIT 100",
+            (now,),
+        ).fetchall()
+
+    @staticmethod
+    def _next_due(con: sqlite3.Connection) -> Optional[float]:
+        row = con.execute("SELECT MIN(next_at) FROM outbox WHERE status='pending'").fetchone()
+        return row[0] if row else None
+
+    async def _prune(self) -> None:
+        if time.monotonic() - self._pruned_at < self.prune_every:
+            return
+        self._pruned_at = time.monotonic()
+        before = time.time() - self.keep_days * 86400
+        n = await self.repo.write(lambda con: con.execute(
+            "DELETE FROM outbox WHERE status='sent' AND sent_at<?", (before,)
+        ).rowcount)
+        if n:
+            self.stats["pruned"] += n
+            logging.info("Outbox: %d ta eski yuborilgan xabar o‘chirildi", n)
+
+    async def _pace(self) -> None:
+        wait = self._last_send + self.min_interval - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def _call(self, chat_id: int, kind: str, payload: Dict[str, Any]) -> None:
+        await self._pace()
+        # customer-facing calls go first when the global rate limiter is saturated
+        token = REQUEST_PRIORITY.set(PRIO_BACKGROUND)
+        try:
+            if kind == "location":
+                await self.bot.send_location(chat_id, **payload)
+            else:
+                await self.bot.send_message(chat_id, **payload)
+        finally:
+            REQUEST_PRIORITY.reset(token)
+            self._last_send = time.monotonic()
+
+    async def _mark_sent(self, ids: List[int]) -> None:
+        now = time.time()
+        await self.repo.write(lambda con: _tx(
+            con, "UPDATE outbox SET status='sent', sent_at=? WHERE id=?", [(now, i) for i in ids]
+        ))
+        self.stats["sent"] += len(ids)
+
+    async def _mark_failed(self, rows: List[Tuple], err: Exception, permanent: bool = False) -> None:
+        now = time.time()
+        updates = []
+        for _id, _chat, _kind, _payload, attempts in rows:
+            attempts += 1
+            status = "failed" if permanent or attempts >= self.max_attempts else "pending"
+            if status == "failed":
+                self.stats["failed"] += 1
+            backoff = min(300.0, 2.0 ** attempts)
+            updates.append((status, attempts, now + backoff, repr(err)[:500], _id))
+        await self.repo.write(lambda con: _tx(
+            con, "UPDATE outbox SET status=?, attempts=?, next_at=?, last_error=? WHERE id=?", updates
+        ))
+
+    def _digest_chunks(self, rows: List[Tuple]) -> List[Tuple[List[Tuple], str]]:
+        """Group message rows into [(rows, text)] chunks that fit Telegram's limit."""
+        chunks: List[Tuple[List[Tuple], str]] = []
+        cur_rows: List[Tuple] = []
+        cur_text = ""
+        for r in rows:
+            text = json.loads(r[3]).get("text", "")
+            candidate = text if not cur_text else cur_text + DIGEST_SEP + text
+            if cur_rows and len(candidate) > TG_TEXT_LIMIT - 100:
+                chunks.append((cur_rows, cur_text))
+                cur_rows, candidate = [], text
+            cur_rows.append(r)
+            cur_text = candidate
+        if cur_rows:
+            chunks.append((cur_rows, cur_text))
+        return chunks
+
+    async def _deliver(self, group: List[Tuple], kind: str, payload: Dict[str, Any]) -> None:
+        chat_id = group[0][1]
+        while True:
+            try:
+                await self._call(chat_id, kind, payload)
+            except TelegramRetryAfter as e:
+                # Telegram told us exactly how long to wait; it is not the message's fault
+                self.stats["retry_after"] += 1
+                logging.warning("Outbox: 429, %ss kutamiz", e.retry_after)
+                await asyncio.sleep(e.retry_after)
+                continue
+            except (TelegramBadRequest, TelegramForbiddenError) as e:
+                self.stats["errors"] += 1
+                logging.error("Outbox: admin chatga yuborib bo‘lmadi: %s", e)
+                await self._mark_failed(group, e, permanent=isinstance(e, TelegramForbiddenError))
+                return
+            except Exception as e:
+                self.stats["errors"] += 1
+                logging.exception("Outbox send failed")
+                await self._mark_failed(group, e)
+                return
+            await self._mark_sent([r[0] for r in group])
+            return
+
+    async def _run(self) -> None:
+        await self._ensure_schema()
+        while True:
+            try:
+                # Cleared before the query: an _enqueue that commits while we read still
+                # leaves the event set, so the wait below returns at once
+                self._wake.clear()
+                await self._prune()
+                rows = await self.repo.read(lambda con: self._due(con, time.time()))
+                if not rows:
+                    next_at = await self.repo.read(self._next_due)
+                    timeout = self.poll_interval if next_at is None else max(0.05, min(self.poll_interval, next_at - time.time()))
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                by_chat: Dict[int, List[Tuple]] = {}
+                for r in rows:
+                    by_chat.setdefault(r[1], []).append(r)
+                for chat_rows in by_chat.values():
+                    msgs = [r for r in chat_rows if r[2] == "message"]
+                    if len(msgs) >= self.digest_threshold:
+                        # Backlog: collapse into digest messages, skip the pins
+                        pins = [r for r in chat_rows if r[2] == "location"]
+                        if pins:
+                            await self._mark_sent([r[0] for r in pins])
+                        chunks = self._digest_chunks(msgs)
+                        for group, text in chunks:
+                            self.stats["digests"] += 1
+                            header = f"🧾 {len(group)} ta buyurtma\n\n" if len(group) > 1 else ""
+                            await self._deliver(
+                                group, "message",
+                                {"text": header + text, "disable_web_page_preview": True},
+                            )
+                    else:
+                        for r in chat_rows:
+                            await self._deliver([r], r[2], json.loads(r[3]))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.exception("Outbox loop error")
+                await asyncio.sleep(1.0)
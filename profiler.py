@@ -0,0 +1,207 @@
+# profiler.py — ASALBOY on-demand, time-boxed profiler of the live event loop
+#
+# Nothing is installed until a profile is started (/profile or GET /api/profile), and
+# everything is removed when it ends:
+#   * a sampler thread reads the event loop thread's stack every PROFILE_INTERVAL_MS and
+#     counts collapsed stacks ("a;b;c N" — flamegraph.pl / speedscope input);
+#   * an aiogram inner middleware records wall and CPU time per handler; CPU is charged
+#     per task step (asyncio.Handle._run), so time spent in other tasks while a handler
+#     awaits is not counted;
+#   * the loop runs in debug mode, and callbacks slower than PROFILE_SLOW_MS are collected
+#     from asyncio's "Executing ... took" warnings.
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import contextvars
+from typing import Dict, List, Optional, Tuple
+
+# CPU-time accumulator of the handler running in the current task (set by _HandlerTimer)
+_CPU: contextvars.ContextVar = contextvars.ContextVar("profiler_cpu", default=None)
+
+
+class _Cpu:
+    __slots__ = ("total", "since")
+
+    def __init__(self):
+        self.total = 0.0
+        self.since: Optional[float] = time.thread_time()
+
+
+def _counting_run(orig):
+    # Handle._run replacement while profiling: adds each step's thread CPU time to the
+    # accumulator of the handler running in that step's context (if any)
+    def _run(self):
+        acc = self._context.get(_CPU)
+        if acc is not None:
+            acc.since = time.thread_time()
+        try:
+            return orig(self)
+        finally:
+            acc = self._context.get(_CPU)  # also set when a handler started during this step
+            if acc is not None and acc.since is not None:
+                acc.total += time.thread_time() - acc.since
+                acc.since = None
+
+    return _run
+
+
+class _HandlerTimer:
+    """aiogram inner middleware, registered only for the duration of a profile."""
+
+    def __init__(self, stats: Dict[str, List[float]]):
+        self.stats = stats  # handler -> [calls, wall, cpu, max wall]
+
+    async def __call__(self, handler, event, data):
+        name = getattr(getattr(data.get("handler"), "callback", None), "__name__", "unknown")
+        acc = _Cpu()
+        token = _CPU.set(acc)
+        t = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            wall = time.perf_counter() - t
+            if acc.since is not None:
+                acc.total += time.thread_time() - acc.since
+                acc.since = None
+            _CPU.reset(token)
+            s = self.stats.setdefault(name, [0, 0.0, 0.0, 0.0])
+            s[0] += 1
+            s[1] += wall
+            s[2] += acc.total
+            s[3] = max(s[3], wall)
+
+
+class _SlowCallbacks(logging.Handler):
+    def __init__(self, out: List[Tuple[float, str]]):
+        super().__init__(logging.WARNING)
+        self.out = out
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if record.msg == "Executing %s took %.3f seconds" and len(self.out) < 500:
+            self.out.append((float(record.args[1]), str(record.args[0])))
+
+
+def _frame_name(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class ProfileReport:
+    def __init__(self, seconds: float, interval: float):
+        self.seconds = seconds
+        self.interval = interval
+        self.stacks: Dict[str, int] = {}
+        self.handlers: Dict[str, List[float]] = {}
+        self.slow: List[Tuple[float, str]] = []
+
+    @property
+    def samples(self) -> int:
+        return sum(self.stacks.values())
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in sorted(self.stacks.items(), key=lambda kv: -kv[1]))
+
+    def handler_rows(self) -> List[Tuple[str, int, float, float, float]]:
+        """(handler, calls, avg wall ms, avg cpu ms, max wall ms), slowest total first."""
+        rows = [(name, int(c), w / c * 1000, cpu / c * 1000, mx * 1000)
+                for name, (c, w, cpu, mx) in self.handlers.items() if c]
+        return sorted(rows, key=lambda r: -r[1] * r[2])
+
+    def summary(self, limit: int = 15) -> str:
+        lines = [f"⏱ Profil: {self.seconds:g} s, {self.samples} namuna ({self.interval * 1000:g} ms)"]
+        if self.handlers:
+            lines.append("Handler — soni, o‘rtacha wall / CPU, max (ms):")
+            for name, n, wall, cpu, mx in self.handler_rows()[:limit]:
+                lines.append(f"  {name} — {n}, {wall:.1f} / {cpu:.1f}, {mx:.1f}")
+        if self.slow:
+            lines.append(f"Sekin callbacklar ({len(self.slow)}):")
+            for dt, what in sorted(self.slow, reverse=True)[:limit]:
+                lines.append(f"  {dt * 1000:.0f} ms  {what[:150]}")
+        return "\n".join(lines)
+
+    def as_dict(self) -> dict:
+        return {
+            "seconds": self.seconds,
+            "samples": self.samples,
+            "handlers": [
+                {"handler": name, "calls": n, "avg_wall_ms": round(w, 3), "avg_cpu_ms": round(c, 3), "max_wall_ms": round(m, 3)}
+                for name, n, w, c, m in self.handler_rows()
+            ],
+            "slow_callbacks": [{"ms": round(dt * 1000, 1), "callback": what} for dt, what in sorted(self.slow, reverse=True)],
+        }
+
+
+class LoopProfiler:
+    """
+    One profile at a time: `await run(seconds)` samples the loop it is awaited on and
+    returns a ProfileReport. `dp` (optional) is the Dispatcher whose handlers get timed.
+    """
+
+    def __init__(self, dp=None, interval: float = 0.005, slow_callback: float = 0.05, max_seconds: float = 120.0):
+        self.dp = dp
+        self.interval = interval
+        self.slow_callback = slow_callback
+        self.max_seconds = max_seconds
+        self._lock = asyncio.Lock()
+
+    @property
+    def active(self) -> bool:
+        return self._lock.locked()
+
+    def _sample(self, tid: int, stacks: Dict[str, int], stop: threading.Event) -> None:
+        while not stop.wait(self.interval):
+            frame = sys._current_frames().get(tid)
+            names = []
+            while frame is not None:
+                names.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            if names:
+                key = ";".join(reversed(names))
+                stacks[key] = stacks.get(key, 0) + 1
+
+    async def run(self, seconds: float) -> ProfileReport:
+        if self._lock.locked():
+            raise RuntimeError("profile already running")
+        async with self._lock:
+            seconds = max(1.0, min(float(seconds), self.max_seconds))
+            report = ProfileReport(seconds, self.interval)
+            loop = asyncio.get_running_loop()
+
+            timer = _HandlerTimer(report.handlers)
+            observers = [o for name, o in (self.dp.observers.items() if self.dp is not None else ())
+                         if name != "update"]
+            for o in observers:
+                o.middleware.register(timer)
+            Handle = asyncio.events.Handle
+            orig_run = Handle._run
+            Handle._run = _counting_run(orig_run)
+
+            slow = _SlowCallbacks(report.slow)
+            asyncio_log = logging.getLogger("asyncio")
+            asyncio_log.addHandler(slow)
+            was_debug, was_slow = loop.get_debug(), loop.slow_callback_duration
+            loop.slow_callback_duration = self.slow_callback
+            loop.set_debug(True)
+
+            stop = threading.Event()
+            sampler = threading.Thread(
+                target=self._sample, args=(threading.get_ident(), report.stacks, stop),
+                name="loop-profiler", daemon=True,
+            )
+            sampler.start()
+            logging.info("Profil boshlandi: %g s", seconds)
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                stop.set()
+                await asyncio.to_thread(sampler.join)
+                loop.set_debug(was_debug)
+                loop.slow_callback_duration = was_slow
+                asyncio_log.removeHandler(slow)
+                Handle._run = orig_run
+                for o in observers:
+                    o.middleware.unregister(timer)
+            logging.info("Profil tugadi: %d namuna", report.samples)
+            return report
@@ -0,0 +1,215 @@
+# qty_stepper.py — ASALBOY debounced "+"/"−" quantity stepper (N taps -> one edit_reply_markup)
+import time
+import asyncio
+import logging
+from typing import Callable, Dict, Optional, Tuple
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import InlineKeyboardMarkup
+
+Key = Tuple[int, int]  # (chat_id, message_id)
+
+
+class _Pending:
+    __slots__ = ("pid", "lang", "qty", "shown", "first_tap", "touched", "timer", "task")
+
+    def __init__(self, pid: str, lang: str, shown: int):
+        self.pid = pid
+        self.lang = lang
+        self.qty = shown
+        self.shown = shown  # quantity the message's keyboard currently displays
+        self.first_tap = 0.0
+        self.touched = time.monotonic()
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.task: Optional[asyncio.Task] = None
+
+
+class QtyStepper:
+    """
+    In-memory quantity per (chat, message). A tap only changes the number and is answered
+    right away; the keyboard is edited once the taps stop for `delay` seconds (or at the
+    latest `max_wait` seconds after the first tap of a burst, so a user hammering "+"
+    still sees progress). Only the latest quantity is sent, and nothing is sent when it
+    already matches what the message shows.
+
+    The stored quantity, not the one in callback_data, is authoritative: buttons tapped
+    before an edit lands still carry the old number.
+
+    Single process only (see SharedQtyStepper). `state`, the chat's FSMContext, is taken
+    for the common interface and not used.
+    """
+
+    def __init__(
+        self,
+        bot,
+        build_kb: Callable[[str, int, str], InlineKeyboardMarkup],
+        delay: float = 0.4,
+        max_wait: float = 1.2,
+        min_qty: int = 1,
+        max_qty: int = 99,
+        idle_ttl: float = 600.0,
+    ):
+        self.bot = bot
+        self.build_kb = build_kb
+        self.delay = delay
+        self.max_wait = max_wait
+        self.min_qty = min_qty
+        self.max_qty = max_qty
+        self.idle_ttl = idle_ttl
+        self._state: Dict[Key, _Pending] = {}
+        self.stats = {"taps": 0, "edits": 0, "not_modified": 0, "errors": 0}
+
+    def _clamp(self, q: int) -> int:
+        return max(self.min_qty, min(self.max_qty, q))
+
+    def _sweep(self, now: float) -> None:
+        if len(self._state) < 1024:
+            return
+        for key in [k for k, p in self._state.items()
+                    if now - p.touched > self.idle_ttl and p.timer is None and p.task is None]:
+            del self._state[key]
+
+    async def tap(self, state, chat_id: int, message_id: int, pid: str, shown: int, delta: int, lang: str) -> int:
+        """Register one "+1"/"−1" tap; returns the new quantity (for the callback answer)."""
+        now = time.monotonic()
+        self._sweep(now)
+        self.stats["taps"] += 1
+        key = (chat_id, message_id)
+        p = self._state.get(key)
+        if p is None or p.pid != pid:
+            p = self._state[key] = _Pending(pid, lang, self._clamp(shown))
+        p.lang = lang
+        p.touched = now
+        p.qty = self._clamp(p.qty + delta)
+        if p.task is None:
+            self._schedule(key, p, now)
+        # else: the running flush schedules the next edit when it finishes
+        return p.qty
+
+    def _schedule(self, key: Key, p: _Pending, now: float) -> None:
+        if p.timer is None:
+            p.first_tap = now
+        else:
+            p.timer.cancel()
+        due = min(now + self.delay, p.first_tap + self.max_wait)
+        loop = asyncio.get_running_loop()
+        p.timer = loop.call_at(loop.time() + max(0.0, due - now), self._fire, key)
+
+    def _fire(self, key: Key) -> None:
+        p = self._state.get(key)
+        if p is None:
+            return
+        p.timer = None
+        p.task = asyncio.get_running_loop().create_task(self._flush(key, p))
+
+    async def _flush(self, key: Key, p: _Pending) -> None:
+        try:
+            qty = p.qty
+            if qty == p.shown or self._state.get(key) is not p:
+                return
+            while True:
+                try:
+                    await self.bot.edit_message_reply_markup(
+                        chat_id=key[0], message_id=key[1], reply_markup=self.build_kb(p.pid, qty, p.lang)
+                    )
+                    self.stats["edits"] += 1
+                    break
+                except TelegramRetryAfter as e:
+                    await asyncio.sleep(e.retry_after)
+                    qty = p.qty
+                except TelegramBadRequest as e:
+                    if "not modified" not in str(e):
+                        self.stats["errors"] += 1
+                        logging.warning("Miqdor tugmasi yangilanmadi: %s", e)
+                        self._state.pop(key, None)
+                        return
+                    self.stats["not_modified"] += 1
+                    break
+            p.shown = qty
+        except Exception:
+            self.stats["errors"] += 1
+            logging.exception("Qty stepper flush failed")
+        finally:
+            p.task = None
+            # taps that arrived during the edit start a new debounce window
+            if p.qty != p.shown and self._state.get(key) is p:
+                self._schedule(key, p, time.monotonic())
+
+    async def current(self, state, chat_id: int, message_id: int, pid: str) -> Optional[int]:
+        """Latest quantity for this message if it is stepping `pid` (None = use callback data)."""
+        p = self._state.get((chat_id, message_id))
+        return p.qty if p is not None and p.pid == pid else None
+
+    async def discard(self, state, chat_id: int, message_id: int) -> None:
+        """
+        Forget the message before its keyboard is replaced: cancels a pending edit and
+        waits for one already in flight, so it cannot land on top of the new keyboard.
+        """
+        p = self._state.pop((chat_id, message_id), None)
+        if p is None:
+            return
+        if p.timer is not None:
+            p.timer.cancel()
+            p.timer = None
+        if p.task is not None:
+            await asyncio.shield(p.task)
+
+
+class SharedQtyStepper:
+    """
+    QtyStepper for several worker processes (SHARED_STATE). Taps on one message can land
+    on different workers, so the quantity lives in the chat's FSM data (the shared SQLite
+    storage) and every tap edits the keyboard right away: a debounced edit in one process
+    could land after another process has already moved the quantity on. Callers must
+    handle a chat's updates one at a time (webhook.ChatLock), or taps get lost.
+    """
+
+    KEY = "qty_step"  # FSM data: {"msg": message_id, "pid": ..., "qty": ...}
+
+    def __init__(
+        self,
+        bot,
+        build_kb: Callable[[str, int, str], InlineKeyboardMarkup],
+        min_qty: int = 1,
+        max_qty: int = 99,
+    ):
+        self.bot = bot
+        self.build_kb = build_kb
+        self.min_qty = min_qty
+        self.max_qty = max_qty
+        self.stats = {"taps": 0, "edits": 0, "not_modified": 0, "errors": 0}
+
+    def _clamp(self, q: int) -> int:
+        return max(self.min_qty, min(self.max_qty, q))
+
+    async def _stored(self, state, message_id: int, pid: str) -> Optional[int]:
+        st = (await state.get_data()).get(self.KEY)
+        if st and st.get("msg") == message_id and st.get("pid") == pid:
+            return st["qty"]
+        return None
+
+    async def tap(self, state, chat_id: int, message_id: int, pid: str, shown: int, delta: int, lang: str) -> int:
+        self.stats["taps"] += 1
+        stored = await self._stored(state, message_id, pid)
+        qty = self._clamp((self._clamp(shown) if stored is None else stored) + delta)
+        await state.update_data({self.KEY: {"msg": message_id, "pid": pid, "qty": qty}})
+        try:
+            await self.bot.edit_message_reply_markup(
+                chat_id=chat_id, message_id=message_id, reply_markup=self.build_kb(pid, qty, lang)
+            )
+            self.stats["edits"] += 1
+        except TelegramBadRequest as e:
+            if "not modified" in str(e):
+                self.stats["not_modified"] += 1
+            else:
+                self.stats["errors"] += 1
+                logging.warning("Miqdor tugmasi yangilanmadi: %s", e)
+        return qty
+
+    async def current(self, state, chat_id: int, message_id: int, pid: str) -> Optional[int]:
+        return await self._stored(state, message_id, pid)
+
+    async def discard(self, state, chat_id: int, message_id: int) -> None:
+        st = (await state.get_data()).get(self.KEY)
+        if st and st.get("msg") == message_id:
+            await state.update_data({self.KEY: None})
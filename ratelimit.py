@@ -0,0 +1,178 @@
+# ratelimit.py — ASALBOY outbound Telegram API limiter (global + per-chat token buckets, 429 retry)
+import time
+import heapq
+import asyncio
+import logging
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+# Lower number = served first when tokens are scarce
+PRIO_CALLBACK = 0     # answerCallbackQuery — the user is staring at a spinner
+PRIO_INTERACTIVE = 1  # text replies, keyboard edits, locations
+PRIO_MEDIA = 2        # catalog photos / albums
+PRIO_BACKGROUND = 3   # admin outbox, broadcasts
+
+# Lets background senders (e.g. the admin outbox) demote their calls:
+#   token = REQUEST_PRIORITY.set(PRIO_BACKGROUND) ... REQUEST_PRIORITY.reset(token)
+REQUEST_PRIORITY: ContextVar[Optional[int]] = ContextVar("REQUEST_PRIORITY", default=None)
+
+_MEDIA_METHODS = {"SendPhoto", "SendMediaGroup", "EditMessageMedia", "SendDocument", "SendVideo"}
+_LIMITED_PREFIXES = ("Send", "Edit", "Copy", "Forward")
+
+
+def method_priority(name: str) -> int:
+    if name == "AnswerCallbackQuery":
+        return PRIO_CALLBACK
+    if name in _MEDIA_METHODS:
+        return PRIO_MEDIA
+    return PRIO_INTERACTIVE
+
+
+def is_limited(name: str) -> bool:
+    return name == "AnswerCallbackQuery" or name.startswith(_LIMITED_PREFIXES)
+
+
+class PriorityTokenBucket:
+    """
+    Token bucket whose waiters are released in (priority, arrival) order.
+    No background task: a single loop timer fires when the next token is due.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    @property
+    def idle(self) -> bool:
+        self._refill(time.monotonic())
+        return not self._waiters and self.tokens >= self.burst and time.monotonic() >= self.blocked_until
+
+    async def acquire(self, priority: int = PRIO_INTERACTIVE) -> float:
+        """Take one token; returns the seconds spent waiting."""
+        now = time.monotonic()
+        self._refill(now)
+        if not self._waiters and self.tokens >= 1 and now >= self.blocked_until:
+            self.tokens -= 1
+            return 0.0
+        fut = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        heapq.heappush(self._waiters, (priority, self._seq, fut))
+        self._schedule()
+        await fut
+        return time.monotonic() - now
+
+    def block(self, seconds: float) -> None:
+        """Telegram said 429: nobody gets a token until `seconds` have passed."""
+        now = time.monotonic()
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.tokens = 0.0
+        self.updated = now
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._schedule()
+
+    def _schedule(self) -> None:
+        if self._timer is not None or not self._waiters:
+            return
+        now = time.monotonic()
+        self._refill(now)
+        delay = max(0.0, self.blocked_until - now)
+        if self.tokens < 1:
+            delay = max(delay, (1 - self.tokens) / self.rate)
+        self._timer = asyncio.get_running_loop().call_later(delay, self._release)
+
+    def _release(self) -> None:
+        self._timer = None
+        now = time.monotonic()
+        self._refill(now)
+        while self._waiters and self.tokens >= 1 and now >= self.blocked_until:
+            _, _, fut = heapq.heappop(self._waiters)
+            if fut.done():  # waiter was cancelled
+                continue
+            self.tokens -= 1
+            fut.set_result(None)
+        self._schedule()
+
+
+class TelegramRateLimiter(BaseRequestMiddleware):
+    """
+    Bot session middleware: every outgoing send/edit/answer call takes a token from the
+    per-chat bucket (1 msg/s in private chats, 20 msg/min in groups) and then from the
+    global bucket (~30 msg/s). On TelegramRetryAfter the chat (or everything, if no chat)
+    is paused for retry_after seconds and the call is retried up to `max_retries` times.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30.0,
+        private_rate: float = 1.0,
+        group_rate: float = 20 / 60,
+        chat_burst: float = 3.0,
+        max_retries: int = 3,
+        max_chats: int = 50_000,
+    ):
+        self.global_bucket = PriorityTokenBucket(global_rate, global_rate)
+        self.private_rate = private_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self._chats: Dict[int, PriorityTokenBucket] = {}
+        self.stats = {"calls": 0, "throttled": 0, "throttle_wait_s": 0.0, "retried": 0, "retry_after_s": 0.0, "gave_up": 0}
+
+    def _chat_bucket(self, chat_id: int) -> PriorityTokenBucket:
+        b = self._chats.get(chat_id)
+        if b is None:
+            if len(self._chats) >= self.max_chats:
+                # drop buckets that are full and have no waiters (they carry no information)
+                for cid in [c for c, bb in self._chats.items() if bb.idle]:
+                    del self._chats[cid]
+            rate = self.group_rate if chat_id < 0 else self.private_rate
+            b = self._chats[chat_id] = PriorityTokenBucket(rate, self.chat_burst)
+        return b
+
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        if not is_limited(name):
+            return await make_request(bot, method)
+        prio = REQUEST_PRIORITY.get()
+        if prio is None:
+            prio = method_priority(name)
+        chat_id = getattr(method, "chat_id", None)
+        chat_bucket = self._chat_bucket(chat_id) if isinstance(chat_id, int) else None
+        self.stats["calls"] += 1
+
+        attempt = 0
+        while True:
+            waited = 0.0
+            if chat_bucket is not None:
+                waited += await chat_bucket.acquire(prio)
+            waited += await self.global_bucket.acquire(prio)
+            if waited > 0:
+                self.stats["throttled"] += 1
+                self.stats["throttle_wait_s"] += waited
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                attempt += 1
+                self.stats["retry_after_s"] += e.retry_after
+                (chat_bucket or self.global_bucket).block(e.retry_after)
+                if attempt > self.max_retries:
+                    self.stats["gave_up"] += 1
+                    raise
+                self.stats["retried"] += 1
+                logging.warning("429 %s (chat %s): %ss kutilmoqda", name, chat_id, e.retry_after)
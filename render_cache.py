@@ -0,0 +1,76 @@
+# render_cache.py — ASALBOY memo of prebuilt keyboards / captions, keyed by (kind, args…, version)
+import functools
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Iterable, Tuple
+
+
+class RenderCache:
+    """
+    Keyboards and captions are pure functions of (kind, pid, qty, lang) plus the catalog
+    version and the translations, so each distinct one is built once and the same
+    pydantic markup object is handed to every callback afterwards (aiogram only reads it).
+
+    `version_fn()` returns the current catalog version; when it changes the whole memo is
+    dropped at the next lookup, so stale labels or prices are never served. The
+    translations are fixed at import: code that edits TR in place must call invalidate().
+    At most max_items entries are kept, least recently used evicted first.
+    Results must not be mutated by callers.
+    """
+
+    def __init__(self, version_fn: Callable[[], Hashable], max_items: int = 20_000):
+        self.version_fn = version_fn
+        self.max_items = max_items
+        self._version: Hashable = None
+        self._memo: "OrderedDict[Tuple, Any]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0, "evictions": 0}
+
+    def __len__(self) -> int:
+        return len(self._memo)
+
+    def _check_version(self) -> None:
+        v = self.version_fn()
+        if v != self._version:
+            if self._memo:
+                self.stats["invalidations"] += 1
+            self._memo.clear()
+            self._version = v
+
+    def get(self, kind: str, build: Callable[..., Any], *args: Hashable) -> Any:
+        self._check_version()
+        key = (kind, *args)
+        hit = self._memo.get(key)
+        if hit is not None:
+            self._memo.move_to_end(key)
+            self.stats["hits"] += 1
+            return hit
+        self.stats["misses"] += 1
+        value = build(*args)
+        self._memo[key] = value
+        if len(self._memo) > self.max_items:  # bounded: qty/pid come from callback data
+            self._memo.popitem(last=False)
+            self.stats["evictions"] += 1
+        return value
+
+    def cached(self, kind: str) -> Callable:
+        """Decorator: route a builder (positional, hashable args only) through the cache."""
+
+        def deco(build: Callable[..., Any]) -> Callable[..., Any]:
+            @functools.wraps(build)
+            def wrapper(*args: Hashable) -> Any:
+                return self.get(kind, build, *args)
+
+            wrapper.build = build  # uncached builder, for benchmarks
+            return wrapper
+
+        return deco
+
+    def warm(self, calls: Iterable[Tuple[Callable[..., Any], Tuple]]) -> int:
+        """Prebuild [(cached_fn, args), …]; returns how many entries the cache holds."""
+        for fn, args in calls:
+            fn(*args)
+        return len(self._memo)
+
+    def invalidate(self) -> None:
+        """Drop everything now; needed after TR was edited in place."""
+        self._memo.clear()
+        self._version = None
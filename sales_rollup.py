@@ -0,0 +1,188 @@
+# sales_rollup.py — ASALBOY sales rollups (per day / product / language), kept current inside each order transaction
+#
+#   python sales_rollup.py [data/orders.db]    # rebuild all rollups from the orders table
+import os
+import sys
+import json
+import time
+import logging
+import sqlite3
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Days are counted in shop time, not UTC (created_at is stored in UTC)
+TZ_OFFSET = timedelta(hours=float(os.getenv("STATS_TZ_OFFSET_HOURS", "5")))
+
+ROLLUP_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS sales_daily(
+        day TEXT NOT NULL, lang TEXT NOT NULL,
+        orders INTEGER NOT NULL DEFAULT 0, revenue INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY(day, lang)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS sales_product_daily(
+        day TEXT NOT NULL, product_id TEXT NOT NULL, lang TEXT NOT NULL,
+        orders INTEGER NOT NULL DEFAULT 0, qty INTEGER NOT NULL DEFAULT 0,
+        kg REAL NOT NULL DEFAULT 0, revenue INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY(day, product_id, lang)
+    ) WITHOUT ROWID""",
+)
+
+SQL_BUMP_DAILY = (
+    "INSERT INTO sales_daily(day,lang,orders,revenue) VALUES (?,?,?,?) "
+    "ON CONFLICT(day,lang) DO UPDATE SET orders=orders+excluded.orders, revenue=revenue+excluded.revenue"
+)
+SQL_BUMP_PRODUCT = (
+    "INSERT INTO sales_product_daily(day,product_id,lang,orders,qty,kg,revenue) VALUES (?,?,?,?,?,?,?) "
+    "ON CONFLICT(day,product_id,lang) DO UPDATE SET orders=orders+excluded.orders, qty=qty+excluded.qty, "
+    "kg=kg+excluded.kg, revenue=revenue+excluded.revenue"
+)
+
+
+def order_day(created_at: Optional[str]) -> str:
+    try:
+        ts = datetime.fromisoformat(created_at)
+    except (TypeError, ValueError):
+        return "unknown"
+    return (ts + TZ_OFFSET).date().isoformat()
+
+
+def today() -> date:
+    return (datetime.utcnow() + TZ_OFFSET).date()
+
+
+def load_cart(cart_json) -> List[Dict[str, Any]]:
+    """cart_json as stored in orders -> list of item dicts (garbage -> [])."""
+    if isinstance(cart_json, list):
+        return cart_json
+    try:
+        cart = json.loads(cart_json or "[]")
+    except ValueError:
+        return []
+    return [it for it in cart if isinstance(it, dict)] if isinstance(cart, list) else []
+
+
+def order_deltas(created_at, lang, cart, total) -> Tuple[Tuple, List[Tuple]]:
+    """One order -> (sales_daily row, [sales_product_daily rows]); same shapes as the upserts."""
+    day = order_day(created_at)
+    lang = lang or "?"
+    per_product: Dict[str, List] = {}
+    for it in load_cart(cart):
+        pid = str(it.get("product_id") or it.get("id") or "?")
+        qty = int(it.get("qty") or 1)
+        kg = float(it.get("kg") or 1.0) * qty
+        acc = per_product.setdefault(pid, [0, 0.0, 0])
+        acc[0] += qty
+        acc[1] += kg
+        acc[2] += int(it.get("price") or 0)
+    products = [(day, pid, lang, 1, q, kg, rev) for pid, (q, kg, rev) in per_product.items()]
+    return (day, lang, 1, int(total or 0)), products
+
+
+def apply_order(con: sqlite3.Connection, created_at, lang, cart, total) -> None:
+    """Add one order (cart_json or parsed items) to the rollups, inside the order's transaction."""
+    daily, products = order_deltas(created_at, lang, cart, total)
+    con.execute(SQL_BUMP_DAILY, daily)
+    if products:
+        con.executemany(SQL_BUMP_PRODUCT, products)
+
+
+def _accumulate(rows: Iterable[Tuple]) -> Tuple[Dict, Dict]:
+    daily: Dict[Tuple, List] = {}
+    products: Dict[Tuple, List] = {}
+    for created_at, lang, cart_json, total in rows:
+        d, ps = order_deltas(created_at, lang, cart_json, total)
+        acc = daily.setdefault(d[:2], [0, 0])
+        acc[0] += d[2]
+        acc[1] += d[3]
+        for p in ps:
+            acc = products.setdefault(p[:3], [0, 0, 0.0, 0])
+            for i, v in enumerate(p[3:]):
+                acc[i] += v
+    return daily, products
+
+
+def rebuild(con: sqlite3.Connection, batch: int = 5000) -> int:
+    """
+    Recompute every rollup from `orders` in one streaming pass (rows are fetched in
+    batches; only the aggregates — days x products x languages — are kept in memory).
+    Runs in its own IMMEDIATE transaction, so new orders wait instead of being missed.
+    Returns the number of orders read.
+    """
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        for stmt in ROLLUP_SCHEMA:
+            con.execute(stmt)
+        cur = con.execute("SELECT created_at, lang, cart_json, total FROM orders")
+        n = 0
+
+        def stream():
+            nonlocal n
+            while True:
+                chunk = cur.fetchmany(batch)
+                if not chunk:
+                    return
+                n += len(chunk)
+                yield from chunk
+
+        daily, products = _accumulate(stream())
+        con.execute("DELETE FROM sales_daily")
+        con.execute("DELETE FROM sales_product_daily")
+        con.executemany(
+            "INSERT INTO sales_daily(day,lang,orders,revenue) VALUES (?,?,?,?)",
+            [(*k, *v) for k, v in daily.items()],
+        )
+        con.executemany(
+            "INSERT INTO sales_product_daily(day,product_id,lang,orders,qty,kg,revenue) VALUES (?,?,?,?,?,?,?)",
+            [(*k, *v) for k, v in products.items()],
+        )
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    return n
+
+
+def query_stats(con: sqlite3.Connection, day_from: str, day_to: str) -> Dict[str, Any]:
+    """
+    Totals for [day_from, day_to] (inclusive, shop-local days). Reads only rollup rows,
+    so the cost depends on the number of days/products, not on order history.
+    """
+    orders, revenue = con.execute(
+        "SELECT COALESCE(SUM(orders),0), COALESCE(SUM(revenue),0) FROM sales_daily WHERE day BETWEEN ? AND ?",
+        (day_from, day_to),
+    ).fetchone()
+    by_lang = con.execute(
+        "SELECT lang, SUM(orders), SUM(revenue) FROM sales_daily WHERE day BETWEEN ? AND ? "
+        "GROUP BY lang ORDER BY 3 DESC",
+        (day_from, day_to),
+    ).fetchall()
+    by_product = con.execute(
+        "SELECT product_id, SUM(orders), SUM(qty), SUM(kg), SUM(revenue) FROM sales_product_daily "
+        "WHERE day BETWEEN ? AND ? GROUP BY product_id ORDER BY 5 DESC",
+        (day_from, day_to),
+    ).fetchall()
+    by_day = con.execute(
+        "SELECT day, SUM(orders), SUM(revenue) FROM sales_daily WHERE day BETWEEN ? AND ? GROUP BY day ORDER BY day",
+        (day_from, day_to),
+    ).fetchall()
+    return {
+        "from": day_from,
+        "to": day_to,
+        "orders": orders,
+        "revenue": revenue,
+        "by_lang": by_lang,
+        "by_product": by_product,
+        "by_day": by_day,
+    }
+
+
+if __name__ == "__main__":
+    from orders_db import OrderRepository
+
+    logging.basicConfig(level=logging.INFO)
+    path = sys.argv[1] if len(sys.argv) > 1 else "data/orders.db"
+    repo = OrderRepository(path)
+    t0 = time.perf_counter()
+    n = repo._writer.submit(lambda: rebuild(repo._writer_con())).result()
+    print(f"rollups rebuilt from {n} orders in {time.perf_counter() - t0:.2f}s ({path})")
+    repo.close()
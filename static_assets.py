@@ -0,0 +1,180 @@
+# static_assets.py — ASALBOY WebApp asset pipeline (content-hashed names, manifest, precompression)
+import os
+import re
+import json
+import hashlib
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+from webcache import CachedBody
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+# Text assets that get fingerprinted; index.html references are rewritten to the hashed names
+HASHED = {
+    "style.css": ("text/css", "utf-8"),
+    "script.js": ("application/javascript", "utf-8"),
+}
+
+
+def content_hash(data: bytes, n: int = 12) -> str:
+    return hashlib.sha256(data).hexdigest()[:n]
+
+
+class StaticAssets:
+    """
+    Startup build step for webapp/:
+      - style.css / script.js -> /static/<name>.<hash>.<ext>, served with immutable caching
+      - index.html is rewritten to point at the hashed names and served with no-cache + ETag
+      - every text asset is precompressed (gzip, br when available) once; the results and a
+        manifest.json are also written to `out_dir` for a CDN / reverse proxy
+      - webapp/img/*.jpg get a content version; URLs carrying ?v=<version> are immutable
+    """
+
+    def __init__(self, src_dir: str = "webapp", out_dir: str = "data/static"):
+        self.src_dir = src_dir
+        self.out_dir = out_dir
+        self.img_dir = os.path.join(src_dir, "img")
+        self.manifest: Dict[str, str] = {}
+        self.bodies: Dict[str, CachedBody] = {}  # hashed name -> body
+        self.legacy: Dict[str, CachedBody] = {}  # "style.css" -> body (unhashed URLs)
+        self.index: Optional[CachedBody] = None
+        self.img_versions: Dict[str, str] = {}  # "p1.jpg" -> version
+        self._img_stats: Dict[str, Tuple[int, int]] = {}  # "p1.jpg" -> (mtime_ns, size) when hashed
+
+    def _read(self, name: str) -> bytes:
+        with open(os.path.join(self.src_dir, name), "rb") as f:
+            return f.read()
+
+    def _write_file(self, name: str, data: bytes) -> None:
+        # Every worker process runs the same build: write next to the target and swap
+        path = os.path.join(self.out_dir, name)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _write_out(self, name: str, body: CachedBody) -> None:
+        os.makedirs(self.out_dir, exist_ok=True)
+        for enc, data in body.variants.items():
+            suffix = {"identity": "", "gzip": ".gz", "br": ".br"}[enc]
+            self._write_file(name + suffix, data)
+
+    def build(self) -> None:
+        manifest: Dict[str, str] = {}
+        bodies: Dict[str, CachedBody] = {}
+        legacy: Dict[str, CachedBody] = {}
+        for name, (ctype, charset) in HASHED.items():
+            data = self._read(name)
+            stem, ext = os.path.splitext(name)
+            hashed = f"{stem}.{content_hash(data)}{ext}"
+            manifest[name] = hashed
+            bodies[hashed] = CachedBody(data, ctype, IMMUTABLE, charset=charset)
+            legacy[name] = CachedBody(data, ctype, REVALIDATE, charset=charset)
+            self._write_out(hashed, bodies[hashed])
+
+        html = self._read("index.html").decode("utf-8")
+        for name, hashed in manifest.items():
+            # style.css?v=4 / ./script.js / /script.js?v=6 -> /static/<hashed>
+            html = re.sub(
+                r'(["\'])(?:\./|/)?%s(?:\?[^"\']*)?\1' % re.escape(name),
+                lambda m, h=hashed: f"{m.group(1)}/static/{h}{m.group(1)}",
+                html,
+            )
+        index = CachedBody(html.encode("utf-8"), "text/html", REVALIDATE, charset="utf-8")
+        self._write_out("index.html", index)
+
+        self.manifest, self.bodies, self.legacy, self.index = manifest, bodies, legacy, index
+        self.scan_images()
+        self._write_file(
+            "manifest.json",
+            json.dumps({"assets": manifest, "img": self.img_versions}, ensure_ascii=False, indent=2).encode("utf-8"),
+        )
+        logging.info("Static assets: %s", ", ".join(manifest.values()))
+
+    # ---- images ----
+    def _img_names(self) -> List[str]:
+        if not os.path.isdir(self.img_dir):
+            return []
+        return [name for name in os.listdir(self.img_dir) if name.endswith(".jpg")]
+
+    def scan_images(self) -> None:
+        self._img_stats = {}
+        self.img_versions = {name: self._img_hash(name) for name in self._img_names()}
+
+    def refresh_images(self) -> List[str]:
+        """
+        Re-version images that were replaced on disk since the last look (by another
+        worker process); only files whose mtime/size changed are hashed again.
+        Returns the pids whose version changed.
+        """
+        names = set(self._img_names())
+        changed = []
+        for name in names | set(self.img_versions):
+            if name not in names:
+                self.img_versions.pop(name, None)
+                self._img_stats.pop(name, None)
+                changed.append(name[:-4])
+                continue
+            try:
+                st = os.stat(os.path.join(self.img_dir, name))
+            except FileNotFoundError:
+                continue
+            if self._img_stats.get(name) == (st.st_mtime_ns, st.st_size):
+                continue
+            v = self._img_hash(name)
+            if self.img_versions.get(name) != v:
+                self.img_versions[name] = v
+                changed.append(name[:-4])
+        return changed
+
+    def _img_hash(self, name: str) -> str:
+        path = os.path.join(self.img_dir, name)
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            data = f.read()
+        self._img_stats[name] = (st.st_mtime_ns, st.st_size)
+        return content_hash(data, 8)
+
+    def bump_image(self, pid: str) -> Optional[str]:
+        """Re-version one product image after it was replaced on disk."""
+        name = f"{pid}.jpg"
+        if not os.path.exists(os.path.join(self.img_dir, name)):
+            self.img_versions.pop(name, None)
+            return None
+        self.img_versions[name] = self._img_hash(name)
+        return self.img_versions[name]
+
+    def image_url(self, pid: str) -> Optional[str]:
+        v = self.img_versions.get(f"{pid}.jpg")
+        return f"/webapp/img/{pid}.jpg?v={v}" if v else None
+
+    # ---- handlers ----
+    async def handle_static(self, request: web.Request) -> web.StreamResponse:
+        body = self.bodies.get(request.match_info["name"])
+        if body is None:
+            return web.Response(status=404)
+        return body.response(request)
+
+    async def handle_index(self, request: web.Request) -> web.StreamResponse:
+        return self.index.response(request)
+
+    def legacy_handler(self, name: str):
+        async def handler(request: web.Request) -> web.StreamResponse:
+            return self.legacy[name].response(request)
+        return handler
+
+    async def handle_img(self, request: web.Request) -> web.StreamResponse:
+        name = request.match_info["name"]
+        if "/" in name or "\\" in name or name.startswith("."):
+            return web.Response(status=404)
+        path = os.path.join(self.img_dir, name)
+        if not os.path.isfile(path):
+            return web.Response(status=404)
+        v = request.query.get("v")
+        # Versioned URL: the bytes behind it never change. Unversioned: always revalidate.
+        cache = IMMUTABLE if v and v == self.img_versions.get(name) else REVALIDATE
+        return web.FileResponse(path, headers={"Cache-Control": cache})
@@ -324,7 +324,8 @@ function cardHTML(p, idx) {
     // 3. Fallback to generic Honey placeholder
 
     // Note: handling "try local, failback to other" in HTML is done via onerror
-    const localImg = `/webapp/img/${p.id}.jpg?t=${new Date().getTime()}`; // Add timestamp to avoid caching uploaded images
+    // p.img carries ?v=<content hash>; it only changes when the photo is replaced, so it can be cached forever
+    const localImg = p.img || `/webapp/img/${p.id}.jpg`;
     const placeholder = PLACEHOLDERS[idx % PLACEHOLDERS.length];
 
     // Translation Logic
@@ -333,13 +334,21 @@ function cardHTML(p, idx) {
     const pDesc = (LANG === "ru" && p.info_short_ru) ? p.info_short_ru : (p.info_short || p.desc_uz || "");
     const sumText = LANG === "ru" ? "сум" : "so'm";
 
+    // Small WebP/JPEG thumbnails when the server generated them; the browser picks the width
+    const ss = p.srcset;
+    const webpSource = ss ? `<source type="image/webp" srcset="${ss.webp}" sizes="${ss.sizes}">` : "";
+    const jpgSrcset = ss ? `srcset="${ss.jpg}" sizes="${ss.sizes}"` : "";
+
     return `
   <div class="card" onclick="showInfo('${p.id}')">
-    <img src="${localImg}" 
+    <picture>
+    ${webpSource}
+    <img src="${localImg}" ${jpgSrcset}
          class="card-img" 
          alt="${pName}" 
          loading="lazy"
-         onerror="this.onerror=null; this.src='${placeholder}';">
+         onerror="this.onerror=null; this.removeAttribute('srcset'); this.parentNode.querySelector('source')?.remove(); this.src='${placeholder}';">
+    </picture>
     <div class="card-body">
       <div class="title">${pName || "Nomsiz"}</div>
       <div class="desc">${pDesc}</div>
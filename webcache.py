@@ -0,0 +1,102 @@
+# webcache.py — ASALBOY pre-serialized, precompressed HTTP bodies (ETag + 304)
+import gzip
+import hashlib
+from typing import Dict, Optional
+
+from aiohttp import web
+
+try:
+    import brotli  # optional: pip install brotli
+except ImportError:  # pragma: no cover - depends on environment
+    brotli = None
+
+
+def compress_variants(body: bytes, min_size: int = 256) -> Dict[str, bytes]:
+    """Return {"identity": body, "gzip": ..., "br": ...}; tiny bodies are not compressed."""
+    out = {"identity": body}
+    if len(body) < min_size:
+        return out
+    gz = gzip.compress(body, compresslevel=9, mtime=0)
+    if len(gz) < len(body):
+        out["gzip"] = gz
+    if brotli is not None:
+        br = brotli.compress(body, quality=11)
+        if len(br) < len(body):
+            out["br"] = br
+    return out
+
+
+def pick_encoding(accept: str, available) -> str:
+    """Choose the best encoding we have for an Accept-Encoding header (br > gzip > identity)."""
+    if not accept:
+        return "identity"
+    offered = {}
+    for part in accept.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        offered[name.strip().lower()] = q
+    for enc in ("br", "gzip"):
+        if enc in available and offered.get(enc, offered.get("*", 0.0)) > 0:
+            return enc
+    return "identity"
+
+
+_TAG_SUFFIX = {"gzip": "gz", "br": "br"}
+
+
+class CachedBody:
+    """
+    One serialized response body with its compressed variants. Each variant has its own
+    strong ETag (`etag` for identity, `etag` + "-gz"/"-br" inside the quotes for the
+    compressed ones): strong validators must differ when the bytes differ (RFC 9110).
+    """
+
+    __slots__ = ("variants", "etag", "etags", "content_type", "charset", "cache_control")
+
+    def __init__(
+        self,
+        body: bytes,
+        content_type: str,
+        cache_control: str,
+        etag: Optional[str] = None,
+        charset: Optional[str] = None,
+    ):
+        self.variants = compress_variants(body)
+        self.etag = etag or '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+        self.etags = {enc: self.etag if enc == "identity" else f'{self.etag[:-1]}-{_TAG_SUFFIX[enc]}"'
+                      for enc in self.variants}
+        self.content_type = content_type
+        self.charset = charset
+        self.cache_control = cache_control
+
+    def not_modified(self, request: web.Request) -> bool:
+        inm = request.headers.get("If-None-Match")
+        if not inm:
+            return False
+        if inm.strip() == "*":
+            return True
+        # Accept strong and weak forms of any variant's tag: the content is the same
+        tags = {tag.strip().removeprefix("W/") for tag in inm.split(",")}
+        return not tags.isdisjoint(self.etags.values())
+
+    def response(self, request: web.Request) -> web.Response:
+        enc = pick_encoding(request.headers.get("Accept-Encoding", ""), self.variants)
+        headers = {
+            "ETag": self.etags[enc],
+            "Cache-Control": self.cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        if self.not_modified(request):
+            return web.Response(status=304, headers=headers)
+        if enc != "identity":
+            headers["Content-Encoding"] = enc
+        return web.Response(
+            body=self.variants[enc], headers=headers,
+            content_type=self.content_type, charset=self.charset,
+        )
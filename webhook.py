@@ -0,0 +1,483 @@
+# webhook.py — ASALBOY fast-ack webhook: secret check, update_id dedup, bounded worker pool with per-chat ordering
+import os
+import re
+import hmac
+import time
+import asyncio
+import logging
+import sqlite3
+import json
+import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Hashable, List, Optional, Tuple
+
+from aiogram import types
+
+from orders_db import connect
+
+try:
+    import orjson  # optional, only used when the cheap regex peek fails
+except ImportError:  # pragma: no cover - depends on environment
+    orjson = None
+
+try:
+    import fcntl  # POSIX only; ChatLock is process-local without it
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+
+# Telegram always serializes update_id first; lets us dedup before parsing the body
+_UPDATE_ID_RE = re.compile(rb'^\s*\{\s*"update_id"\s*:\s*(\d+)')
+
+
+def peek_update_id(body: bytes) -> Optional[int]:
+    m = _UPDATE_ID_RE.match(body[:64])
+    return int(m.group(1)) if m else None
+
+
+# ...and the update type key right after it: {"update_id":1,"message":{...}}
+_UPDATE_TYPE_RE = re.compile(rb'^\s*\{\s*"update_id"\s*:\s*\d+\s*,\s*"([a-z_]+)"')
+
+
+def peek_update_type(body: bytes) -> Optional[str]:
+    m = _UPDATE_TYPE_RE.match(body[:96])
+    if m:
+        return m.group(1).decode()
+    try:
+        data = orjson.loads(body) if orjson is not None else json.loads(body)
+    except ValueError:
+        return None
+    return next((k for k in data if k != "update_id"), None) if isinstance(data, dict) else None
+
+
+def decode_update(body: bytes, bot, allowed: Optional[frozenset] = None) -> Optional[types.Update]:
+    """
+    Raw webhook body -> Update mounted to `bot`, in one pass.
+
+    pydantic-core parses and validates straight from bytes, and passing the bot in the
+    validation context means dp.feed_update does not have to re-mount the update (which
+    costs a model_dump + a second model_validate). Update types with no handlers
+    (`allowed` given and type not in it) return None without being validated.
+    """
+    if allowed is not None:
+        kind = peek_update_type(body)
+        if kind is not None and kind not in allowed:
+            return None
+    return types.Update.model_validate_json(body, context={"bot": bot})
+
+
+def secret_ok(header: Optional[str], secret: str) -> bool:
+    """Constant-time check of X-Telegram-Bot-Api-Secret-Token (no secret configured = allow)."""
+    if not secret:
+        return True
+    return header is not None and hmac.compare_digest(header.encode(), secret.encode())
+
+
+class UpdateDeduplicator:
+    """
+    Remembers update_ids seen in the last `window` seconds (at most `max_items`).
+    With `path`, new ids are flushed to SQLite every `flush_every` seconds and loaded
+    back on start, so redeliveries right after a restart are still dropped.
+
+    With `shared=True` (several worker processes on one `path`) claim()/release() write
+    to SQLite before returning: Telegram may redeliver an update to any worker, and only
+    the one whose INSERT wins handles it.
+    """
+
+    def __init__(self, window: float = 3600.0, max_items: int = 100_000, path: Optional[str] = None,
+                 flush_every: float = 1.0, shared: bool = False, prune_every: float = 60.0):
+        self.window = window
+        self.max_items = max_items
+        self.path = path
+        self.flush_every = flush_every
+        self.shared = shared and bool(path)
+        self.prune_every = prune_every
+        self._seen: "OrderedDict[int, float]" = OrderedDict()
+        self._unsaved: List[Tuple[int, float]] = []
+        self._deleted: List[int] = []
+        self._task: Optional[asyncio.Task] = None
+        self._con: Optional[sqlite3.Connection] = None
+        self._exec = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dedup-db") if self.shared else None
+        self.stats = {"duplicates": 0, "forged": 0}
+
+    def check_and_add(self, update_id: int) -> bool:
+        """True if update_id is new (and records it), False for a duplicate."""
+        now = time.time()
+        if update_id in self._seen:
+            self.stats["duplicates"] += 1
+            return False
+        self._seen[update_id] = now
+        if self.path and not self.shared:
+            self._unsaved.append((update_id, now))
+        # Entries are in arrival order, so expiry only ever looks at the front
+        cutoff = now - self.window
+        while self._seen and (len(self._seen) > self.max_items or next(iter(self._seen.values())) < cutoff):
+            self._seen.popitem(last=False)
+        return True
+
+    def forget(self, update_id: int) -> None:
+        """Un-see an update we could not accept, so Telegram's redelivery is processed."""
+        self._seen.pop(update_id, None)
+        self._unsaved = [(u, t) for u, t in self._unsaved if u != update_id]
+        if self.path and not self.shared:
+            self._deleted.append(update_id)
+
+    async def claim(self, update_id: int) -> bool:
+        """check_and_add() that also holds across worker processes in shared mode."""
+        if not self.shared:
+            return self.check_and_add(update_id)
+        if update_id in self._seen:
+            self.stats["duplicates"] += 1
+            return False
+        new = await self._run_shared(self._claim_sync, update_id, time.time())
+        self.check_and_add(update_id)  # later redeliveries to this worker stay local
+        if not new:
+            self.stats["duplicates"] += 1
+        return new
+
+    async def release(self, update_id: int) -> None:
+        """forget() that also holds across worker processes in shared mode."""
+        self.forget(update_id)
+        if self.shared:
+            await self._run_shared(self._release_sync, update_id)
+
+    # ---- persistence ----
+    def _db(self) -> sqlite3.Connection:
+        d = os.path.dirname(self.path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        con = connect(self.path)
+        con.execute("CREATE TABLE IF NOT EXISTS seen_updates(update_id INTEGER PRIMARY KEY, seen_at REAL NOT NULL)")
+        return con
+
+    # shared mode: one connection on a dedicated thread, autocommit per statement
+    async def _run_shared(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._exec, lambda: fn(self._shared_db(), *args))
+
+    def _shared_db(self) -> sqlite3.Connection:
+        if self._con is None:
+            self._con = self._db()
+        return self._con
+
+    def _claim_sync(self, con: sqlite3.Connection, update_id: int, now: float) -> bool:
+        # Inserted, or taken over from an expired row not pruned yet
+        cur = con.execute(
+            "INSERT INTO seen_updates(update_id, seen_at) VALUES (?,?) "
+            "ON CONFLICT(update_id) DO UPDATE SET seen_at=excluded.seen_at WHERE seen_at < ?",
+            (update_id, now, now - self.window),
+        )
+        return cur.rowcount == 1
+
+    @staticmethod
+    def _release_sync(con: sqlite3.Connection, update_id: int) -> None:
+        con.execute("DELETE FROM seen_updates WHERE update_id=?", (update_id,))
+
+    def _prune_sync(self, con: sqlite3.Connection) -> None:
+        con.execute("DELETE FROM seen_updates WHERE seen_at < ?", (time.time() - self.window,))
+
+    def _load_sync(self) -> None:
+        con = self._db()
+        try:
+            rows = con.execute(
+                "SELECT update_id, seen_at FROM seen_updates WHERE seen_at >= ? ORDER BY seen_at LIMIT ?",
+                (time.time() - self.window, self.max_items),
+            ).fetchall()
+        finally:
+            con.close()
+        for uid, ts in rows:
+            self._seen[uid] = ts
+
+    def _flush_sync(self, rows, deleted) -> None:
+        con = self._db()
+        try:
+            con.execute("BEGIN IMMEDIATE")
+            con.executemany("INSERT OR REPLACE INTO seen_updates(update_id, seen_at) VALUES (?,?)", rows)
+            con.executemany("DELETE FROM seen_updates WHERE update_id=?", [(u,) for u in deleted])
+            con.execute("DELETE FROM seen_updates WHERE seen_at < ?", (time.time() - self.window,))
+            con.execute("COMMIT")
+        finally:
+            con.close()
+
+    async def flush(self) -> None:
+        if not self.path or not (self._unsaved or self._deleted):
+            return
+        rows, self._unsaved = self._unsaved, []
+        deleted, self._deleted = self._deleted, []
+        try:
+            await asyncio.to_thread(self._flush_sync, rows, deleted)
+        except Exception:
+            logging.exception("seen_updates flush failed")
+
+    async def start(self) -> None:
+        if not self.path:
+            return
+        await asyncio.to_thread(self._load_sync)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            if not self.shared:
+                await asyncio.sleep(self.flush_every)
+                await self.flush()
+                continue
+            # claims are already on disk; only expired rows are left to delete
+            await asyncio.sleep(self.prune_every)
+            try:
+                await self._run_shared(self._prune_sync)
+            except Exception:
+                logging.exception("seen_updates prune failed")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self._exec is not None:
+            if self._con is not None:
+                await self._run_shared(lambda con: con.close())
+                self._con = None
+            self._exec.shutdown(wait=True)
+
+
+def update_chat_key(update: types.Update) -> Optional[Hashable]:
+    """Chat (or user) an update belongs to; updates with the same key are handled in order."""
+    event = update.event
+    chat = getattr(event, "chat", None)
+    if chat is None:
+        msg = getattr(event, "message", None)  # callback_query
+        chat = getattr(msg, "chat", None)
+    if chat is not None:
+        return chat.id
+    user = getattr(event, "from_user", None)
+    return ("user", user.id) if user is not None else None
+
+
+class ChatLock:
+    """
+    Handles one update per chat at a time across every worker process (SHARED_STATE), so
+    FSM read-modify-writes such as adding to the cart never interleave between workers.
+
+    The cross-process part is a 1-byte POSIX record lock (lockf) in `path` at an offset
+    derived from the chat key with crc32, so every worker picks the same one; two chats
+    sharing an offset are merely serialized. Record locks belong to the process, so an
+    asyncio.Lock per offset orders this worker's own tasks first. The kernel drops the locks of a worker that dies, so no chat stays stuck.
+    Without `path` (single process) or fcntl only the in-process part is used.
+    """
+
+    SLOTS = 1 << 20
+
+    def __init__(self, path: Optional[str] = None, poll: float = 0.005, timeout: float = 30.0):
+        self.path = path if fcntl is not None else None
+        self.poll = poll
+        self.timeout = timeout
+        self._fd: Optional[int] = None
+        self._local: Dict[int, List] = {}  # slot -> [asyncio.Lock, users]
+        self.stats = {"contended": 0, "timeouts": 0}
+
+    def _file(self) -> int:
+        if self._fd is None:
+            d = os.path.dirname(self.path)
+            if d:
+                os.makedirs(d, exist_ok=True)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        return self._fd
+
+    async def _lock_file(self, slot: int) -> bool:
+        fd = self._file()
+        deadline = time.monotonic() + self.timeout
+        contended = False
+        while True:
+            try:
+                fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, slot, os.SEEK_SET)
+                return True
+            except OSError:
+                pass
+            if not contended:
+                contended = True
+                self.stats["contended"] += 1
+            if time.monotonic() >= deadline:
+                # A worker stuck this long must not stall the chat forever
+                self.stats["timeouts"] += 1
+                logging.warning("Chat lock band (slot %d) — kutmasdan davom etiladi", slot)
+                return False
+            await asyncio.sleep(self.poll)
+
+    @asynccontextmanager
+    async def hold(self, update: types.Update) -> AsyncIterator[None]:
+        key = update_chat_key(update)
+        if key is None:
+            yield
+            return
+        # crc32, not hash(): str/tuple hashes are salted per process (PYTHONHASHSEED)
+        slot = zlib.crc32(repr(key).encode()) % self.SLOTS
+        entry = self._local.get(slot)
+        if entry is None:
+            entry = self._local[slot] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                locked = self.path is not None and await self._lock_file(slot)
+                try:
+                    yield
+                finally:
+                    if locked:
+                        fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, slot, os.SEEK_SET)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._local[slot]
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class LatencyStats:
+    """count/sum/max plus a window of recent samples for percentiles."""
+
+    __slots__ = ("count", "total", "max", "recent")
+
+    def __init__(self, window: int = 2048):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent: Deque[float] = deque(maxlen=window)
+
+    def add(self, v: float) -> None:
+        self.count += 1
+        self.total += v
+        if v > self.max:
+            self.max = v
+        self.recent.append(v)
+
+    def snapshot(self) -> Dict[str, float]:
+        xs = sorted(self.recent)
+
+        def pct(p):
+            return xs[min(len(xs) - 1, int(len(xs) * p))] if xs else 0.0
+
+        return {
+            "count": self.count,
+            "avg_ms": (self.total / self.count * 1000) if self.count else 0.0,
+            "p50_ms": pct(0.50) * 1000,
+            "p99_ms": pct(0.99) * 1000,
+            "max_ms": self.max * 1000,
+        }
+
+
+class UpdateWorkerPool:
+    """
+    The webhook handler only parses and enqueues; `workers` tasks run dp.feed_update.
+
+    Each chat has its own FIFO. A chat is on the ready queue at most once, so two
+    workers never handle the same chat at the same time (per-chat order is kept)
+    while different chats run in parallel. At most `limit` updates may be pending;
+    beyond that `submit` waits up to `put_timeout` and then refuses, and the webhook
+    answers 503 so Telegram redelivers later.
+    """
+
+    def __init__(self, dp, bot, workers: int = 16, limit: int = 1000, put_timeout: float = 2.0,
+                 chat_lock: Optional[ChatLock] = None):
+        self.dp = dp
+        self.bot = bot
+        self.chat_lock = chat_lock or ChatLock()
+        self.workers = workers
+        self.limit = limit
+        self.put_timeout = put_timeout
+        self._chats: Dict[Any, Deque] = {}
+        self._ready: Optional[asyncio.Queue] = None
+        self._space: Optional[asyncio.Condition] = None
+        self._tasks = []
+        self._pending = 0
+        self.wait_stats = LatencyStats()
+        self.handler_stats = LatencyStats()
+        self.counters = {"accepted": 0, "rejected": 0, "errors": 0}
+
+    @property
+    def depth(self) -> int:
+        return self._pending
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._ready = asyncio.Queue()
+        self._space = asyncio.Condition()
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self, drain_timeout: float = 10.0) -> None:
+        deadline = time.monotonic() + drain_timeout
+        while self._pending and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    async def submit(self, update: types.Update) -> bool:
+        if self._pending >= self.limit:
+            try:
+                async with self._space:
+                    await asyncio.wait_for(
+                        self._space.wait_for(lambda: self._pending < self.limit), self.put_timeout
+                    )
+            except asyncio.TimeoutError:
+                self.counters["rejected"] += 1
+                return False
+        key = update_chat_key(update)
+        if key is None:
+            key = ("update", update.update_id)
+        self._pending += 1
+        self.counters["accepted"] += 1
+        q = self._chats.get(key)
+        if q is None:
+            # Chat was idle: create its FIFO and make it runnable
+            self._chats[key] = deque([(update, time.monotonic())])
+            self._ready.put_nowait(key)
+        else:
+            q.append((update, time.monotonic()))
+        return True
+
+    async def _worker(self, n: int) -> None:
+        while True:
+            key = await self._ready.get()
+            q = self._chats[key]
+            update, enq_at = q.popleft()
+            started = time.monotonic()
+            self.wait_stats.add(started - enq_at)
+            try:
+                async with self.chat_lock.hold(update):
+                    await self.dp.feed_update(self.bot, update)
+            except Exception:
+                self.counters["errors"] += 1
+                logging.exception("Update %s handler failed", update.update_id)
+            finally:
+                self.handler_stats.add(time.monotonic() - started)
+                self._pending -= 1
+                if q:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._chats[key]
+                async with self._space:
+                    self._space.notify(1)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "depth": self._pending,
+            "active_chats": len(self._chats),
+            **self.counters,
+            "queue_wait": self.wait_stats.snapshot(),
+            "handler": self.handler_stats.snapshot(),
+        }
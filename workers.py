@@ -0,0 +1,130 @@
+# workers.py — ASALBOY multi-process mode: pre-fork supervisor (SO_REUSEPORT) + leader election
+import os
+import sys
+import time
+import signal
+import socket
+import asyncio
+import logging
+import subprocess
+from typing import Awaitable, Callable, Dict, List, Optional
+
+try:
+    import fcntl  # POSIX only
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+
+def reuse_port_supported() -> bool:
+    if fcntl is None or not hasattr(socket, "SO_REUSEPORT"):
+        return False
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    except OSError:
+        return False
+    finally:
+        s.close()
+    return True
+
+
+def worker_count(requested: int) -> int:
+    """WORKERS as configured, or 1 where the port cannot be shared (Windows, old kernels)."""
+    if requested > 1 and not reuse_port_supported():
+        logging.warning("SO_REUSEPORT yo‘q — WORKERS=%d o‘rniga bitta jarayon ishlaydi", requested)
+        return 1
+    return max(1, requested)
+
+
+class LeaderLock:
+    """
+    Exactly one worker holds an exclusive lock on `path`; that worker registers the
+    webhook and runs the background jobs. The kernel drops the lock when its process
+    exits (crash and kill -9 included), and the other workers keep retrying every
+    `retry` seconds, so one of them takes over. A POSIX record lock (lockf), not flock:
+    it is not inherited by forked children such as the thumbnail process pool, which
+    would otherwise keep a dead leader's lock alive.
+    """
+
+    def __init__(self, path: str = "data/leader.lock", retry: float = 5.0):
+        self.path = path
+        self.retry = retry
+        self.held = False
+        self._fd: Optional[int] = None
+
+    def try_acquire(self) -> bool:
+        if self.held:
+            return True
+        if fcntl is None:
+            # No fcntl here, and no multi-worker mode either: the only process leads
+            self.held = True
+            return True
+        d = os.path.dirname(self.path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{os.getpid()}\n".encode("ascii"))
+        self._fd = fd
+        self.held = True
+        return True
+
+    async def campaign(self, on_elected: Callable[[], Awaitable[None]]) -> None:
+        """Wait until this worker gets the lock, then run on_elected() once."""
+        while not self.try_acquire():
+            await asyncio.sleep(self.retry)
+        await on_elected()
+
+    def release(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)  # closing the descriptor releases the lock
+            self._fd = None
+        self.held = False
+
+
+def supervise(n: int, argv: Optional[List[str]] = None, restart_delay: float = 1.0) -> int:
+    """
+    Pre-fork master: run `n` copies of this program with WORKER_ID=0..n-1 (each one binds
+    the port itself with SO_REUSEPORT and the kernel spreads connections between them),
+    restart any that die, and stop them all on SIGINT/SIGTERM.
+    """
+    argv = argv or [sys.executable] + sys.argv
+    procs: Dict[int, subprocess.Popen] = {}
+    stopping = False
+
+    def spawn(i: int) -> subprocess.Popen:
+        return subprocess.Popen(argv, env=dict(os.environ, WORKER_ID=str(i), WORKERS=str(n)))
+
+    def stop(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+        for p in procs.values():
+            if p.poll() is None:
+                p.send_signal(signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for i in range(n):
+        procs[i] = spawn(i)
+    logging.info("Supervisor %d: %d ta worker ishga tushdi", os.getpid(), n)
+    while procs:
+        time.sleep(0.5)
+        for i, p in list(procs.items()):
+            code = p.poll()
+            if code is None:
+                continue
+            if stopping:
+                del procs[i]
+                continue
+            logging.warning("Worker %d to‘xtadi (kod %s), qayta ishga tushirilmoqda", i, code)
+            time.sleep(restart_delay)
+            if stopping:
+                del procs[i]
+                continue
+            procs[i] = spawn(i)
+    return 0